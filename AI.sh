@@ -7,6 +7,11 @@ VENV_NAME="venv_audio_chatter_pyaudio"
 VENV_PATH="${APP_DIR}/${VENV_NAME}"
 PYTHON_MAIN_SCRIPT_NAME="main.py" 
 PYTHON_MAIN_SCRIPT_PATH="${APP_DIR}/${PYTHON_MAIN_SCRIPT_NAME}"
+# Thin launcher: attaches to the resident talk_daemon.py (starting it on first use) so relaunching
+# takes tens of milliseconds. It falls back to running main.py itself if the daemon can't be used.
+# Set USE_DAEMON=0 to always start main.py from scratch.
+PYTHON_LAUNCHER_SCRIPT_NAME="talk_launch.py"
+USE_DAEMON=1
 
 # --- Debugging Setup: Redirect all output to a log file ---
 # Useful if the script exits immediately without showing output on screen.
@@ -54,7 +59,11 @@ echo ""
         exit 1 
     }
     # echo "Subshell: Launching: python $PYTHON_MAIN_SCRIPT_NAME" # Less verbose
-    python "$PYTHON_MAIN_SCRIPT_NAME"
+    if [ "$USE_DAEMON" = "1" ] && [ -f "$PYTHON_LAUNCHER_SCRIPT_NAME" ]; then
+        python "$PYTHON_LAUNCHER_SCRIPT_NAME"
+    else
+        python "$PYTHON_MAIN_SCRIPT_NAME"
+    fi
     # echo "Subshell: Python main script finished." # Less verbose
 )
 # script_exit_status=$? # Can be logged if needed
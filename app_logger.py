@@ -0,0 +1,234 @@
+# app_logger.py
+"""
+Asynchronous, rate-limited logging for the application.
+
+Every module gets a standard `logging.Logger` via get_logger(). The calling
+thread only renders the message (and any traceback) into the record, as
+logging.handlers.QueueHandler does, and hands it to a bounded queue; a
+single writer thread formats and writes it. Repeated warnings and errors
+(same logger, level and message text; call sites use f-strings, so that is
+the rendered line) are rate-limited: the first LOG_RATE_LIMIT_BURST
+(default 1) are written, the rest within the window are counted and
+summarised in one line, so an overflow storm in the capture loop produces
+the first line plus one line with a count. Messages below
+LOG_RATE_LIMIT_LEVEL (INFO state changes, "Controls:", ...) are never
+rate-limited, however often the same line repeats.
+"""
+import logging
+import queue
+import sys
+import threading
+import time
+import atexit
+
+import config
+
+LOG_FORMAT = "%(asctime)s.%(msecs)03d %(levelname)-7s [%(threadName)s] %(name)s: %(message)s"
+LOG_DATE_FORMAT = "%H:%M:%S"
+
+_ROOT_LOGGER_NAME = "talk"
+_STOP_SENTINEL = None
+
+_log_queue = queue.Queue(maxsize=config.LOG_QUEUE_MAX_RECORDS)
+_writer_thread = None
+_dropped_records = 0 # Records dropped because the queue was full (never block the caller)
+_dropped_lock = threading.Lock()
+_sinks = [] # Extra destinations for formatted lines (e.g. an attached talk_launch.py client)
+
+
+_exception_formatter = logging.Formatter()
+
+
+class _NonBlockingQueueHandler(logging.Handler):
+    """Puts records on the queue with their message already rendered. No I/O, never blocks."""
+
+    def prepare(self, record):
+        """
+        Renders msg % args and the traceback now, so mutable args logged by the caller are not
+        rendered later in the writer thread with changed values.
+        """
+        record.rate_limit_msg = record.msg # The format string, before rendering (rate-limit key)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None # Tracebacks hold frames; exc_text has everything the writer needs
+        return record
+
+    def emit(self, record):
+        global _dropped_records
+        try:
+            record = self.prepare(record)
+        except Exception:
+            return # A record whose arguments don't match its format string
+        try:
+            _log_queue.put_nowait(record)
+        except queue.Full:
+            with _dropped_lock:
+                _dropped_records += 1
+
+    def handleError(self, record):
+        pass # Never let logging failures reach the capture/input threads
+
+
+def _rate_limit_key(record):
+    return (record.name, record.levelno, getattr(record, 'rate_limit_msg', record.msg))
+
+
+def _writer_worker(stream, window_s, burst, flush_interval_s, min_level=logging.WARNING):
+    """Single writer: formats records, applies per-message rate limiting and writes them out."""
+    global _dropped_records
+    formatter = logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT)
+    # key -> [window_start_monotonic, written_count, suppressed_count, last_suppressed_record]
+    windows = {}
+    last_flush = time.monotonic()
+
+    def write_line(line):
+        try:
+            stream.write(line + "\n")
+        except Exception:
+            pass
+        for sink in list(_sinks):
+            try:
+                sink(line)
+            except Exception:
+                pass
+
+    def flush_expired(now, force=False):
+        for key in list(windows):
+            window_start, _, suppressed, last_record = windows[key]
+            if force or now - window_start >= window_s:
+                if suppressed:
+                    last_record.msg = f"{last_record.getMessage()} (repeated {suppressed} more times in {now - window_start:.1f}s)"
+                    last_record.args = None
+                    write_line(formatter.format(last_record))
+                del windows[key]
+        try: stream.flush()
+        except Exception: pass
+
+    while True:
+        try:
+            record = _log_queue.get(timeout=flush_interval_s)
+        except queue.Empty:
+            record = False # Timed out: only flush expired windows
+        now = time.monotonic()
+
+        if record is _STOP_SENTINEL:
+            flush_expired(now, force=True)
+            break
+        if isinstance(record, threading.Event): # Marker from wait_until_written()
+            try: stream.flush()
+            except Exception: pass
+            record.set()
+            continue
+
+        if record is not False and record.levelno < min_level:
+            try:
+                write_line(formatter.format(record))
+            except Exception:
+                pass
+        elif record is not False:
+            key = _rate_limit_key(record)
+            window = windows.get(key)
+            if window is not None and now - window[0] < window_s and window[1] >= burst:
+                window[2] += 1
+                window[3] = record
+            else:
+                if window is not None and now - window[0] >= window_s:
+                    flush_expired(now) # Summarise the expired window before starting a new one
+                    window = None
+                if window is None:
+                    window = windows[key] = [now, 0, 0, None]
+                window[1] += 1
+                try:
+                    write_line(formatter.format(record))
+                except Exception:
+                    pass
+
+        if record is False or now - last_flush >= flush_interval_s:
+            with _dropped_lock:
+                dropped, _dropped_records = _dropped_records, 0
+            if dropped:
+                write_line(formatter.format(logging.makeLogRecord({
+                    "name": f"{_ROOT_LOGGER_NAME}.app_logger", "levelno": logging.WARNING, "levelname": "WARNING",
+                    "threadName": threading.current_thread().name,
+                    "msg": f"Dropped {dropped} log records (queue full)"})))
+            flush_expired(now)
+            last_flush = now
+
+
+def _level_number(level_name):
+    return getattr(logging, str(level_name).upper(), logging.INFO)
+
+
+def start_logging(stream=None):
+    """Installs the queue handler on the application's root logger and starts the writer thread."""
+    global _writer_thread
+    if _writer_thread and _writer_thread.is_alive():
+        return
+    root = logging.getLogger(_ROOT_LOGGER_NAME)
+    root.setLevel(_level_number(config.LOG_LEVEL))
+    root.propagate = False
+    if not any(isinstance(h, _NonBlockingQueueHandler) for h in root.handlers):
+        root.addHandler(_NonBlockingQueueHandler())
+    _writer_thread = threading.Thread(target=_writer_worker,
+                                      args=(stream or sys.stdout,
+                                            config.LOG_RATE_LIMIT_WINDOW_S,
+                                            config.LOG_RATE_LIMIT_BURST,
+                                            config.LOG_FLUSH_INTERVAL_S,
+                                            _level_number(config.LOG_RATE_LIMIT_LEVEL)),
+                                      name="LogWriter")
+    _writer_thread.daemon = True
+    _writer_thread.start()
+
+
+def stop_logging(timeout=2):
+    """Flushes pending records (including rate-limit summaries) and stops the writer thread."""
+    global _writer_thread
+    if not (_writer_thread and _writer_thread.is_alive()):
+        return
+    try:
+        _log_queue.put(_STOP_SENTINEL, timeout=timeout)
+    except queue.Full:
+        pass
+    _writer_thread.join(timeout=timeout)
+    _writer_thread = None
+
+
+def wait_until_written(timeout=1):
+    """Blocks until every record logged before this call has been written (or timeout expires)."""
+    if not (_writer_thread and _writer_thread.is_alive()):
+        return
+    marker = threading.Event()
+    try:
+        _log_queue.put(marker, timeout=timeout)
+    except queue.Full:
+        return
+    marker.wait(timeout)
+
+
+def set_level(level_name):
+    """Changes the application's log level at runtime (e.g. "WARNING" for benchmarks)."""
+    logging.getLogger(_ROOT_LOGGER_NAME).setLevel(_level_number(level_name))
+
+
+def add_sink(sink):
+    """Also passes every formatted line to sink(line), called from the writer thread. Must not block for long."""
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    try:
+        _sinks.remove(sink)
+    except ValueError:
+        pass
+
+
+def get_logger(module_name):
+    """Returns a logger under the application's root logger, e.g. get_logger(__name__)."""
+    return logging.getLogger(f"{_ROOT_LOGGER_NAME}.{module_name}")
+
+
+start_logging() # Start when module is loaded, so every importer logs through the queue
+atexit.register(stop_logging)
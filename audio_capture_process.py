@@ -0,0 +1,364 @@
+# audio_capture_process.py
+"""
+Optional capture backend that records in a dedicated process.
+
+The child process owns the PyAudio instance and stream, can be pinned to a
+CPU core and given real-time scheduling priority, and writes PCM into a
+multiprocessing.shared_memory ring. The main process never touches the
+audio device: it signals start/stop and reads the recorded bytes straight
+out of the ring through memoryviews, so there is no copy and no GIL
+contention between stream.read() and uploads/playback.
+
+The child runs this file as a script in a fresh interpreter, so it imports
+only config, app_logger and pyaudio. (multiprocessing's spawn and forkserver
+methods would re-import the parent's __main__, i.e. the whole application.)
+Commands and results travel over a socketpair wrapped in a
+multiprocessing.connection.Connection.
+
+Ring layout: a fixed header (see _RING_HEADER) followed by
+CAPTURE_RING_SECONDS worth of PCM. The header holds the number of bytes
+written for the current recording (monotonic, the write position is
+bytes_written % capacity) and the overflow count.
+"""
+import os
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Connection
+
+import pyaudio # Importing does not initialize PortAudio; only the child creates a PyAudio instance
+
+import config
+import app_logger
+
+log = app_logger.get_logger(__name__)
+
+# bytes_written (Q), overflow_count (Q)
+_RING_HEADER = struct.Struct("<QQ")
+
+# Commands besides a recording tuple and None (shutdown). "stop" ends the current recording,
+# "warm" is acknowledged with a ("warm", init_ms, error_str) result, "release" has no result.
+_COMMAND_STOP = "stop"
+_COMMAND_RELEASE_AUDIO = "release"
+_COMMAND_WARM_AUDIO = "warm"
+
+# Results sent by the child: (kind, *values)
+_RESULT_RECORDING = "recording" # bytes_written, overflow_count, error_str
+_RESULT_WARM = "warm"           # init_ms, error_str
+
+# --- Module-level state (main process side) ---
+_capture_process = None  # subprocess.Popen running this file
+_shared_ring = None
+_ring_capacity = 0
+_connection = None
+_receive_lock = threading.Lock() # The recorder thread and a resume thread may both wait for results
+_send_lock = threading.Lock()
+_pending_results = {_RESULT_RECORDING: [], _RESULT_WARM: []} # Received while waiting for the other kind
+_last_result = None # (bytes_written, overflow_count, error_str) of the last recording
+
+
+def _configure_process_scheduling(cpu_core, rt_priority):
+    """Pins the calling process to a core and optionally switches it to SCHED_FIFO."""
+    if cpu_core is not None and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {cpu_core})
+            log.info(f"Capture process pinned to CPU core {cpu_core}.")
+        except OSError as e:
+            log.warning(f"Could not pin capture process to CPU core {cpu_core}: {e}")
+    if rt_priority is not None and hasattr(os, "sched_setscheduler"):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(rt_priority))
+            log.info(f"Capture process running with SCHED_FIFO priority {rt_priority}.")
+        except (OSError, PermissionError) as e:
+            # Needs CAP_SYS_NICE or an rtprio entry in /etc/security/limits.conf
+            log.warning(f"Could not set real-time priority {rt_priority} for capture process: {e}")
+
+
+def _open_pyaudio_quietly(pyaudio_module):
+    """Creates a PyAudio instance with ALSA's stderr chatter suppressed."""
+    original_stderr_fd = sys.stderr.fileno()
+    saved_stderr_fd = os.dup(original_stderr_fd)
+    devnull_fd = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull_fd, original_stderr_fd)
+    try:
+        return pyaudio_module.PyAudio()
+    finally:
+        os.dup2(saved_stderr_fd, original_stderr_fd)
+        os.close(saved_stderr_fd)
+        os.close(devnull_fd)
+
+
+def _capture_process_main(shm_name, capacity, connection, cpu_core, rt_priority):
+    """Entry point of the capture process. Serves one recording per recording command."""
+    _configure_process_scheduling(cpu_core, rt_priority)
+    ring = shared_memory.SharedMemory(name=shm_name)
+    # Attaching registered the ring with this process's own resource tracker, which would unlink
+    # it when this process exits; the main process owns it
+    resource_tracker.unregister(ring._name, "shared_memory")
+    header_view = ring.buf[:_RING_HEADER.size]
+    data_view = ring.buf[_RING_HEADER.size:_RING_HEADER.size + capacity]
+    pa_instance = None
+
+    try:
+        while True:
+            try:
+                command = connection.recv()
+            except EOFError: # The main process went away
+                break
+            if command is None: # Shutdown
+                break
+            if command == _COMMAND_STOP: # Late stop for a recording that already ended
+                continue
+            if command == _COMMAND_RELEASE_AUDIO: # Idle: let go of PortAudio/ALSA until the next warm-up
+                if pa_instance:
+                    try: pa_instance.terminate()
+                    except Exception: pass
+                    pa_instance = None
+                continue
+            if command == _COMMAND_WARM_AUDIO:
+                started = time.monotonic()
+                error_str = None
+                if pa_instance is None:
+                    try:
+                        pa_instance = _open_pyaudio_quietly(pyaudio)
+                        log.info(f"Capture process initialized PyAudio in {(time.monotonic() - started) * 1000:.0f} ms.")
+                    except Exception as e:
+                        error_str = f"{type(e).__name__}: {e}"
+                        log.error(f"Capture process could not initialize PyAudio: {error_str}")
+                connection.send((_RESULT_WARM, (time.monotonic() - started) * 1000, error_str))
+                continue
+            samplerate, channels, frames_per_buffer, audio_format, device_index = command
+            bytes_written = 0
+            overflow_count = 0
+            error_str = None
+            stream = None
+            _RING_HEADER.pack_into(header_view, 0, 0, 0)
+            try:
+                if pa_instance is None: # Kept resident between recordings
+                    pa_instance = _open_pyaudio_quietly(pyaudio)
+                stream = pa_instance.open(format=audio_format,
+                                          channels=channels,
+                                          rate=samplerate,
+                                          input=True,
+                                          input_device_index=device_index,
+                                          frames_per_buffer=frames_per_buffer)
+                log.info("Capture process stream opened. Recording audio...")
+                while not connection.poll(): # Any command during a recording is the stop signal
+                    try:
+                        data_bytes = stream.read(frames_per_buffer, exception_on_overflow=False)
+                    except IOError as e:
+                        if e.errno == getattr(pyaudio, "paInputOverflowed", -9981) or e.errno == -9988:
+                            overflow_count += 1
+                            log.warning("Input overflowed during recording (capture process)!")
+                        else:
+                            log.warning(f"IOError during stream.read() in capture process: {e}")
+                        continue
+                    # Copy into the ring, wrapping at the end
+                    chunk = memoryview(data_bytes)
+                    position = bytes_written % capacity
+                    first_part = min(len(chunk), capacity - position)
+                    data_view[position:position + first_part] = chunk[:first_part]
+                    if first_part < len(chunk):
+                        data_view[0:len(chunk) - first_part] = chunk[first_part:]
+                    bytes_written += len(chunk)
+                    # Publish the new write position only after the data is in place
+                    _RING_HEADER.pack_into(header_view, 0, bytes_written, overflow_count)
+            except Exception as e:
+                error_str = f"{type(e).__name__}: {e}"
+                log.error(f"Capture process failed during recording: {error_str}")
+            finally:
+                if stream:
+                    try:
+                        if stream.is_active(): stream.stop_stream()
+                        stream.close()
+                    except Exception: pass
+            connection.send((_RESULT_RECORDING, bytes_written, overflow_count, error_str))
+    finally:
+        if pa_instance:
+            try: pa_instance.terminate()
+            except Exception: pass
+        del header_view, data_view
+        ring.close()
+        connection.close()
+
+
+def ensure_capture_process():
+    """Creates the shared ring and starts the capture process if it is not running yet."""
+    global _capture_process, _shared_ring, _ring_capacity, _connection
+    if _capture_process and _capture_process.poll() is None:
+        return True
+    shutdown_capture_process()
+
+    bytes_per_second = config.SAMPLE_RATE * config.CHANNELS * pyaudio.get_sample_size(config.PYAUDIO_FORMAT)
+    _ring_capacity = int(bytes_per_second * config.CAPTURE_RING_SECONDS)
+    child_socket = None
+    try:
+        _shared_ring = shared_memory.SharedMemory(create=True, size=_RING_HEADER.size + _ring_capacity)
+        _RING_HEADER.pack_into(_shared_ring.buf, 0, 0, 0)
+        parent_socket, child_socket = socket.socketpair()
+        _connection = Connection(parent_socket.detach())
+        _pending_results[_RESULT_RECORDING].clear()
+        _pending_results[_RESULT_WARM].clear()
+        _capture_process = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                             _shared_ring.name, str(_ring_capacity), str(child_socket.fileno()),
+                                             str(config.CAPTURE_PROCESS_CPU_CORE),
+                                             str(config.CAPTURE_PROCESS_RT_PRIORITY)],
+                                            pass_fds=(child_socket.fileno(),))
+        log.info(f"Capture process started (PID {_capture_process.pid}, ring {_ring_capacity // 1024} KiB).")
+        return True
+    except Exception as e:
+        log.error(f"Failed to start capture process: {e}")
+        shutdown_capture_process()
+        return False
+    finally:
+        if child_socket:
+            child_socket.close() # The child has its own copy; EOF on our end then means it exited
+
+
+def _receive_result(kind, timeout):
+    """
+    Waits for the capture process's next result of this kind and returns its values,
+    or None on timeout or if the process died. Results of the other kind that arrive
+    meanwhile are kept for their own reader.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        with _receive_lock:
+            if _pending_results[kind]:
+                return _pending_results[kind].pop(0)
+            try:
+                if _connection.poll(0.05):
+                    result = _connection.recv()
+                    if result[0] == kind:
+                        return result[1:]
+                    _pending_results[result[0]].append(result[1:])
+                    continue
+            except (EOFError, OSError, AttributeError): # Process gone, or connection closed by a shutdown
+                return None
+        if time.monotonic() >= deadline or _capture_process is None or _capture_process.poll() is not None:
+            return None
+
+
+def _send_command(command):
+    try:
+        with _send_lock:
+            _connection.send(command)
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def record_until_stopped(stop_event, samplerate, channels, frames_per_buffer, audio_format, device_index):
+    """
+    Thread target used by audio_recorder: runs one recording in the capture process.
+    Blocks (without holding the GIL) until stop_event is set, then waits for the
+    child to report how many bytes it wrote.
+    """
+    global _last_result
+    _last_result = None
+    if not ensure_capture_process():
+        _last_result = (0, 0, "Capture process is not available.")
+        return
+    _pending_results[_RESULT_RECORDING].clear() # A result left over from a timed-out stop
+    if not _send_command((samplerate, channels, frames_per_buffer, audio_format, device_index)):
+        _last_result = (0, 0, "Capture process is not available.")
+        return
+    stop_event.wait()
+    _send_command(_COMMAND_STOP)
+    result = _receive_result(_RESULT_RECORDING, config.CAPTURE_PROCESS_STOP_TIMEOUT_S)
+    if result is not None:
+        _last_result = tuple(result)
+        return
+    _last_result = (0, 0, "Capture process did not acknowledge the stop signal.")
+    log.error("Capture process did not acknowledge the stop signal; restarting it on next use.")
+    shutdown_capture_process(force=True)
+
+
+def release_audio_device():
+    """Asks the capture process to terminate its PyAudio instance (idle power mode). No-op if it isn't running."""
+    if _capture_process and _capture_process.poll() is None:
+        _send_command(_COMMAND_RELEASE_AUDIO)
+
+
+def warm_audio_device():
+    """
+    Asks the capture process to initialize PyAudio now, ahead of the next recording.
+    Returns True if it was asked; wait_for_warm_audio_device() then returns its acknowledgement.
+    """
+    if not (_capture_process and _capture_process.poll() is None):
+        return False
+    with _receive_lock:
+        _pending_results[_RESULT_WARM].clear()
+    return _send_command(_COMMAND_WARM_AUDIO)
+
+
+def wait_for_warm_audio_device(timeout):
+    """Waits for the acknowledgement of warm_audio_device(). Returns (init_ms, error_str), or None on timeout."""
+    result = _receive_result(_RESULT_WARM, timeout)
+    return tuple(result) if result is not None else None
+
+
+def get_last_recording_result():
+    """Returns (bytes_written, overflow_count, error_str) for the last recording, or None."""
+    return _last_result
+
+
+def get_recorded_views():
+    """
+    Returns the last recording as a list of memoryviews into the shared ring, in order
+    (one view, or two if the data wraps). If the recording was longer than the ring,
+    only the most recent CAPTURE_RING_SECONDS are available.
+    """
+    if not _shared_ring or not _last_result:
+        return []
+    bytes_written = _last_result[0]
+    data_view = _shared_ring.buf[_RING_HEADER.size:_RING_HEADER.size + _ring_capacity]
+    if bytes_written <= _ring_capacity:
+        return [data_view[:bytes_written]]
+    log.warning(f"Recording exceeded the {config.CAPTURE_RING_SECONDS}s capture ring; keeping the most recent audio only.")
+    start = bytes_written % _ring_capacity
+    return [data_view[start:], data_view[:start]]
+
+
+def shutdown_capture_process(force=False):
+    """Stops the capture process and releases the shared ring."""
+    global _capture_process, _shared_ring, _connection
+    if _capture_process:
+        try:
+            if not force and _capture_process.poll() is None:
+                _send_command(_COMMAND_STOP)
+                _send_command(None)
+                _capture_process.wait(timeout=2)
+        except subprocess.TimeoutExpired: pass
+        try:
+            if _capture_process.poll() is None:
+                _capture_process.terminate()
+                _capture_process.wait(timeout=1)
+        except Exception: pass
+        _capture_process = None
+    if _connection:
+        with _receive_lock:
+            try: _connection.close()
+            except Exception: pass
+            _connection = None
+    if _shared_ring:
+        try:
+            _shared_ring.close()
+            _shared_ring.unlink()
+        except Exception: pass # Views handed out by get_recorded_views() may still be alive
+        _shared_ring = None
+
+
+if __name__ == "__main__":
+    # Started by ensure_capture_process(): shm_name capacity connection_fd cpu_core rt_priority
+    def _optional_int(value):
+        return None if value == "None" else int(value)
+
+    log = app_logger.get_logger("audio_capture_process")
+    _capture_process_main(sys.argv[1], int(sys.argv[2]), Connection(int(sys.argv[3])),
+                          _optional_int(sys.argv[4]), _optional_int(sys.argv[5]))
+    app_logger.stop_logging()
@@ -4,7 +4,13 @@ Handles playback of audio files using an external player (e.g., ffplay).
 """
 import subprocess
 import os
+import math
+import array
+import wave
 import config # Assuming EXTERNAL_PLAYER_COMMAND is in config.py
+import app_logger
+
+log = app_logger.get_logger(__name__)
 
 def play_audio_external(filename_path):
     """
@@ -13,13 +19,13 @@ def play_audio_external(filename_path):
         filename_path (str): The full path to the audio file to be played.
     """
     if not (filename_path and os.path.exists(filename_path) and os.path.getsize(filename_path) > 0):
-        print(f"Audio file for playback not found, empty, or path invalid: {filename_path}")
+        log.error(f"Audio file for playback not found, empty, or path invalid: {filename_path}")
         return
 
     player_cmd_base = config.EXTERNAL_PLAYER_COMMAND # e.g., ['ffplay', '-autoexit', '-nodisp', '-loglevel', 'error']
     command_to_run = player_cmd_base + [filename_path]
 
-    print(f"Attempting to play {filename_path} using: {' '.join(command_to_run)}...")
+    log.info(f"Attempting to play {filename_path} using: {' '.join(command_to_run)}...")
     
     player_process_ran = False
     try:
@@ -31,40 +37,66 @@ def play_audio_external(filename_path):
                                  text=True,           # Decode stdout/stderr as text
                                  check=True)           # Raise CalledProcessError on non-zero exit
         player_process_ran = True
-        print("Playback finished (external player).")
+        log.info("Playback finished (external player).")
         # If ffplay -loglevel error is used, stdout is usually empty.
         # Stderr might contain info even on success if loglevel is higher.
         # if process.stdout:
-        #     print(f"Player stdout: {process.stdout.strip()}")
+        #     log.debug(f"Player stdout: {process.stdout.strip()}")
         # if process.stderr:
-        #     print(f"Player stderr: {process.stderr.strip()}")
+        #     log.debug(f"Player stderr: {process.stderr.strip()}")
             
     except subprocess.CalledProcessError as e:
         player_process_ran = True # It ran, but failed
-        print(f"Error during external player playback (CalledProcessError): {e}")
+        log.error(f"Error during external player playback (CalledProcessError): {e}")
         if e.stdout:
-            print(f"Player stdout on error: {e.stdout.strip()}")
+            log.error(f"Player stdout on error: {e.stdout.strip()}")
         if e.stderr:
-            print(f"Player stderr on error: {e.stderr.strip()}")
+            log.error(f"Player stderr on error: {e.stderr.strip()}")
     except FileNotFoundError:
         player_name = player_cmd_base[0]
-        print(f"Error: '{player_name}' command not found. Please ensure it is installed and in your system's PATH.")
+        log.error(f"'{player_name}' command not found. Please ensure it is installed and in your system's PATH.")
         if player_name == "ffplay":
-            print("You can usually install ffplay (part of FFmpeg) on Debian/Ubuntu/Raspberry Pi OS with:")
-            print("  sudo apt-get update && sudo apt-get install ffmpeg")
+            log.error("You can usually install ffplay (part of FFmpeg) on Debian/Ubuntu/Raspberry Pi OS with:")
+            log.error("  sudo apt-get update && sudo apt-get install ffmpeg")
     except Exception as e:
-        print(f"An unexpected error occurred during playback with external player: {e}")
+        log.exception(f"An unexpected error occurred during playback with external player: {e}")
     finally:
         # Attempt to restore terminal settings, especially if ffplay was run.
         # This is a common fix for "frozen" terminals after external TUI/media apps.
         if player_process_ran or os.name == 'posix': # os.name == 'posix' for Linux/macOS
-            print("Attempting to restore terminal settings with 'stty sane'...")
+            log.debug("Attempting to restore terminal settings with 'stty sane'...")
             try:
                 # Use shell=True for simple commands like this, or pass as a list.
                 # We don't need to check output here, just attempt to run it.
                 subprocess.run(['stty', 'sane'], check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                print("'stty sane' command executed.")
+                log.debug("'stty sane' command executed.")
             except FileNotFoundError:
-                print("Warning: 'stty' command not found. Cannot restore terminal settings automatically.")
+                log.warning("'stty' command not found. Cannot restore terminal settings automatically.")
             except Exception as e_stty:
-                print(f"Warning: Error trying to run 'stty sane': {e_stty}")
+                log.warning(f"Could not run 'stty sane': {e_stty}")
+
+def _write_error_tone(path, samplerate=16000):
+    """Writes a short descending two-tone beep as a WAV file."""
+    samples = array.array('h')
+    for frequency, duration_s in ((880, 0.15), (0, 0.05), (440, 0.25)):
+        for n in range(int(samplerate * duration_s)):
+            samples.append(int(12000 * math.sin(2 * math.pi * frequency * n / samplerate)))
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(samplerate)
+        wf.writeframes(samples.tobytes())
+
+def play_error_tone():
+    """Plays the error tone (generated on first use) so a failed turn is audible."""
+    if not config.ERROR_TONE_ENABLED:
+        return
+    tone_path = os.path.join(config.TEMP_DIR, config.ERROR_TONE_FILENAME)
+    if not os.path.exists(tone_path):
+        try:
+            os.makedirs(config.TEMP_DIR, exist_ok=True)
+            _write_error_tone(tone_path)
+        except Exception as e:
+            log.error(f"Could not create error tone: {e}")
+            return
+    play_audio_external(tone_path)
@@ -11,6 +11,12 @@ import time # For potential small delays if needed, though not currently used he
 
 # Import configurations
 import config
+import app_logger
+import audio_capture_process
+import calibrate_audio
+import check_audio_devices
+
+log = app_logger.get_logger(__name__)
 
 # --- Module-level variables for recording state ---
 # These are managed by the functions in this module.
@@ -21,6 +27,25 @@ _recording_error = None # Stores any exception from the recording thread
 # --- Initialization based on config ---
 PYAUDIO_SAMPLE_WIDTH = None # Will be set by _initialize_pyaudio_sample_width
 
+def _apply_audio_calibration(p_instance):
+    """Uses the SAMPLE_RATE / FRAMES_PER_BUFFER saved by calibrate_audio.py for the configured mic, if any."""
+    if not config.AUDIO_CALIBRATION_ENABLED or not os.path.exists(config.AUDIO_CALIBRATION_PATH):
+        return
+    try:
+        device_name = check_audio_devices.get_input_device_info(p_instance, config.INPUT_DEVICE_INDEX)['name']
+        settings = calibrate_audio.load_device_calibration(device_name)
+    except Exception as e:
+        log.warning(f"Could not apply audio calibration from {config.AUDIO_CALIBRATION_PATH}: {e}")
+        return
+    if not settings:
+        log.info(f"No audio calibration for '{device_name}'; using {config.SAMPLE_RATE} Hz, "
+                 f"{config.FRAMES_PER_BUFFER} frames per buffer (run calibrate_audio.py to tune).")
+        return
+    config.SAMPLE_RATE = settings['sample_rate']
+    config.FRAMES_PER_BUFFER = settings['frames_per_buffer']
+    log.info(f"Using calibrated capture settings for '{device_name}': {config.SAMPLE_RATE} Hz, "
+             f"{config.FRAMES_PER_BUFFER} frames per buffer (calibrated {settings.get('calibrated_at', 'earlier')}).")
+
 def _initialize_pyaudio_sample_width():
     """Helper to get sample width for PyAudio format. Must be called once."""
     global PYAUDIO_SAMPLE_WIDTH
@@ -35,12 +60,13 @@ def _initialize_pyaudio_sample_width():
             
             p_temp = pyaudio.PyAudio()
             PYAUDIO_SAMPLE_WIDTH = p_temp.get_sample_size(config.PYAUDIO_FORMAT)
+            _apply_audio_calibration(p_temp) # Reuses this instance to look up the mic's name
             
             os.dup2(saved_stderr_fd_init, original_stderr_fd_init) # Restore stderr
             os.close(saved_stderr_fd_init)
             os.close(devnull_fd_init)
         except Exception as e:
-            print(f"Error initializing PyAudio sample width: {e}")
+            log.error(f"Error initializing PyAudio sample width: {e}")
             # Fallback or raise error if critical
             if p_temp: p_temp.terminate() # Ensure termination if instance created
             raise # Re-raise as this is critical for WAV saving
@@ -91,14 +117,14 @@ def _record_worker_pyaudio(samplerate, channels, frames_per_buffer, audio_format
 
     if not pa_instance or not stream:
         _recording_error = _recording_error or Exception("PyAudio instance or stream failed to initialize.")
-        print(f"ERROR in PyAudio recording worker: {_recording_error}")
+        log.error(f"PyAudio recording worker failed to start: {_recording_error}")
         if pa_instance: # Terminate if instance was created but stream failed
             try: pa_instance.terminate()
             except Exception: pass
         return # Exit worker if initialization failed
 
     try:
-        print("PyAudio stream opened. Recording audio...")
+        log.info("PyAudio stream opened. Recording audio...")
         while not _stop_event.is_set():
             try:
                 data_bytes = stream.read(frames_per_buffer, exception_on_overflow=False)
@@ -108,13 +134,13 @@ def _record_worker_pyaudio(samplerate, channels, frames_per_buffer, audio_format
                 is_overflow_error = (pa_input_overflowed_exists and e.errno == pyaudio.paInputOverflowed) or \
                                     (e.errno == -9988) # Common ALSA/PortAudio overflow indicator
                 if is_overflow_error:
-                    print("Warning: Input overflowed during recording (PyAudio)!")
+                    log.warning("Input overflowed during recording (PyAudio)!")
                 else:
                     # For other IOErrors, print them but continue recording if possible
-                    print(f"Warning: IOError during stream.read(): {e}")
-        print("Recording stop signal received by worker.")
+                    log.warning(f"IOError during stream.read(): {e}")
+        log.info("Recording stop signal received by worker.")
     except Exception as e:
-        print(f"ERROR in PyAudio recording worker thread (during read loop): {e}")
+        log.error(f"PyAudio recording worker thread failed during read loop: {e}")
         _recording_error = e
     finally:
         if stream:
@@ -125,20 +151,27 @@ def _record_worker_pyaudio(samplerate, channels, frames_per_buffer, audio_format
         if pa_instance:
             try: pa_instance.terminate()
             except Exception: pass # Suppress errors on terminate
-        print("PyAudio recording worker finished.")
+        log.info("PyAudio recording worker finished.")
 
 def start_recording_thread(output_filename):
     """Starts the recording worker thread."""
     global _stop_event, _recording_error
     
-    print(f"Preparing to record to {output_filename} (Mic Index: {config.INPUT_DEVICE_INDEX})...")
+    log.info(f"Preparing to record to {output_filename} (Mic Index: {config.INPUT_DEVICE_INDEX})...")
     _stop_event.clear()
     _recording_error = None # Reset error status for new recording
     
-    recording_thread = threading.Thread(target=_record_worker_pyaudio,
-                                       args=(config.SAMPLE_RATE, config.CHANNELS, 
-                                             config.FRAMES_PER_BUFFER, config.PYAUDIO_FORMAT, 
-                                             config.INPUT_DEVICE_INDEX))
+    if config.AUDIO_CAPTURE_BACKEND == "process":
+        # The thread only supervises the capture process; it waits on _stop_event without holding the GIL
+        recording_thread = threading.Thread(target=audio_capture_process.record_until_stopped, name="AudioRecorder",
+                                           args=(_stop_event, config.SAMPLE_RATE, config.CHANNELS,
+                                                 config.FRAMES_PER_BUFFER, config.PYAUDIO_FORMAT,
+                                                 config.INPUT_DEVICE_INDEX))
+    else:
+        recording_thread = threading.Thread(target=_record_worker_pyaudio, name="AudioRecorder",
+                                           args=(config.SAMPLE_RATE, config.CHANNELS, 
+                                                 config.FRAMES_PER_BUFFER, config.PYAUDIO_FORMAT, 
+                                                 config.INPUT_DEVICE_INDEX))
     recording_thread.daemon = True # Allows main program to exit even if thread is somehow stuck
     recording_thread.start()
     return recording_thread
@@ -147,21 +180,24 @@ def stop_and_save_recording(thread, output_filename):
     """Signals recording thread to stop, joins it, and saves the recorded audio to a WAV file."""
     global _stop_event, _recorded_frames_list_bytes, _recording_error
     
-    print("Sending stop signal to recording thread...")
+    log.info("Sending stop signal to recording thread...")
     _stop_event.set()
     thread.join(timeout=5) # Wait for the thread to finish, with a timeout
 
     if thread.is_alive():
-        print("Warning: Recording thread did not finish cleanly after stop signal.")
+        log.warning("Recording thread did not finish cleanly after stop signal.")
         # Potentially try to force close resources if thread is stuck, though risky
         return False
         
+    if config.AUDIO_CAPTURE_BACKEND == "process":
+        return _save_from_capture_process(output_filename)
+
     if _recording_error:
-        print(f"Recording failed due to an error in the worker: {_recording_error}")
+        log.error(f"Recording failed due to an error in the worker: {_recording_error}")
         return False
 
     if not _recorded_frames_list_bytes:
-        print("No audio frames were recorded.")
+        log.warning("No audio frames were recorded.")
         return False
 
     try:
@@ -174,11 +210,47 @@ def stop_and_save_recording(thread, output_filename):
             wf.setsampwidth(PYAUDIO_SAMPLE_WIDTH) # Use the module-level initialized width
             wf.setframerate(config.SAMPLE_RATE)
             wf.writeframes(b''.join(_recorded_frames_list_bytes))
-        print(f"Recording saved to {full_path}")
+        log.info(f"Recording saved to {full_path}")
         return True
     except Exception as e:
-        print(f"ERROR saving recorded audio to {output_filename}: {e}")
+        log.error(f"Failed to save recorded audio to {output_filename}: {e}")
         return False
     finally:
         _recorded_frames_list_bytes = [] # Clear frames for next recording
 
+def _save_from_capture_process(output_filename):
+    """Writes the last capture-process recording to a WAV file straight from the shared ring."""
+    result = audio_capture_process.get_last_recording_result()
+    if not result:
+        log.error("Recording failed: no result from the capture process.")
+        return False
+    bytes_written, overflow_count, error_str = result
+    if error_str:
+        log.error(f"Recording failed due to an error in the capture process: {error_str}")
+        return False
+    if overflow_count:
+        log.warning(f"Capture process reported {overflow_count} input overflow(s) during recording.")
+    if not bytes_written:
+        log.warning("No audio frames were recorded.")
+        return False
+
+    recorded_views = audio_capture_process.get_recorded_views()
+    try:
+        full_path = os.path.join(config.TEMP_DIR, output_filename)
+        if not os.path.exists(config.TEMP_DIR):
+            os.makedirs(config.TEMP_DIR, exist_ok=True)
+
+        with wave.open(full_path, 'wb') as wf:
+            wf.setnchannels(config.CHANNELS)
+            wf.setsampwidth(PYAUDIO_SAMPLE_WIDTH)
+            wf.setframerate(config.SAMPLE_RATE)
+            for view in recorded_views: # No join/copy: write directly from shared memory
+                wf.writeframes(view)
+        log.info(f"Recording saved to {full_path}")
+        return True
+    except Exception as e:
+        log.error(f"Failed to save recorded audio to {output_filename}: {e}")
+        return False
+    finally:
+        for view in recorded_views:
+            view.release()
@@ -0,0 +1,96 @@
+# audio_segmenter.py
+"""
+Splits long recordings into shorter WAV segments for parallel upload.
+
+Cut points are placed at the quietest short window inside each allowed
+range (between UPLOAD_SEGMENT_MIN_S and UPLOAD_SEGMENT_MAX_S after the
+previous cut), so segments usually break between words. If there is no
+pause, the cut still happens by UPLOAD_SEGMENT_MAX_S at the latest.
+"""
+import io
+import wave
+
+import numpy as np
+
+import config
+import app_logger
+
+log = app_logger.get_logger(__name__)
+
+ENERGY_WINDOW_S = 0.02 # Window used to find quiet cut points
+
+
+def window_rms(samples, samplerate, window_s=ENERGY_WINDOW_S):
+    """Returns the RMS energy of each consecutive window_s window of a mono signal (a partial window is dropped)."""
+    window = max(1, int(samplerate * window_s))
+    n_windows = len(samples) // window
+    frames = samples[:n_windows * window].astype(np.float32).reshape(n_windows, window)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def find_cut_points(samples, samplerate, max_segment_s, min_segment_s, window_s=ENERGY_WINDOW_S):
+    """
+    Returns the frame indices where a mono int16 signal should be cut so that no
+    segment is longer than max_segment_s (and, except for the last, none shorter
+    than min_segment_s). Each cut is placed at the latest of the quietest
+    windows in its range.
+    """
+    window = max(1, int(samplerate * window_s))
+    n_windows = len(samples) // window
+    if n_windows == 0 or len(samples) <= max_segment_s * samplerate:
+        return []
+    window_energy = window_rms(samples, samplerate, window_s)
+
+    min_windows = max(1, int(min_segment_s / window_s))
+    max_windows = max(min_windows + 1, int(max_segment_s / window_s))
+    cut_points = []
+    start = 0
+    while n_windows - start > max_windows:
+        search = window_energy[start + min_windows:start + max_windows]
+        # Latest of the quietest windows, so segments stay close to the maximum length
+        quiet_enough = np.flatnonzero(search <= search.min() * 1.5 + 1.0)
+        quietest = start + min_windows + int(quiet_enough[-1])
+        cut_points.append(quietest * window + window // 2)
+        start = quietest + 1
+    return cut_points
+
+
+def split_wav_into_segments(filepath, max_segment_s=None, min_segment_s=None):
+    """
+    Splits a 16-bit WAV file into WAV blobs (bytes) at quiet points.
+    Returns a list with a single blob (the whole file) when no split is needed.
+    """
+    max_segment_s = max_segment_s or config.UPLOAD_SEGMENT_MAX_S
+    min_segment_s = min_segment_s or config.UPLOAD_SEGMENT_MIN_S
+    with wave.open(filepath, 'rb') as wf:
+        params = wf.getparams()
+        pcm = wf.readframes(params.nframes)
+
+    if params.sampwidth != 2:
+        log.warning(f"Segmenting only supports 16-bit audio (got {params.sampwidth * 8}-bit); uploading as one piece.")
+        with open(filepath, 'rb') as f:
+            return [f.read()]
+
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    if params.nchannels > 1: # Use the channel mix to find pauses
+        samples = samples.reshape(-1, params.nchannels).mean(axis=1)
+    cut_points = find_cut_points(samples, params.framerate, max_segment_s, min_segment_s)
+
+    bytes_per_frame = params.sampwidth * params.nchannels
+    boundaries = [0] + cut_points + [params.nframes]
+    segments = []
+    for start_frame, end_frame in zip(boundaries, boundaries[1:]):
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as out_wf:
+            out_wf.setnchannels(params.nchannels)
+            out_wf.setsampwidth(params.sampwidth)
+            out_wf.setframerate(params.framerate)
+            out_wf.writeframes(pcm[start_frame * bytes_per_frame:end_frame * bytes_per_frame])
+        segments.append(buffer.getvalue())
+    log.debug(f"Split {filepath} into {len(segments)} segment(s) at frames {cut_points}.")
+    return segments
+
+
+def get_wav_duration_s(filepath):
+    with wave.open(filepath, 'rb') as wf:
+        return wf.getnframes() / float(wf.getframerate())
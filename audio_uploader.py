@@ -1,10 +1,115 @@
 # audio_uploader.py
 """
 Handles uploading audio files to a server.
+Long recordings can optionally be split at pauses and uploaded as parallel
+segments over a pooled session (see UPLOAD_SEGMENTED in config.py).
+Requests go through circuit_breaker, which fails fast while the endpoint is
+down and supplies latency-based timeouts. Every upload carries the
+conversation's session fields (see conversation_session.py).
 """
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import config
+import app_logger
+import audio_segmenter
+import circuit_breaker
+import conversation_session
+import reply_cache
+
+log = app_logger.get_logger(__name__)
+
+_session = None # Shared requests.Session: keeps connections (and TLS) alive between turns
+_session_lock = threading.Lock() # Segment workers, the warm-up thread and close_connections() race on _session
+last_response_info = None # Outcome of the last upload for session_archive: status, content type, latency, error kind
+
+def _get_session():
+    """Returns the shared HTTP session, sized for parallel segment uploads."""
+    global _session
+    with _session_lock:
+        session = _session
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, config.UPLOAD_MAX_PARALLEL))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return session
+
+def _post_segment(upload_id, segment_index, segment_count, segment_bytes, base_name, session_fields):
+    """Uploads one segment. Raises on HTTP or network errors."""
+    files = {'audio': (f"{base_name}.part{segment_index}.wav", segment_bytes, 'audio/wav')}
+    data = {'upload_id': upload_id, 'segment_index': str(segment_index), 'segment_count': str(segment_count),
+            **session_fields}
+    response = _get_session().post(config.UPLOAD_URL, files=files, data=data, timeout=circuit_breaker.get_timeouts())
+    response.raise_for_status()
+    return response
+
+def _upload_segmented(filepath_to_upload, segments, session_fields):
+    """
+    Uploads segments concurrently with a shared upload_id and sequence numbers.
+    The server replies with audio on whichever request completes the set; that response is
+    returned together with the slowest segment's latency in seconds.
+    """
+    upload_id = uuid.uuid4().hex
+    base_name = os.path.splitext(os.path.basename(filepath_to_upload))[0]
+    log.info(f"Uploading {len(segments)} segments in parallel (upload_id {upload_id})...")
+    with ThreadPoolExecutor(max_workers=min(len(segments), config.UPLOAD_MAX_PARALLEL)) as pool:
+        futures = [pool.submit(_post_segment, upload_id, index, len(segments), segment, base_name, session_fields)
+                   for index, segment in enumerate(segments)]
+        responses = [future.result() for future in futures] # Re-raises the first failure
+    slowest_s = max(response.elapsed.total_seconds() for response in responses)
+    for response in responses:
+        if response.content:
+            return response, slowest_s
+    return responses[-1], slowest_s
+
+def _probe_endpoint(connect_timeout, read_timeout):
+    """Cheap health check used by the circuit breaker: any non-5xx answer means the endpoint is up."""
+    response = _get_session().head(config.UPLOAD_URL, timeout=(connect_timeout, read_timeout))
+    return response.status_code < 500
+
+circuit_breaker.set_probe_function(_probe_endpoint)
+
+def close_connections():
+    """Drops the pooled connections (idle power mode); the next request or warm_connection() reconnects."""
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+def warm_connection():
+    """Opens the pooled connection (TCP + TLS) ahead of the first upload. Returns True if the endpoint answered."""
+    try:
+        return _probe_endpoint(*circuit_breaker.get_timeouts())
+    except requests.exceptions.RequestException as e:
+        log.info(f"Could not pre-connect to the server (will connect on first upload): {e}")
+        return False
+
+def _save_response_audio(content):
+    """Writes reply audio to the temp response file and returns its path."""
+    if not os.path.exists(config.TEMP_DIR):
+        os.makedirs(config.TEMP_DIR, exist_ok=True)
+    response_audio_path = os.path.join(config.TEMP_DIR, config.TEMP_RESPONSE_FILENAME)
+    with open(response_audio_path, 'wb') as out_file:
+        out_file.write(content)
+    return response_audio_path
+
+def _fingerprint_for_cache(filepath):
+    """Returns (fingerprint, duration_s) for the reply cache, or None if this recording can't be cached."""
+    try:
+        fingerprint = reply_cache.compute_fingerprint(filepath)
+    except Exception as e:
+        log.warning(f"Could not fingerprint {filepath} for the reply cache: {e}")
+        fingerprint = None
+    if fingerprint is None:
+        reply_cache.note_skipped()
+    return fingerprint
 
 def upload_audio(filepath_to_upload):
     """
@@ -14,47 +119,107 @@ def upload_audio(filepath_to_upload):
     Returns:
         str: The path to the saved response audio file, or None on failure.
     """
-    print(f"Uploading {filepath_to_upload} to {config.UPLOAD_URL}...")
+    global last_response_info
+    log.info(f"Uploading {filepath_to_upload} to {config.UPLOAD_URL}...")
+    last_response_info = None
     
     if not os.path.exists(filepath_to_upload) or os.path.getsize(filepath_to_upload) == 0:
-        print(f"Error: File {filepath_to_upload} does not exist or is empty. Skipping upload.")
+        log.error(f"File {filepath_to_upload} does not exist or is empty. Skipping upload.")
+        return None
+
+    # In a conversation session the server must see every turn: a hit would leave a gap in its context
+    use_cache = config.REPLY_CACHE_ENABLED and not config.CONVERSATION_SESSION_ENABLED
+    fingerprint = _fingerprint_for_cache(filepath_to_upload) if use_cache else None
+    if fingerprint:
+        cached = reply_cache.lookup(*fingerprint)
+        if cached: # Served locally, even while the circuit breaker is open
+            audio_bytes, content_type = cached
+            last_response_info = {'status': 200, 'content_type': content_type, 'latency_s': 0.0, 'cached': True}
+            response_audio_path = _save_response_audio(audio_bytes)
+            log.info(f"Reply cache hit; skipped the upload (cache: {reply_cache.format_stats()}).")
+            return response_audio_path
+
+    if not circuit_breaker.allow_request():
+        log.warning("Upload endpoint is unavailable (circuit breaker open). Failing fast.")
+        last_response_info = {'error': 'breaker_open', 'latency_s': 0.0}
         return None
 
+    response = None
+    session_fields = conversation_session.begin_turn()
+    started = time.perf_counter()
     try:
-        with open(filepath_to_upload, 'rb') as f:
-            # Assuming server expects the field name 'audio' and client sends it as a WAV
-            files = {'audio': (os.path.basename(filepath_to_upload), f, 'audio/wav')}
-            response = requests.post(config.UPLOAD_URL, files=files, timeout=30)
-            response.raise_for_status() # Raises an HTTPError for bad responses (4XX or 5XX)
+        segments = None
+        if config.UPLOAD_SEGMENTED and audio_segmenter.get_wav_duration_s(filepath_to_upload) > config.UPLOAD_SEGMENT_THRESHOLD_S:
+            segments = audio_segmenter.split_wav_into_segments(filepath_to_upload)
 
-        print(f"Server Response Content-Type: {response.headers.get('Content-Type')}") # Useful for debugging
+        if segments and len(segments) > 1:
+            response, latency_s = _upload_segmented(filepath_to_upload, segments, session_fields)
+        else:
+            with open(filepath_to_upload, 'rb') as f:
+                # Assuming server expects the field name 'audio' and client sends it as a WAV
+                files = {'audio': (os.path.basename(filepath_to_upload), f, 'audio/wav')}
+                response = _get_session().post(config.UPLOAD_URL, files=files, data=session_fields,
+                                               timeout=circuit_breaker.get_timeouts())
+                response.raise_for_status() # Raises an HTTPError for bad responses (4XX or 5XX)
+            latency_s = response.elapsed.total_seconds()
+        circuit_breaker.record_success(latency_s)
+        conversation_session.note_response(response.headers)
+        last_response_info = {'status': response.status_code,
+                               'content_type': response.headers.get('Content-Type'),
+                               'latency_s': round(latency_s, 4)}
+
+        log.debug(f"Server Response Content-Type: {response.headers.get('Content-Type')}") # Useful for debugging
 
         if response.content:
-            # Ensure TEMP_DIR exists for response file
-            if not os.path.exists(config.TEMP_DIR):
-                os.makedirs(config.TEMP_DIR, exist_ok=True)
-            
-            response_audio_path = os.path.join(config.TEMP_DIR, config.TEMP_RESPONSE_FILENAME)
-            with open(response_audio_path, 'wb') as out_file:
-                out_file.write(response.content)
-            print(f"Audio response saved to {response_audio_path}")
+            response_audio_path = _save_response_audio(response.content)
+            log.info(f"Audio response saved to {response_audio_path}")
+            if fingerprint:
+                reply_cache.store(*fingerprint, response.content, response.headers.get('Content-Type'),
+                                  response.headers.get('Cache-Control'))
+                log.debug(f"Reply cache: {reply_cache.format_stats()}.")
             return response_audio_path
         else:
-            print("No content in server response.")
+            log.warning("No content in server response.")
             return None
             
     except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred during upload: {http_err}")
+        log.error(f"HTTP error occurred during upload: {http_err}")
+        response = http_err.response if http_err.response is not None else response
+        last_response_info = _failure_info('http', started, response)
+        if response is not None and response.status_code >= 500:
+            circuit_breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            circuit_breaker.record_success() # The endpoint answered; a 4xx is not an outage
         # Attempt to print some of the error response text if available
-        if hasattr(response, 'text') and response.text:
-            print(f"Response body (text): {response.text[:500]}...")
+        if response is None:
+            pass
+        elif hasattr(response, 'text') and response.text:
+            log.error(f"Response body (text): {response.text[:500]}...")
         elif response.content: # If not text, maybe some other binary error
-             print(f"Response body (binary, first 100 bytes): {response.content[:100]}...")
+             log.error(f"Response body (binary, first 100 bytes): {response.content[:100]}...")
         return None
     except requests.exceptions.RequestException as e: # Catches other network issues
-        print(f"Error uploading audio (RequestException): {e}")
+        log.error(f"Error uploading audio (RequestException): {e}")
+        last_response_info = _failure_info(_request_error_kind(e), started)
+        circuit_breaker.record_failure(type(e).__name__)
         return None
     except Exception as e: # Catch-all for other unexpected errors
-        print(f"An unexpected error occurred during upload: {e}")
+        log.exception(f"An unexpected error occurred during upload: {e}")
+        last_response_info = _failure_info('exception', started)
         return None
 
+def _request_error_kind(error):
+    if isinstance(error, requests.exceptions.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return 'connection_error'
+    return 'request_error'
+
+def _failure_info(kind, started, response=None):
+    """last_response_info for a failed upload: the error kind, how long it took to fail and any HTTP status."""
+    info = {'error': kind, 'latency_s': round(time.perf_counter() - started, 4)}
+    if response is not None:
+        info['status'] = response.status_code
+        info['content_type'] = response.headers.get('Content-Type')
+    return info
+
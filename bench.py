@@ -0,0 +1,359 @@
+# bench.py
+"""
+Local benchmarks against stand_in_server.py.
+
+    python bench.py segments [--duration 60] [--latency 0.15] [--kbps 4000] [--counts 1,2,4,8]
+    python bench.py breaker [--latency 0.05] [--probe-interval 1] [--read-timeout 2]
+    python bench.py idle [--window 10] [--player-cmd "cvlc --no-osd --loop"] [--latency 0.05]
+    python bench.py cache [--turns 60] [--phrases 5] [--repeat-share 0.6] [--latency 0.8]
+    python bench.py session [--turns 10] [--context-base 0.6] [--context-per-turn 0.05] [--context-incremental 0.1]
+
+'segments' uploads the same synthetic recording with different segment
+counts and prints the upload wall-clock time for each, so the effect of
+UPLOAD_SEGMENTED can be compared on a simulated high-latency link.
+
+'breaker' runs uploads while the stand-in server is healthy, hanging and
+rejecting (also with POSTs hanging while HEAD probes get a 404), and shows
+how long each turn blocks, when the circuit breaker opens, and how quickly
+probes and a trial upload close it again.
+
+'idle' plays a looping "video" (by default a stand-in that burns CPU like
+cvlc does), lets idle_governor release it with each IDLE_VIDEO_ACTION and
+reports system CPU and SoC temperature with and without the release, the
+resume latency, and when the capture process (PyAudio) and the HTTP
+connection to a stand-in server were ready again after the press.
+
+'cache' sends turns where some phrases come back again and again (each
+time with a different gain, background noise and silence around it) and
+the rest are said once. The stand-in answers every phrase with its own
+reply, so a hit that returned another phrase's reply counts as a false
+hit. Reports the hit rate, false hits and missed repeats, and the turn
+time of hits versus misses with REPLY_CACHE_ENABLED.
+
+'session' runs one conversation against a stand-in server that charges for
+building the conversation context, once without session fields
+(stateless, the context is rebuilt every turn), once with
+conversation_session and valid continuation tokens, and once with tokens
+that have always expired by the next turn. Prints the turn times and how
+often the server rebuilt versus reused the context.
+"""
+import argparse
+import os
+import shlex
+import statistics
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+import config
+import app_logger
+import audio_capture_process
+import audio_uploader
+import circuit_breaker
+import conversation_session
+import idle_governor
+import reply_cache
+import stand_in_server
+import video_manager
+
+
+def make_speech_like_wav(path, duration_s, samplerate=48000, seed=1234, gain=1.0, noise=0.0, lead_s=0.0, trail_s=0.0):
+    """
+    Writes a WAV of tone bursts ("words") separated by short pauses. The same seed gives the
+    same "phrase"; gain, background noise and silence around it vary how it was "spoken".
+    """
+    rng = np.random.default_rng(seed)
+    pieces = []
+    total = 0
+    while total < duration_s * samplerate:
+        word = int(rng.uniform(0.2, 0.8) * samplerate)
+        pause = int(rng.uniform(0.1, 0.5) * samplerate)
+        t = np.arange(word) / samplerate
+        pitch = rng.uniform(150, 400)
+        # Fundamental plus a formant-like overtone, so the spectrum has structure in several bands
+        pieces.append(8000 * np.sin(2 * np.pi * pitch * t) + 3000 * np.sin(2 * np.pi * pitch * rng.uniform(3, 8) * t))
+        pieces.append(np.zeros(pause))
+        total += word + pause
+    samples = np.concatenate(pieces)[:int(duration_s * samplerate)] * gain
+    samples = np.concatenate([np.zeros(int(lead_s * samplerate)), samples, np.zeros(int(trail_s * samplerate))])
+    if noise:
+        samples = samples + np.random.default_rng().normal(0, noise, len(samples))
+    samples = np.clip(samples, -32768, 32767).astype(np.int16)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(samplerate)
+        wf.writeframes(samples.tobytes())
+
+
+def bench_segments(args):
+    server = stand_in_server.start_server(latency_s=args.latency,
+                                          upload_bytes_per_s=args.kbps * 1000 / 8 if args.kbps else None)
+    config.UPLOAD_URL = server.url
+    config.TEMP_DIR = tempfile.mkdtemp(prefix="talk_bench_")
+    wav_path = os.path.join(config.TEMP_DIR, "bench_recording.wav")
+    make_speech_like_wav(wav_path, args.duration)
+    size_kib = os.path.getsize(wav_path) / 1024
+    print(f"Recording: {args.duration:.0f}s, {size_kib:.0f} KiB | latency {args.latency * 1000:.0f} ms, "
+          f"per-connection cap {args.kbps or 'none'} kbit/s, {args.repeat} run(s) each")
+    print(f"{'segments':>8} {'parallel':>8} {'median_s':>9} {'min_s':>7} {'speedup':>8}")
+
+    baseline = None
+    try:
+        for count in args.counts:
+            config.UPLOAD_SEGMENTED = count > 1
+            config.UPLOAD_SEGMENT_THRESHOLD_S = 0
+            config.UPLOAD_SEGMENT_MAX_S = args.duration / count * 1.1 # Room to move the cut to a pause
+            config.UPLOAD_SEGMENT_MIN_S = args.duration / count * 0.9
+            config.UPLOAD_MAX_PARALLEL = max(1, count)
+            audio_uploader.close_connections() # New pool sized for this run
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response_path = audio_uploader.upload_audio(wav_path)
+                timings.append(time.perf_counter() - started)
+                if not response_path:
+                    print(f"{count:>8} upload failed")
+                    break
+            else:
+                median = statistics.median(timings)
+                baseline = baseline or median
+                print(f"{count:>8} {config.UPLOAD_MAX_PARALLEL:>8} {median:>9.3f} {min(timings):>7.3f} {baseline / median:>7.2f}x")
+    finally:
+        stand_in_server.stop_server(server)
+
+
+def bench_breaker(args):
+    server = stand_in_server.start_server(latency_s=args.latency)
+    config.UPLOAD_URL = server.url
+    config.TEMP_DIR = tempfile.mkdtemp(prefix="talk_bench_")
+    config.BREAKER_PROBE_INTERVAL_S = args.probe_interval
+    config.UPLOAD_READ_TIMEOUT_MIN_S = args.read_timeout # Each hanging turn waits this long
+    app_logger.set_level("CRITICAL") # The table below already shows every failure
+    config.UPLOAD_SEGMENTED = False
+    circuit_breaker.reset()
+    wav_path = os.path.join(config.TEMP_DIR, "bench_recording.wav")
+    make_speech_like_wav(wav_path, 2.0)
+
+    def turn(label):
+        started = time.perf_counter()
+        ok = audio_uploader.upload_audio(wav_path) is not None
+        elapsed = time.perf_counter() - started
+        connect_timeout, read_timeout = circuit_breaker.get_timeouts()
+        print(f"{label:<10} {'ok' if ok else 'failed':<7} {elapsed:>8.3f}s  breaker {circuit_breaker.get_state():<9} "
+              f"next timeouts ({connect_timeout:.1f}s, {read_timeout:.1f}s)")
+        return ok
+
+    def wait_while_open():
+        started = time.perf_counter()
+        while circuit_breaker.is_open() and time.perf_counter() - started < args.probe_interval * 10:
+            time.sleep(0.05)
+        return time.perf_counter() - started
+
+    try:
+        for _ in range(5):
+            turn("healthy")
+        for mode in ("hang", "reject", "hang-post"):
+            server.mode = mode
+            for _ in range(config.BREAKER_FAILURE_THRESHOLD + 2):
+                turn(mode)
+            if mode == "hang-post": # The probe gets its 404 and half-opens the breaker; the trial upload still hangs
+                wait_while_open()
+                turn("trial")
+            server.mode = "ok"
+            waited_s = wait_while_open()
+            print(f"recovered  breaker {circuit_breaker.get_state()} {waited_s:.2f}s after the endpoint came back "
+                  f"({server.stats['probes']} probes so far)")
+            turn("healthy")
+    finally:
+        server.mode = "ok"
+        stand_in_server.stop_server(server)
+
+
+def bench_idle(args):
+    config.TEMP_DIR = tempfile.mkdtemp(prefix="talk_bench_")
+    video_path = os.path.join(config.TEMP_DIR, "idle.mp4")
+    with open(video_path, 'wb'):
+        pass
+    config.VIDEO_PLAYER_COMMAND_TEMPLATE = (shlex.split(args.player_cmd) if args.player_cmd
+                                            else [sys.executable, '-c', 'while True: pass']) # Busy like a decoding player
+    server = stand_in_server.start_server(latency_s=args.latency) # Reconnected to on resume
+    config.UPLOAD_URL = server.url
+    config.AUDIO_CAPTURE_BACKEND = "process" # The backend whose audio device is released
+    audio_capture_process.ensure_capture_process()
+    audio_uploader.warm_connection()
+    print(f"{'action':<7} {'CPU playing':>12} {'CPU released':>13} {'SoC playing':>12} {'SoC released':>13} "
+          f"{'resume':>9} {'audio ready':>12} {'HTTP ready':>11}")
+    try:
+        for action in ("pause", "stop"):
+            config.IDLE_VIDEO_ACTION = action
+            video_manager.start_looping_video(video_path)
+            idle_governor.on_activity()
+            time.sleep(args.window)
+            idle_governor.release()
+            time.sleep(args.window)
+            idle_governor.on_activity()
+            idle_governor.wait_until_ready(timeout=10)
+            stats = idle_governor.get_stats()
+            temps = [f"{t:.1f}°C" if t is not None else "n/a"
+                     for t in (stats['last_temp_at_release_c'], stats['last_temp_at_resume_c'])]
+            ready = [f"{ms:.1f}ms" if ms is not None else "n/a"
+                     for ms in (stats['last_audio_ready_ms'], stats['last_http_ready_ms'])]
+            print(f"{action:<7} {stats['last_cpu_percent_before']:>11.1f}% {stats['last_cpu_percent_released']:>12.1f}% "
+                  f"{temps[0]:>12} {temps[1]:>13} {stats['last_resume_ms']:>7.1f}ms {ready[0]:>12} {ready[1]:>11}")
+            video_manager.stop_current_video()
+    finally:
+        video_manager.stop_current_video()
+        audio_capture_process.shutdown_capture_process()
+        stand_in_server.stop_server(server)
+
+
+def bench_cache(args):
+    server = stand_in_server.start_server(latency_s=args.latency)
+    config.UPLOAD_URL = server.url
+    config.TEMP_DIR = tempfile.mkdtemp(prefix="talk_bench_")
+    config.UPLOAD_SEGMENTED = False
+    config.REPLY_CACHE_ENABLED = True
+    config.REPLY_CACHE_DISK_DIR = None
+    config.CONVERSATION_SESSION_ENABLED = False # With sessions the uploader bypasses the cache
+    reply_cache.clear()
+    circuit_breaker.reset()
+    rng = np.random.default_rng(args.seed)
+    expected = {}
+
+    def respond(fields):
+        return 200, expected['reply'], 'audio/wav', 0.0
+
+    server.responder = respond
+    server.reply_headers = {'Cache-Control': 'max-age=3600'} # Stock answers that don't depend on context
+    wav_path = os.path.join(config.TEMP_DIR, "bench_recording.wav")
+    said = set()
+    counts = {'hit': 0, 'false_hit': 0, 'miss': 0, 'missed_repeat': 0}
+    hit_times, miss_times = [], []
+    try:
+        for turn in range(args.turns):
+            if rng.random() < args.repeat_share:
+                phrase = int(rng.integers(args.phrases)) # One of the recurring requests
+            else:
+                phrase = args.phrases + turn # Said once
+            make_speech_like_wav(wav_path, float(1.0 + phrase % 4 * 0.5), seed=phrase,
+                                 gain=rng.uniform(0.4, 1.5), noise=rng.uniform(0, args.noise),
+                                 lead_s=rng.uniform(0, 0.6), trail_s=rng.uniform(0, 0.6))
+            expected['reply'] = f"reply to phrase {phrase}".encode() # Stands in for that phrase's audio
+            requests_before = server.stats['utterances']
+            started = time.perf_counter()
+            response_path = audio_uploader.upload_audio(wav_path)
+            elapsed = time.perf_counter() - started
+            if not response_path:
+                print(f"turn {turn}: upload failed")
+                continue
+            with open(response_path, 'rb') as f:
+                correct = f.read() == expected['reply']
+            if server.stats['utterances'] == requests_before:
+                counts['hit'] += 1
+                hit_times.append(elapsed)
+                if not correct:
+                    counts['false_hit'] += 1
+            else:
+                counts['miss'] += 1
+                miss_times.append(elapsed)
+                if phrase in said:
+                    counts['missed_repeat'] += 1
+            said.add(phrase)
+    finally:
+        stand_in_server.stop_server(server)
+
+    print(f"{args.turns} turns, {args.phrases} recurring phrases ({args.repeat_share * 100:.0f}% of turns), "
+          f"server latency {args.latency * 1000:.0f} ms, threshold {config.REPLY_CACHE_MATCH_THRESHOLD}")
+    print(f"hits {counts['hit']} (false {counts['false_hit']}), misses {counts['miss']} "
+          f"(of which repeats not recognised {counts['missed_repeat']})")
+    for label, times in (("hit", hit_times), ("miss", miss_times)):
+        if times:
+            print(f"{label:<5} turn time median {statistics.median(times) * 1000:>8.1f} ms, max {max(times) * 1000:>8.1f} ms")
+    print(f"cache: {reply_cache.format_stats()}")
+
+
+def bench_session(args):
+    config.TEMP_DIR = tempfile.mkdtemp(prefix="talk_bench_")
+    config.UPLOAD_SEGMENTED = False
+    config.REPLY_CACHE_ENABLED = False
+    wav_path = os.path.join(config.TEMP_DIR, "bench_recording.wav")
+    make_speech_like_wav(wav_path, 2.0)
+    print(f"{args.turns} turns | latency {args.latency * 1000:.0f} ms, context rebuild {args.context_base * 1000:.0f} ms "
+          f"+ {args.context_per_turn * 1000:.0f} ms per earlier turn, with token {args.context_incremental * 1000:.0f} ms")
+    print(f"{'mode':<10} {'first_s':>8} {'median_s':>9} {'last_s':>7} {'total_s':>8} {'rebuilds':>9} {'reuses':>7}")
+    baseline = None
+    for mode, enabled, token_ttl_s in (("stateless", False, 300.0), ("session", True, 300.0), ("expired", True, 0.0)):
+        server = stand_in_server.start_server(latency_s=args.latency, context_base_s=args.context_base,
+                                              context_per_turn_s=args.context_per_turn,
+                                              context_incremental_s=args.context_incremental, token_ttl_s=token_ttl_s)
+        config.UPLOAD_URL = server.url
+        config.CONVERSATION_SESSION_ENABLED = enabled
+        circuit_breaker.reset()
+        conversation_session.start()
+        timings = []
+        try:
+            for _ in range(args.turns):
+                started = time.perf_counter()
+                if not audio_uploader.upload_audio(wav_path):
+                    print(f"{mode:<10} upload failed")
+                    break
+                timings.append(time.perf_counter() - started)
+        finally:
+            stand_in_server.stop_server(server)
+        if len(timings) < args.turns:
+            continue
+        total = sum(timings)
+        baseline = baseline or total
+        print(f"{mode:<10} {timings[0]:>8.3f} {statistics.median(timings):>9.3f} {timings[-1]:>7.3f} {total:>8.2f} "
+              f"{server.stats['context_rebuilds']:>9} {server.stats['context_reuses']:>7}   {baseline / total:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local benchmarks for the talk client.")
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+
+    segments_parser = subparsers.add_parser("segments", help="Upload time versus segment count")
+    segments_parser.add_argument('--duration', type=float, default=60.0, help="Recording length in seconds")
+    segments_parser.add_argument('--latency', type=float, default=0.15, help="Server latency per request in seconds")
+    segments_parser.add_argument('--kbps', type=float, default=4000, help="Per-connection upload cap in kbit/s (0 = none)")
+    segments_parser.add_argument('--counts', type=lambda v: [int(c) for c in v.split(',')], default=[1, 2, 4, 6, 8])
+    segments_parser.add_argument('--repeat', type=int, default=3)
+    segments_parser.set_defaults(func=bench_segments)
+
+    breaker_parser = subparsers.add_parser("breaker", help="Fail-fast and recovery against a hanging/rejecting server")
+    breaker_parser.add_argument('--latency', type=float, default=0.05, help="Server latency per request in seconds")
+    breaker_parser.add_argument('--read-timeout', type=float, default=2.0,
+                                help="Read timeout floor in seconds (the app uses UPLOAD_READ_TIMEOUT_MIN_S)")
+    breaker_parser.add_argument('--probe-interval', type=float, default=1.0, help="BREAKER_PROBE_INTERVAL_S for the run")
+    breaker_parser.set_defaults(func=bench_breaker)
+
+    idle_parser = subparsers.add_parser("idle", help="CPU, temperature and resume latency of the idle power mode")
+    idle_parser.add_argument('--window', type=float, default=10.0, help="Seconds measured playing and released")
+    idle_parser.add_argument('--player-cmd', help="Real looping player to measure instead of the CPU-burning stand-in")
+    idle_parser.add_argument('--latency', type=float, default=0.05, help="Stand-in server latency per request in seconds")
+    idle_parser.set_defaults(func=bench_idle)
+
+    cache_parser = subparsers.add_parser("cache", help="Hit rate, false hits and latency of the reply cache")
+    cache_parser.add_argument('--turns', type=int, default=60)
+    cache_parser.add_argument('--phrases', type=int, default=5, help="Number of recurring phrases")
+    cache_parser.add_argument('--repeat-share', type=float, default=0.6, help="Fraction of turns that say a recurring phrase")
+    cache_parser.add_argument('--noise', type=float, default=300.0, help="Max background noise (sample std dev)")
+    cache_parser.add_argument('--latency', type=float, default=0.8, help="Server latency per request in seconds")
+    cache_parser.add_argument('--seed', type=int, default=7)
+    cache_parser.set_defaults(func=bench_cache)
+
+    session_parser = subparsers.add_parser("session", help="Server context work with and without continuation tokens")
+    session_parser.add_argument('--turns', type=int, default=10)
+    session_parser.add_argument('--latency', type=float, default=0.05, help="Server latency per request in seconds")
+    session_parser.add_argument('--context-base', type=float, default=0.6, help="Seconds to rebuild the context")
+    session_parser.add_argument('--context-per-turn', type=float, default=0.05, help="Extra rebuild seconds per earlier turn")
+    session_parser.add_argument('--context-incremental', type=float, default=0.1, help="Seconds per turn with a valid token")
+    session_parser.set_defaults(func=bench_session)
+
+    parsed = parser.parse_args()
+    app_logger.set_level("WARNING") # Keep the result table readable
+    parsed.func(parsed)
@@ -0,0 +1,216 @@
+# calibrate_audio.py
+"""
+Finds the capture buffer size and sample rate that work best for a mic.
+
+For every supported rate (see check_audio_devices.py) and every candidate
+buffer size, a short capture trial runs while a synthetic CPU load keeps
+the other cores busy (like video decoding and uploads do during a turn).
+Each trial measures the overflow rate and the read jitter: how far the gap
+between two completed reads strays from the buffer period. A large jitter
+means the reader barely keeps up and will overflow under a bit more load.
+
+The chosen setting is the smallest buffer (lowest latency) with no
+overflows and a p95 jitter below half its period, preferring the
+configured SAMPLE_RATE. It is saved per device name to
+AUDIO_CALIBRATION_PATH, and audio_recorder applies it at startup.
+
+    python calibrate_audio.py [--device 2] [--buffers 256,512,1024,2048,4096] [--trial-s 3] [--load 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import config
+
+DEFAULT_BUFFER_SIZES = [256, 512, 1024, 2048, 4096]
+MIN_RATE = 16000 # Lower rates hurt speech recognition more than they help anything here
+_MAX_JITTER_FRACTION = 0.5 # Of the buffer period, at the 95th percentile
+
+
+def load_calibration(path=None):
+    """Returns {device_name: settings} from the calibration file ({} if there is none)."""
+    path = path or config.AUDIO_CALIBRATION_PATH
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def load_device_calibration(device_name, path=None):
+    """Returns the saved settings for device_name ({'sample_rate', 'frames_per_buffer', ...}) or None."""
+    return load_calibration(path).get(device_name)
+
+
+def save_device_calibration(device_name, settings, path=None):
+    path = path or config.AUDIO_CALIBRATION_PATH
+    calibration = load_calibration(path)
+    calibration[device_name] = settings
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(calibration, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def start_cpu_load(processes, duty):
+    """Starts busy-looping child processes, each keeping `duty` (0-1) of a core busy."""
+    busy_s, idle_s = duty * 0.01, (1 - duty) * 0.01
+    code = ("import time\n"
+            "while True:\n"
+            f"    end = time.monotonic() + {busy_s}\n"
+            "    while time.monotonic() < end: pass\n"
+            f"    time.sleep({idle_s})\n")
+    return [subprocess.Popen([sys.executable, '-c', code]) for _ in range(processes)]
+
+
+def stop_cpu_load(load_processes):
+    for process in load_processes:
+        process.kill()
+    for process in load_processes:
+        process.wait()
+
+
+def run_trial(p, pyaudio_module, device_index, rate, frames_per_buffer, channels, duration_s):
+    """Captures for duration_s and returns the trial's measurements (or {'error': ...} if the stream failed)."""
+    result = {'sample_rate': rate, 'frames_per_buffer': frames_per_buffer,
+              'buffer_ms': frames_per_buffer / rate * 1000}
+    try:
+        stream = p.open(format=config.PYAUDIO_FORMAT, channels=channels, rate=rate, input=True,
+                        input_device_index=device_index, frames_per_buffer=frames_per_buffer)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+    overflows = 0
+    read_times = []
+    try:
+        deadline = time.perf_counter() + duration_s
+        while time.perf_counter() < deadline:
+            try:
+                stream.read(frames_per_buffer, exception_on_overflow=True)
+            except IOError as e:
+                if e.errno == getattr(pyaudio_module, "paInputOverflowed", -9981) or e.errno == -9988:
+                    overflows += 1
+                    continue
+                raise
+            read_times.append(time.perf_counter())
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+    finally:
+        try:
+            if stream.is_active(): stream.stop_stream()
+            stream.close()
+        except Exception: pass
+
+    period_s = frames_per_buffer / rate
+    # The first reads drain whatever PortAudio buffered while the stream started
+    deviations = sorted(abs(later - earlier - period_s) * 1000
+                        for earlier, later in zip(read_times[2:], read_times[3:]))
+    result['reads'] = len(read_times)
+    result['overflows'] = overflows
+    result['overflows_per_min'] = overflows / duration_s * 60
+    result['jitter_p95_ms'] = deviations[min(len(deviations) - 1, int(len(deviations) * 0.95))] if deviations else 0.0
+    result['jitter_max_ms'] = deviations[-1] if deviations else 0.0
+    result['jitter_median_ms'] = statistics.median(deviations) if deviations else 0.0
+    return result
+
+
+def is_clean(trial):
+    return ('error' not in trial and trial['overflows'] == 0
+            and trial['jitter_p95_ms'] < trial['buffer_ms'] * _MAX_JITTER_FRACTION)
+
+
+def choose_best(trials, preferred_rate):
+    """Picks the lowest-latency clean trial, preferring preferred_rate; falls back to the fewest overflows."""
+    usable = [trial for trial in trials if 'error' not in trial]
+    if not usable:
+        return None
+    clean = [trial for trial in usable if is_clean(trial)]
+    if clean:
+        return min(clean, key=lambda t: (t['sample_rate'] != preferred_rate, t['buffer_ms'], t['jitter_p95_ms']))
+    return min(usable, key=lambda t: (t['overflows_per_min'], -t['buffer_ms']))
+
+
+def calibrate(device_index, buffer_sizes, rates, channels, trial_s, load_processes, load_duty):
+    import pyaudio
+    import check_audio_devices
+
+    p = pyaudio.PyAudio()
+    try:
+        device_info = check_audio_devices.get_input_device_info(p, device_index)
+        device_index = device_info['index']
+        device_name = device_info['name']
+        if not rates:
+            rates = [rate for rate in check_audio_devices.check_supported_rates(p, device_index, channels=channels)
+                     if rate >= MIN_RATE]
+        if not rates:
+            print(f"No supported capture rate found for '{device_name}'.")
+            return None
+        print(f"Calibrating '{device_name}' (index {device_index}): rates {rates}, buffers {buffer_sizes}, "
+              f"{trial_s:.0f}s per trial, load {load_processes} x {load_duty * 100:.0f}%")
+        print(f"{'rate':>6} {'buffer':>7} {'ms':>6} {'reads':>6} {'overflows':>10} {'jitter p95':>11} {'max':>8}")
+        trials = []
+        load = start_cpu_load(load_processes, load_duty)
+        try:
+            for rate in rates:
+                for frames_per_buffer in buffer_sizes:
+                    trial = run_trial(p, pyaudio, device_index, rate, frames_per_buffer, channels, trial_s)
+                    trials.append(trial)
+                    if 'error' in trial:
+                        print(f"{rate:>6} {frames_per_buffer:>7} {trial['buffer_ms']:>6.1f}  failed: {trial['error']}")
+                    else:
+                        print(f"{rate:>6} {frames_per_buffer:>7} {trial['buffer_ms']:>6.1f} {trial['reads']:>6} "
+                              f"{trial['overflows']:>10} {trial['jitter_p95_ms']:>9.2f}ms {trial['jitter_max_ms']:>6.1f}ms"
+                              f"{'' if is_clean(trial) else '  x'}")
+        finally:
+            stop_cpu_load(load)
+    finally:
+        p.terminate()
+
+    best = choose_best(trials, config.SAMPLE_RATE)
+    if best is None:
+        print("Every trial failed; nothing saved.")
+        return None
+    if not is_clean(best):
+        print("No setting was free of overflows under this load; saving the one with the fewest.")
+    settings = {
+        'sample_rate': best['sample_rate'],
+        'frames_per_buffer': best['frames_per_buffer'],
+        'overflows_per_min': best['overflows_per_min'],
+        'jitter_p95_ms': best['jitter_p95_ms'],
+        'calibrated_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'load': {'processes': load_processes, 'duty': load_duty},
+    }
+    return device_name, settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune capture buffer size and sample rate for a mic.")
+    parser.add_argument('--device', type=int, default=config.INPUT_DEVICE_INDEX, help="PyAudio input device index")
+    parser.add_argument('--buffers', type=lambda v: [int(b) for b in v.split(',')], default=DEFAULT_BUFFER_SIZES)
+    parser.add_argument('--rates', type=lambda v: [int(r) for r in v.split(',')], default=None,
+                        help="Rates to try (default: every supported rate from 16 kHz up)")
+    parser.add_argument('--trial-s', type=float, default=3.0, help="Capture time per trial")
+    parser.add_argument('--load', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Number of CPU-load processes during the trials")
+    parser.add_argument('--load-duty', type=float, default=0.8, help="Fraction of a core each load process keeps busy")
+    parser.add_argument('--dry-run', action='store_true', help="Measure and print, but don't save")
+    args = parser.parse_args()
+
+    result = calibrate(args.device, args.buffers, args.rates, config.CHANNELS, args.trial_s, args.load, args.load_duty)
+    if not result:
+        sys.exit(1)
+    device_name, settings = result
+    print(f"Best for '{device_name}': {settings['sample_rate']} Hz, {settings['frames_per_buffer']} frames per buffer "
+          f"({settings['frames_per_buffer'] / settings['sample_rate'] * 1000:.1f} ms).")
+    if not args.dry_run:
+        save_device_calibration(device_name, settings)
+        print(f"Saved to {config.AUDIO_CALIBRATION_PATH}; audio_recorder will use it from the next start.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# circuit_breaker.py
+"""
+Circuit breaker and adaptive timeouts for the upload webhook.
+
+After BREAKER_FAILURE_THRESHOLD consecutive failures (timeouts, connection
+errors, 5xx) the breaker opens: uploads fail immediately instead of
+blocking the user for the full timeout. While open, a background thread
+sends a cheap probe every BREAKER_PROBE_INTERVAL_S. A probe that gets an
+answer only makes the breaker half-open: the next real upload goes through
+as a trial (others still fail fast), and the breaker closes when that
+upload succeeds or opens again when it fails. A probe alone can't close it,
+since an endpoint can answer the probe (e.g. HEAD with a 404) while the
+upload itself still hangs.
+
+The read timeout follows recently measured request latencies (see
+get_timeouts()) but never drops below the old fixed 30 s; the connect
+timeout is fixed.
+"""
+import collections
+import threading
+import time
+
+import config
+import app_logger
+
+log = app_logger.get_logger(__name__)
+
+STATE_CLOSED = "CLOSED"
+STATE_OPEN = "OPEN"
+STATE_HALF_OPEN = "HALF_OPEN"
+
+_lock = threading.Lock()
+_state = STATE_CLOSED
+_consecutive_failures = 0
+_opened_at = None
+_trial_started_at = None # HALF_OPEN: when the trial upload was let through (None: not yet)
+_latencies = collections.deque(maxlen=config.UPLOAD_LATENCY_HISTORY) # Seconds, successful requests only
+_probe_function = None # Callable(connect_timeout, read_timeout) -> bool, set by audio_uploader
+_probe_thread = None
+
+
+def set_probe_function(probe_fn):
+    """Registers the cheap request used to detect that the endpoint has recovered."""
+    global _probe_function
+    _probe_function = probe_fn
+
+
+def is_open():
+    return _state == STATE_OPEN
+
+
+def get_state():
+    return _state
+
+
+def allow_request():
+    """True if a real upload should be attempted now (in HALF_OPEN: only the single trial upload)."""
+    global _trial_started_at
+    with _lock:
+        if _state == STATE_CLOSED:
+            return True
+        if _state == STATE_OPEN:
+            return False
+        # A trial that never reported back (e.g. an unexpected error before the request) must not block forever
+        trial_limit_s = config.UPLOAD_CONNECT_TIMEOUT_S + config.UPLOAD_READ_TIMEOUT_MAX_S
+        if _trial_started_at is not None and time.monotonic() - _trial_started_at < trial_limit_s:
+            return False
+        _trial_started_at = time.monotonic()
+    log.info("Circuit breaker HALF_OPEN: letting one upload through as a trial.")
+    return True
+
+
+def get_timeouts():
+    """
+    Returns (connect_timeout, read_timeout) for the next request.
+    The connect timeout is UPLOAD_CONNECT_TIMEOUT_S. The read timeout is the
+    slowest recent reply times UPLOAD_READ_TIMEOUT_MULTIPLIER, clamped to the
+    configured range; fast recent replies never pull it below the minimum,
+    since the next answer may legitimately take much longer. Until enough
+    samples exist the minimum is used, which matches the previous fixed behaviour.
+    """
+    with _lock:
+        slowest = max(_latencies) if len(_latencies) >= config.UPLOAD_LATENCY_MIN_SAMPLES else 0.0
+    read_timeout = min(max(slowest * config.UPLOAD_READ_TIMEOUT_MULTIPLIER, config.UPLOAD_READ_TIMEOUT_MIN_S),
+                       config.UPLOAD_READ_TIMEOUT_MAX_S)
+    return config.UPLOAD_CONNECT_TIMEOUT_S, read_timeout
+
+
+def record_success(latency_s=None):
+    """Called after the endpoint answered. latency_s is recorded for the adaptive timeouts if given."""
+    global _consecutive_failures
+    with _lock:
+        _consecutive_failures = 0
+        if latency_s is not None:
+            _latencies.append(latency_s)
+    if _state != STATE_CLOSED:
+        _close("an upload succeeded")
+
+
+def record_failure(reason):
+    """Called after a timeout, connection error or 5xx. Opens the breaker at the threshold."""
+    global _consecutive_failures
+    with _lock:
+        _consecutive_failures += 1
+        failures = _consecutive_failures
+    log.warning(f"Upload failure {failures}/{config.BREAKER_FAILURE_THRESHOLD}: {reason}")
+    if _state == STATE_HALF_OPEN:
+        _open("the trial upload failed")
+    elif failures >= config.BREAKER_FAILURE_THRESHOLD and _state == STATE_CLOSED:
+        _open(f"{failures} consecutive failures")
+
+
+def _open(why):
+    global _state, _opened_at, _probe_thread, _trial_started_at
+    with _lock:
+        if _state == STATE_OPEN:
+            return
+        if _state == STATE_CLOSED:
+            _opened_at = time.monotonic()
+        _state = STATE_OPEN
+        _trial_started_at = None
+    log.error(f"Circuit breaker OPEN ({why}): failing uploads fast, probing {config.UPLOAD_URL} "
+              f"every {config.BREAKER_PROBE_INTERVAL_S}s.")
+    if _probe_function and not (_probe_thread and _probe_thread.is_alive()):
+        _probe_thread = threading.Thread(target=_probe_worker, name="BreakerProbe")
+        _probe_thread.daemon = True
+        _probe_thread.start()
+
+
+def _half_open():
+    global _state, _trial_started_at
+    with _lock:
+        if _state != STATE_OPEN:
+            return
+        _state = STATE_HALF_OPEN
+        _trial_started_at = None
+    log.info("Circuit breaker HALF_OPEN: probe answered; the next upload is a trial.")
+
+
+def _close(why):
+    global _state, _consecutive_failures, _opened_at, _trial_started_at
+    with _lock:
+        if _state == STATE_CLOSED:
+            return
+        open_for = time.monotonic() - _opened_at if _opened_at else 0
+        _state = STATE_CLOSED
+        _consecutive_failures = 0
+        _opened_at = None
+        _trial_started_at = None
+    log.info(f"Circuit breaker CLOSED after {open_for:.1f}s: {why}.")
+
+
+def _probe_worker():
+    """Probes the endpoint while the breaker is open."""
+    while _state == STATE_OPEN:
+        time.sleep(config.BREAKER_PROBE_INTERVAL_S)
+        if _state != STATE_OPEN:
+            break
+        try:
+            healthy = _probe_function(config.UPLOAD_CONNECT_TIMEOUT_S, config.BREAKER_PROBE_TIMEOUT_S)
+        except Exception as e:
+            log.debug(f"Breaker probe failed: {e}")
+            healthy = False
+        if healthy:
+            _half_open()
+
+
+def reset():
+    """Closes the breaker and forgets failures and latency history (used by benchmarks)."""
+    global _state, _consecutive_failures, _opened_at, _trial_started_at
+    with _lock:
+        _state = STATE_CLOSED
+        _consecutive_failures = 0
+        _opened_at = None
+        _trial_started_at = None
+        _latencies.clear()
@@ -40,6 +40,21 @@ INPUT_DEVICE_INDEX = 2  # Your USB mic index, set after running check_audio_devi
 PYAUDIO_FORMAT = pyaudio.paInt16  # 16-bit audio
 FRAMES_PER_BUFFER = 1024        # Chunk size for PyAudio stream processing
 
+# Per-device capture settings measured by calibrate_audio.py (keyed by device name, since USB
+# device indexes can change). When the mic has an entry, audio_recorder uses its SAMPLE_RATE
+# and FRAMES_PER_BUFFER instead of the two values above.
+AUDIO_CALIBRATION_ENABLED = True
+AUDIO_CALIBRATION_PATH = os.path.join(os.path.expanduser("~"), ".talk_audio_calibration.json")
+
+# Capture backend: "thread" records in a thread of this process (original behaviour);
+# "process" records in a dedicated process that writes into a shared-memory ring, so
+# uploads, playback and logging in the main process can't cause input overflows.
+AUDIO_CAPTURE_BACKEND = "thread"
+CAPTURE_PROCESS_CPU_CORE = 3        # Core to pin the capture process to (None = no pinning)
+CAPTURE_PROCESS_RT_PRIORITY = None  # SCHED_FIFO priority 1-99 (needs CAP_SYS_NICE/rtprio limit), None = normal
+CAPTURE_RING_SECONDS = 120          # Size of the shared-memory ring; longer recordings keep only the latest audio
+CAPTURE_PROCESS_STOP_TIMEOUT_S = 5  # How long to wait for the capture process to acknowledge a stop
+
 # --- File Configuration ---
 TEMP_DIR = tempfile.gettempdir()
 TEMP_RECORDING_FILENAME = "mic_recording.wav" # Name for your microphone recording
@@ -48,6 +63,43 @@ TEMP_RESPONSE_FILENAME = "server_response.mp3" # Expecting MP3 from server
 # --- Network Configuration ---
 UPLOAD_URL = 'https://n8n.c-na.dev/webhook/talk' # Target URL for audio upload
 
+# Segmented upload: split long recordings at pauses and upload the segments in parallel.
+# The server must reassemble them using the 'upload_id', 'segment_index' and 'segment_count'
+# form fields (see stand_in_server.py) and reply on the request that completes the set.
+# WARNING: the n8n webhook at UPLOAD_URL does not do this yet. Enabling this against it breaks
+# every recording longer than UPLOAD_SEGMENT_THRESHOLD_S (each segment is treated as a whole
+# utterance). Keep it False until the webhook reassembles segments.
+UPLOAD_SEGMENTED = False
+UPLOAD_SEGMENT_THRESHOLD_S = 15.0 # Only recordings longer than this are segmented
+UPLOAD_SEGMENT_MAX_S = 10.0       # A segment is cut at the quietest point before this length...
+UPLOAD_SEGMENT_MIN_S = 4.0        # ...but not before this length
+UPLOAD_MAX_PARALLEL = 4           # Concurrent uploads (also the HTTP connection pool size)
+
+# Circuit breaker: after this many consecutive failures (timeout, connection error, 5xx)
+# uploads fail immediately with an error tone, and the endpoint is probed in the background.
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_PROBE_INTERVAL_S = 5.0
+BREAKER_PROBE_TIMEOUT_S = 3.0
+
+# Upload timeouts. The connect timeout is fixed: measured request latency includes the server's
+# think time, so it says nothing about the round trip. The read timeout never drops below
+# UPLOAD_READ_TIMEOUT_MIN_S (the old fixed 30 s, which covers a long LLM answer); it grows up to
+# the max when the slowest of the last UPLOAD_LATENCY_HISTORY replies, times the multiplier, needs more.
+UPLOAD_CONNECT_TIMEOUT_S = 5.0
+UPLOAD_LATENCY_HISTORY = 20
+UPLOAD_LATENCY_MIN_SAMPLES = 3
+UPLOAD_READ_TIMEOUT_MULTIPLIER = 2.0
+UPLOAD_READ_TIMEOUT_MIN_S = 30.0
+UPLOAD_READ_TIMEOUT_MAX_S = 90.0
+
+# Conversation session: every upload carries 'session_id', 'turn_seq' and, once the server has
+# sent one (X-Continuation-Token header), 'continuation_token' form fields, so the server can
+# reuse its per-conversation context instead of rebuilding it (see conversation_session.py).
+# Off by default: the current n8n webhook does not read these fields yet (the saving was measured
+# against stand_in_server.py). Enable it once the workflow keys its context on them.
+CONVERSATION_SESSION_ENABLED = False
+CONVERSATION_IDLE_EXPIRY_S = 300 # Without a turn for this long, the next turn starts a new conversation
+
 # --- Gamepad Configuration ---
 # OPTION 1 (MOST RELIABLE): Set this to a stable path from /dev/input/by-id/ for your gamepad
 # e.g., GAMEPAD_DEVICE_PATH = "/dev/input/by-id/bluetooth-MyControllerName-event-joystick"
@@ -60,6 +112,14 @@ GAMEPAD_DEVICE_PATH = None
 BTN_ACTION_START_STOP = ecodes.BTN_SOUTH # Typically 'A' on Xbox-style, 'X' on PlayStation
 BTN_ACTION_QUIT = ecodes.BTN_START   # Typically the 'Start' button
 
+# Batched input: wait with epoll, drain all pending events per read() and drop everything
+# except key-downs of the buttons above before any Python object is created (parses the raw
+# input_event structs itself; see gamepad_input.py). Opt-in: False uses evdev's read_loop().
+# The idle power mode and talk_daemon.py need it (the daemon turns it on by itself).
+GAMEPAD_BATCH_READ = False
+GAMEPAD_READ_BATCH_EVENTS = 64  # Events read per os.read() call
+GAMEPAD_STATS_INTERVAL_S = 60   # How often to log events/s processed vs acted on (DEBUG level); 0 = never
+
 # Timeout for interactive gamepad detection (in seconds)
 GAMEPAD_DETECT_TIMEOUT_S = 15
 
@@ -72,4 +132,60 @@ GAMEPAD_PREFERRED_NAME_KEYWORDS = ["gamepad", "joystick", "controller"]
 EXTERNAL_PLAYER_COMMAND = ['ffplay', '-autoexit', '-nodisp', '-loglevel', 'error']
 # Example for mpg123 (if you know it's always MP3 and want a simpler player):
 # EXTERNAL_PLAYER_COMMAND = ['mpg123', '-q'] # -q for quiet mode
+# Short tone played when a turn fails (upload error, or circuit breaker open)
+ERROR_TONE_ENABLED = True
+ERROR_TONE_FILENAME = "error_tone.wav" # Generated in TEMP_DIR on first use
+
+# --- Idle Power Configuration ---
+# After IDLE_RELEASE_AFTER_S in IDLE (no button pressed), idle_governor releases what keeps the
+# Pi busy and warm, and brings it back on the next press. 0 disables. Only active with
+# GAMEPAD_BATCH_READ = True (read_loop() never returns to check the idle time).
+IDLE_RELEASE_AFTER_S = 120
+IDLE_VIDEO_ACTION = "pause"  # "pause": freeze cvlc on its current frame (SIGSTOP; instant resume)
+                             # "stop": end cvlc and start the video again on resume (frees its memory too)
+IDLE_RELEASE_AUDIO = True    # Capture-process backend: terminate PyAudio in the child, re-initialize on resume
+IDLE_RELEASE_HTTP = True     # Close pooled connections; reconnect in the background on resume
+SOC_TEMP_PATH = "/sys/class/thermal/thermal_zone0/temp" # Millidegrees Celsius; used for the idle report
+
+# --- Reply Cache Configuration ---
+# Serves repeated short requests ("help", "what can you do") from a local cache, matched by an
+# audio fingerprint (see reply_cache.py). Only replies the server sends with Cache-Control: max-age
+# are cached, so it must leave that off for context-dependent answers ("repeat that").
+REPLY_CACHE_ENABLED = False
+REPLY_CACHE_MAX_ENTRIES = 64
+REPLY_CACHE_MAX_BYTES = 16 * 1024 * 1024   # Memory tier budget for reply audio
+REPLY_CACHE_MAX_TTL_S = 24 * 3600          # Upper bound on the server's max-age
+REPLY_CACHE_MATCH_THRESHOLD = 0.12         # Max fraction of differing fingerprint bits for a hit (a false hit plays the wrong reply)
+REPLY_CACHE_MAX_UTTERANCE_S = 6            # Longer requests (after trimming silence) are never cached
+REPLY_CACHE_DISK_DIR = None                # e.g. os.path.join(os.path.expanduser("~"), ".talk_reply_cache")
+REPLY_CACHE_DISK_MAX_BYTES = 64 * 1024 * 1024
+
+# --- Session Capture Configuration ---
+# When enabled, every turn (button timing, recorded WAV, server response and its latency)
+# is appended to SESSION_ARCHIVE_PATH for deterministic replay with replay_session.py.
+SESSION_RECORDING_ENABLED = False
+SESSION_ARCHIVE_PATH = os.path.join(os.path.expanduser("~"), "talk_sessions.talkarc")
+
+# --- Daemon Configuration ---
+# talk_daemon.py keeps the initialized engine resident; talk_launch.py (started by AI.sh)
+# attaches to it over this Unix socket. talk_launch.py builds the same default path (it does
+# not import this module so that it starts in tens of milliseconds); keep the two in sync.
+DAEMON_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "talk_daemon.sock")
+DAEMON_LOG_PATH = os.path.join(tempfile.gettempdir(), "talk_daemon.log") # Daemon output while no launcher is attached
+# While idle (no launcher attached) the daemon sleeps in accept(): no CPU use, but it keeps
+# its memory, the capture process with PyAudio initialized, the opened gamepad and the pooled
+# HTTP connection. These caps bound that cost: it exits after this long without a launcher,
+# or after a session that left its RSS above the limit. The next launch then starts it fresh.
+DAEMON_MAX_IDLE_S = 6 * 3600
+DAEMON_MAX_RSS_MB = 150
+
+# --- Logging Configuration ---
+# All modules log through app_logger: records go to a queue and a single writer thread
+# does the formatting and I/O, so the capture and input threads never block on stdout.
+LOG_LEVEL = "INFO"              # DEBUG, INFO, WARNING, ERROR
+LOG_QUEUE_MAX_RECORDS = 10000   # Records beyond this are dropped (and counted) instead of blocking
+LOG_RATE_LIMIT_LEVEL = "WARNING" # Only messages at this level and above are rate-limited (state changes pass through)
+LOG_RATE_LIMIT_WINDOW_S = 5.0   # Identical messages within this window are collapsed into one line with a count
+LOG_RATE_LIMIT_BURST = 1        # ...after this many of them have been written in the window
+LOG_FLUSH_INTERVAL_S = 1.0      # How often the writer thread flushes and summarises expired windows
 
@@ -0,0 +1,127 @@
+# conversation_session.py
+"""
+Conversation identity sent with every upload, so the server can keep
+per-conversation state instead of rebuilding the context on every turn.
+
+run_application_loop() starts a conversation; each upload then carries
+these form fields (segments of one upload share them):
+
+    session_id          random hex ID of the conversation
+    turn_seq            1, 2, 3, ... within the conversation
+    continuation_token  the token from the previous reply, if still valid
+
+The server may answer with an X-Continuation-Token header (and optionally
+X-Continuation-TTL in seconds); the token is sent back on the next turn
+until it expires. A stateless server simply ignores the fields.
+
+After CONVERSATION_IDLE_EXPIRY_S without a turn, the next turn starts a new
+conversation (new session_id, turn_seq 1, no token).
+
+While sessions are enabled audio_uploader does not use the reply cache:
+a turn answered locally never reaches the server, so its conversation
+context would silently miss it.
+"""
+import threading
+import time
+import uuid
+
+import config
+import app_logger
+
+log = app_logger.get_logger(__name__)
+
+TOKEN_HEADER = 'X-Continuation-Token'
+TOKEN_TTL_HEADER = 'X-Continuation-TTL'
+
+_lock = threading.Lock()
+_session_id = None
+_turn_seq = 0
+_token = None
+_token_expires_at = None
+_last_turn_at = None
+
+_stats = {'conversations': 0, 'turns': 0, 'turns_with_token': 0, 'tokens_received': 0, 'tokens_expired': 0}
+
+
+def start():
+    """Starts a new conversation: new session ID, sequence reset, token dropped."""
+    global _session_id, _turn_seq, _token, _token_expires_at, _last_turn_at
+    with _lock:
+        _session_id = uuid.uuid4().hex
+        _turn_seq = 0
+        _token = None
+        _token_expires_at = None
+        _last_turn_at = None
+        _stats['conversations'] += 1
+    log.info(f"Conversation {_session_id} started.")
+
+
+def begin_turn():
+    """Returns the form fields for the next upload ({} when disabled). Starts a new conversation if it expired."""
+    global _turn_seq, _token, _token_expires_at, _last_turn_at
+    if not config.CONVERSATION_SESSION_ENABLED:
+        return {}
+    now = time.monotonic()
+    if _session_id is None or (_last_turn_at is not None
+                               and now - _last_turn_at > config.CONVERSATION_IDLE_EXPIRY_S):
+        if _session_id is not None:
+            log.info(f"No turn for {now - _last_turn_at:.0f}s; starting a new conversation.")
+        start()
+    with _lock:
+        if _token is not None and _token_expires_at is not None and now >= _token_expires_at:
+            log.debug("Continuation token expired; the server will rebuild the context.")
+            _token = None
+            _token_expires_at = None
+            _stats['tokens_expired'] += 1
+        _turn_seq += 1
+        _last_turn_at = now
+        _stats['turns'] += 1
+        fields = {'session_id': _session_id, 'turn_seq': str(_turn_seq)}
+        if _token is not None:
+            fields['continuation_token'] = _token
+            _stats['turns_with_token'] += 1
+    return fields
+
+
+def note_response(headers):
+    """Keeps the continuation token from a reply's headers (a reply without one keeps the current token)."""
+    global _token, _token_expires_at, _last_turn_at
+    if not config.CONVERSATION_SESSION_ENABLED:
+        return
+    token = headers.get(TOKEN_HEADER)
+    now = time.monotonic()
+    with _lock:
+        _last_turn_at = now # The idle period starts when the reply arrived
+        if not token:
+            return
+        try:
+            ttl_s = float(headers.get(TOKEN_TTL_HEADER, config.CONVERSATION_IDLE_EXPIRY_S))
+        except ValueError:
+            ttl_s = config.CONVERSATION_IDLE_EXPIRY_S
+        _token = token
+        _token_expires_at = now + min(ttl_s, config.CONVERSATION_IDLE_EXPIRY_S)
+        _stats['tokens_received'] += 1
+
+
+def get_state():
+    """Returns (session_id, turn_seq, has_valid_token)."""
+    with _lock:
+        has_token = _token is not None and (_token_expires_at is None or time.monotonic() < _token_expires_at)
+        return _session_id, _turn_seq, has_token
+
+
+def get_stats():
+    with _lock:
+        return dict(_stats)
+
+
+def format_stats():
+    stats = get_stats()
+    return (f"{stats['conversations']} conversation(s), {stats['turns']} turns, "
+            f"{stats['turns_with_token']} sent with a continuation token, {stats['tokens_expired']} tokens expired")
+
+
+def reset_stats():
+    with _lock:
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,173 @@
+# gamepad_input.py
+"""
+Low-overhead gamepad input: waits with epoll, drains every pending event in
+one read() and filters raw input_event structs before anything is allocated.
+
+evdev's read_loop() wakes Python and builds an InputEvent for every EV_ABS
+and EV_SYN event, which an analog stick or gyro produces hundreds of times
+per second. Here the raw buffer is inspected through memoryviews; only
+key-down events for the buttons we act on become InputEvent objects.
+"""
+import os
+import select
+import struct
+import time
+from evdev import InputEvent, ecodes
+
+import config
+import app_logger
+
+log = app_logger.get_logger(__name__)
+
+# struct input_event { struct timeval time; __u16 type; __u16 code; __s32 value; }
+# The kernel writes the time as two C longs whatever the size of time_t: 32-bit userspace built
+# with 64-bit time_t gets __kernel_ulong_t __sec/__usec instead of a timeval, and a 64-bit kernel
+# writes the 32-bit layout for 32-bit processes. So native 'l' matches: 16 bytes on 32-bit, 24 on 64-bit.
+_EVENT_FORMAT = 'llHHi'
+_EVENT_SIZE = struct.calcsize(_EVENT_FORMAT)
+_TIMEVAL_SIZE = struct.calcsize('ll')
+# Positions of type/code (as u16) and value (as s32) inside one event, in units of those types
+_U16_PER_EVENT = _EVENT_SIZE // 2
+_TYPE_U16_INDEX = _TIMEVAL_SIZE // 2
+_CODE_U16_INDEX = _TYPE_U16_INDEX + 1
+_S32_PER_EVENT = _EVENT_SIZE // 4
+_VALUE_S32_INDEX = (_TIMEVAL_SIZE + 4) // 4
+_KEY_DOWN = 1
+_EV_MAX = 0x1f # linux/input-event-codes.h
+
+# --- Counters for the events/s report ---
+_events_processed = 0
+_events_acted_on = 0
+_stats_window_start = time.monotonic()
+_stats_window_processed = 0
+_stats_window_acted_on = 0
+
+
+def _filter_key_presses(buffer, n_events, key_codes):
+    """Returns (index, code) pairs of key-down events for key_codes in a raw event buffer."""
+    event_bytes = memoryview(buffer)[:n_events * _EVENT_SIZE]
+    u16_view = event_bytes.cast('H')
+    s32_view = event_bytes.cast('i')
+    matches = []
+    ev_key = ecodes.EV_KEY
+    for i in range(n_events):
+        base = i * _U16_PER_EVENT
+        if u16_view[base + _TYPE_U16_INDEX] != ev_key:
+            continue # EV_ABS / EV_SYN / EV_MSC: dropped without creating any object
+        code = u16_view[base + _CODE_U16_INDEX]
+        if code in key_codes and s32_view[i * _S32_PER_EVENT + _VALUE_S32_INDEX] == _KEY_DOWN:
+            matches.append((i, code))
+    u16_view.release()
+    s32_view.release()
+    event_bytes.release()
+    return matches
+
+
+def _check_event_layout(data):
+    """
+    Sanity check of _EVENT_FORMAT against the first batch read from a device: a layout mismatch
+    shows up as a read that isn't a whole number of events, an unknown event type or a
+    microsecond field out of range. Raises RuntimeError then, instead of acting on garbage.
+    """
+    problem = None
+    if len(data) % _EVENT_SIZE:
+        problem = f"read {len(data)} bytes, not a multiple of {_EVENT_SIZE}"
+    else:
+        for offset in range(0, len(data), _EVENT_SIZE):
+            _, usec, ev_type, _, _ = struct.unpack_from(_EVENT_FORMAT, data, offset)
+            if not 0 <= usec < 1000000 or ev_type > _EV_MAX:
+                problem = f"event at byte {offset} has type {ev_type}, usec {usec}"
+                break
+    if problem:
+        raise RuntimeError(f"Raw input_event layout '{_EVENT_FORMAT}' ({_EVENT_SIZE} bytes) does not match "
+                           f"this device ({problem}); set GAMEPAD_BATCH_READ = False to use evdev's read_loop().")
+
+
+def _update_stats(processed, acted_on):
+    global _events_processed, _events_acted_on, _stats_window_start, _stats_window_processed, _stats_window_acted_on
+    _events_processed += processed
+    _events_acted_on += acted_on
+    _stats_window_processed += processed
+    _stats_window_acted_on += acted_on
+    now = time.monotonic()
+    elapsed = now - _stats_window_start
+    if config.GAMEPAD_STATS_INTERVAL_S and elapsed >= config.GAMEPAD_STATS_INTERVAL_S:
+        log.debug(f"Gamepad input: {_stats_window_processed / elapsed:.1f} events/s processed, "
+                  f"{_stats_window_acted_on / elapsed:.2f} events/s acted on.")
+        _stats_window_start = now
+        _stats_window_processed = 0
+        _stats_window_acted_on = 0
+
+
+def get_input_stats():
+    """Returns (events_processed, events_acted_on) since the module was loaded."""
+    return _events_processed, _events_acted_on
+
+
+def drain_pending_events(device):
+    """Discards every event already queued on device (e.g. presses made in another app). Returns how many."""
+    batch_bytes = _EVENT_SIZE * config.GAMEPAD_READ_BATCH_EVENTS
+    discarded = 0
+    while True:
+        try:
+            data = os.read(device.fd, batch_bytes)
+        except BlockingIOError:
+            break
+        discarded += len(data) // _EVENT_SIZE
+        if len(data) < batch_bytes:
+            break
+    return discarded
+
+
+def iter_key_presses(device, key_codes, wake_fd=None, timeout_fn=None, batch_fn=None):
+    """
+    Yields an evdev InputEvent for each key-down of one of key_codes on device.
+    Raises OSError when the device goes away, like read_loop() does.
+    If wake_fd is given, the generator returns as soon as it becomes readable.
+    If timeout_fn is given, it is called before each wait and returns the wait timeout in
+    seconds (or None to wait indefinitely); when a wait times out, None is yielded.
+    If batch_fn is given, it is called with the raw bytes of every batch read (all events,
+    not just the key presses) before that batch's key presses are yielded.
+    The first batch is checked against the expected struct layout (RuntimeError on mismatch).
+    """
+    key_codes = frozenset(key_codes)
+    batch_bytes = _EVENT_SIZE * config.GAMEPAD_READ_BATCH_EVENTS
+    layout_checked = False
+    poller = select.epoll()
+    poller.register(device.fd, select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP)
+    if wake_fd is not None:
+        poller.register(wake_fd, select.EPOLLIN)
+    try:
+        while True:
+            timeout_s = timeout_fn() if timeout_fn else None
+            ready = poller.poll(-1 if timeout_s is None else max(timeout_s, 0))
+            if not ready:
+                yield None # Timeout tick
+                continue
+            for fd, poll_mask in ready:
+                if fd == wake_fd:
+                    return
+                if poll_mask & (select.EPOLLERR | select.EPOLLHUP) and not poll_mask & select.EPOLLIN:
+                    raise OSError(f"Input device {getattr(device, 'path', device.fd)} was disconnected.")
+            while True: # Drain everything that is pending, one read() per batch
+                try:
+                    data = os.read(device.fd, batch_bytes)
+                except BlockingIOError:
+                    break
+                if not data:
+                    raise OSError(f"Input device {getattr(device, 'path', device.fd)} returned end of file.")
+                if not layout_checked:
+                    _check_event_layout(data)
+                    layout_checked = True
+                n_events = len(data) // _EVENT_SIZE
+                matches = _filter_key_presses(data, n_events, key_codes)
+                _update_stats(n_events, len(matches))
+                if batch_fn:
+                    batch_fn(data)
+                for index, _ in matches:
+                    sec, usec, ev_type, code, value = struct.unpack_from(_EVENT_FORMAT, data, index * _EVENT_SIZE)
+                    yield InputEvent(sec, usec, ev_type, code, value)
+                if len(data) < batch_bytes:
+                    break # Short read: the kernel queue is empty
+    finally:
+        poller.close()
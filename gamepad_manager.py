@@ -12,6 +12,14 @@ import config
 import audio_recorder
 import audio_uploader
 import audio_player
+import conversation_session
+import gamepad_input
+import idle_governor
+import reply_cache
+import session_archive
+import app_logger
+
+log = app_logger.get_logger(__name__)
 
 # --- Application States ---
 STATE_IDLE = "IDLE"
@@ -19,16 +27,31 @@ STATE_LISTENING = "LISTENING"
 STATE_THINKING = "THINKING" 
 STATE_TALKING = "TALKING"  
 
+# Written by request_quit() to end run_application_loop() from another thread (batch-read mode only)
+_quit_request_read_fd, _quit_request_write_fd = os.pipe()
+os.set_blocking(_quit_request_read_fd, False)
+os.set_blocking(_quit_request_write_fd, False)
+
+def request_quit():
+    """Makes a running application loop finish as if Quit had been pressed. Used by talk_daemon."""
+    try: os.write(_quit_request_write_fd, b'q')
+    except OSError: pass # Pipe already holds a pending request
+
+def _clear_quit_requests():
+    try:
+        while os.read(_quit_request_read_fd, 64): pass
+    except BlockingIOError: pass
+
 def detect_gamepad_interactively(timeout_seconds=config.GAMEPAD_DETECT_TIMEOUT_S):
     # ... (This function remains the same as the last version you have - no changes needed here) ...
-    print(f"\n--- Interactive Gamepad Detection ---")
-    print(f"Please press ANY button on your desired gamepad within {timeout_seconds} seconds...")
-    print("Scanning for input devices...")
+    log.info(f"--- Interactive Gamepad Detection ---")
+    log.info(f"Please press ANY button on your desired gamepad within {timeout_seconds} seconds...")
+    log.info("Scanning for input devices...")
     monitored_devices_map = {}; opened_devices_for_cleanup = []
     try:
         all_device_paths = list_devices()
-        if not all_device_paths: print("No input devices found."); return None
-        # print(f"Found {len(all_device_paths)} potential input devices. Filtering for gamepads...") # Less verbose
+        if not all_device_paths: log.warning("No input devices found."); return None
+        # log.info(f"Found {len(all_device_paths)} potential input devices. Filtering for gamepads...") # Less verbose
         for path in all_device_paths:
             dev = None
             try:
@@ -48,32 +71,32 @@ def detect_gamepad_interactively(timeout_seconds=config.GAMEPAD_DETECT_TIMEOUT_S
             except Exception: 
                 pass
     except Exception as e:
-        print(f"Error listing/filtering devices: {e}.")
+        log.error(f"Error listing/filtering devices: {e}.")
         for dev_to_close in opened_devices_for_cleanup: 
             try: dev_to_close.close()
             except: pass
         return None
     if not monitored_devices_map:
-        print("No gamepad-like devices found to monitor."); 
+        log.warning("No gamepad-like devices found to monitor.")
         for dev_to_close in opened_devices_for_cleanup: 
             try: dev_to_close.close()
             except: pass
         return None
     
-    print(f"Monitoring {len(monitored_devices_map)} potential gamepad(s) for a button press...")
+    log.info(f"Monitoring {len(monitored_devices_map)} potential gamepad(s) for a button press...")
     readable_fds, _, _ = select.select(monitored_devices_map.keys(), [], [], timeout_seconds)
     detected_device_object = None
-    if not readable_fds: print(f"No gamepad press detected within {timeout_seconds}s.")
+    if not readable_fds: log.warning(f"No gamepad press detected within {timeout_seconds}s.")
     else:
         for fd in readable_fds:
             device_that_fired = monitored_devices_map[fd]
             try:
                 for event in device_that_fired.read(): 
                     if event.type == ecodes.EV_KEY and event.value == 1: # event.value == 1 is key_down
-                        print(f"\nButton press on: {device_that_fired.name} ({device_that_fired.path})")
+                        log.info(f"Button press on: {device_that_fired.name} ({device_that_fired.path})")
                         detected_device_object = device_that_fired; break 
                 if detected_device_object: break 
-            except Exception as e: print(f"Error reading from {device_that_fired.path}: {e}")
+            except Exception as e: log.error(f"Error reading from {device_that_fired.path}: {e}")
             if detected_device_object: break
             
     for fd_to_close, dev_to_close in monitored_devices_map.items():
@@ -119,7 +142,7 @@ def run_application_loop(gamepad_device_object):
     global current_app_state 
     
     gamepad = gamepad_device_object
-    print(f"\nApplication ready. Using gamepad: {gamepad.name}")
+    log.info(f"Application ready. Using gamepad: {gamepad.name}")
     
     # Get user-friendly button names for prompts
     start_stop_key_name = get_user_friendly_button_name(config.BTN_ACTION_START_STOP, 'BTN_SOUTH') # Prefer BTN_SOUTH if available
@@ -127,8 +150,8 @@ def run_application_loop(gamepad_device_object):
 
     current_app_state = STATE_IDLE
     #video_manager.start_looping_video(config.VIDEO_IDLE) 
-    print(f"--- STATE: {current_app_state} ---")
-    print(f"Controls: Press '{start_stop_key_name}' to Start/Stop. Press '{quit_key_name}' to Exit.")
+    log.info(f"--- STATE: {current_app_state} ---")
+    log.info(f"Controls: Press '{start_stop_key_name}' to Start/Stop. Press '{quit_key_name}' to Exit.")
 
     if not os.path.exists(config.TEMP_DIR):
         os.makedirs(config.TEMP_DIR, exist_ok=True)
@@ -136,80 +159,119 @@ def run_application_loop(gamepad_device_object):
     
     current_recording_thread = None
     should_quit_application = False
+    if config.CONVERSATION_SESSION_ENABLED:
+        conversation_session.start() # Every run (and every daemon attach) is a new conversation
+    idle_governor.on_activity() # Starts the idle period (and the CPU baseline for its report)
+
+    if config.GAMEPAD_BATCH_READ:
+        # Only key-downs of our two buttons reach Python objects; stick/gyro noise is dropped in bulk
+        _clear_quit_requests()
+        gamepad_events = gamepad_input.iter_key_presses(gamepad, (config.BTN_ACTION_START_STOP, config.BTN_ACTION_QUIT),
+                                                        wake_fd=_quit_request_read_fd,
+                                                        timeout_fn=idle_governor.wait_timeout,
+                                                        batch_fn=session_archive.note_input_batch if config.SESSION_RECORDING_ENABLED else None)
+    else:
+        if config.IDLE_RELEASE_AFTER_S:
+            log.info("Idle power mode is off: it needs GAMEPAD_BATCH_READ (read_loop() has no wait timeout).")
+        gamepad_events = gamepad.read_loop()
 
     try:
-        for event in gamepad.read_loop(): 
+        for event in gamepad_events: 
             if should_quit_application: break
+            if event is None: # Input wait timed out (batch mode): time to check the idle period
+                idle_governor.tick(current_app_state, STATE_IDLE)
+                continue
 
             if event.type == ecodes.EV_KEY:
                 key_event = categorize(event) 
                 # --- FIX for AttributeError: Use key_event.key_down (instance attribute) ---
                 # key_event.key_down is 1, key_event.key_up is 0, key_event.key_hold is 2
                 if key_event.keystate == key_event.key_down: # This checks if the button was just pressed
+                    idle_governor.on_activity() # Resumes released resources first if the idle period had passed
                     
                     if event.code == config.BTN_ACTION_QUIT:
-                        print(f"'{quit_key_name}' pressed. Signaling exit...")
+                        log.info(f"'{quit_key_name}' pressed. Signaling exit...")
                         should_quit_application = True
+                        session_archive.finish_quit_turn(event)
                         if current_app_state == STATE_LISTENING and current_recording_thread and current_recording_thread.is_alive():
-                            print("Stopping active recording before quitting...")
+                            log.info("Stopping active recording before quitting...")
                             audio_recorder._stop_event.set() 
                             current_recording_thread.join(timeout=2) 
                         break 
 
                     elif event.code == config.BTN_ACTION_START_STOP:
                         if current_app_state == STATE_IDLE:
-                            print(f"'{start_stop_key_name}' pressed in IDLE state.")
+                            log.info(f"'{start_stop_key_name}' pressed in IDLE state.")
+                            session_archive.begin_turn(event)
                             current_app_state = STATE_LISTENING
                             #video_manager.start_looping_video(config.VIDEO_LISTENING)
-                            print(f"--- STATE: {current_app_state} ---")
+                            log.info(f"--- STATE: {current_app_state} ---")
                             current_recording_thread = audio_recorder.start_recording_thread(config.TEMP_RECORDING_FILENAME)
                             if current_recording_thread:
-                                print(f"RECORDING STARTED. Press '{start_stop_key_name}' again to STOP.")
+                                log.info(f"RECORDING STARTED. Press '{start_stop_key_name}' again to STOP.")
                             else:
-                                print("Failed to start recording thread. Returning to IDLE.")
+                                log.error("Failed to start recording thread. Returning to IDLE.")
                                 current_app_state = STATE_IDLE
                                 #video_manager.start_looping_video(config.VIDEO_IDLE)
-                                print(f"--- STATE: {current_app_state} ---")
-                                print(f"Controls: Press '{start_stop_key_name}' to Start/Stop. Press '{quit_key_name}' to Exit.")
+                                log.info(f"--- STATE: {current_app_state} ---")
+                                log.info(f"Controls: Press '{start_stop_key_name}' to Start/Stop. Press '{quit_key_name}' to Exit.")
 
                         elif current_app_state == STATE_LISTENING:
-                            print(f"'{start_stop_key_name}' pressed in LISTENING state. Stopping recording...")
+                            log.info(f"'{start_stop_key_name}' pressed in LISTENING state. Stopping recording...")
+                            session_archive.note_event(event)
                             if audio_recorder.stop_and_save_recording(current_recording_thread, config.TEMP_RECORDING_FILENAME):
                                 if os.path.exists(temp_recording_full_path) and os.path.getsize(temp_recording_full_path) > 44:
                                     current_app_state = STATE_THINKING
                                     #video_manager.start_looping_video(config.VIDEO_THINKING)
-                                    print(f"--- STATE: {current_app_state} ---")
-                                    print("Uploading and waiting for server response...")
+                                    log.info(f"--- STATE: {current_app_state} ---")
+                                    log.info("Uploading and waiting for server response...")
                                     response_audio_path = audio_uploader.upload_audio(temp_recording_full_path)
+                                    session_archive.finish_turn(temp_recording_full_path, response_audio_path, audio_uploader.last_response_info)
                                     if response_audio_path:
                                         current_app_state = STATE_TALKING
                                         #video_manager.start_looping_video(config.VIDEO_TALKING)
-                                        print(f"--- STATE: {current_app_state} ---")
-                                        print("Playing server response...")
+                                        log.info(f"--- STATE: {current_app_state} ---")
+                                        log.info("Playing server response...")
                                         audio_player.play_audio_external(response_audio_path)
                                         try: os.remove(response_audio_path)
-                                        except OSError as e: print(f"Error removing response file: {e}")
-                                    else: print("No audio response or error during upload.")
+                                        except OSError as e: log.warning(f"Error removing response file: {e}")
+                                    else:
+                                        log.warning("No audio response or error during upload.")
+                                        audio_player.play_error_tone()
                                     try: os.remove(temp_recording_full_path)
-                                    except OSError as e: print(f"Error removing recording file: {e}")
-                                else: print(f"Recording file {temp_recording_full_path} invalid. Not uploading.")
-                            else: print("Failed to save recording or recording was empty.")
+                                    except OSError as e: log.warning(f"Error removing recording file: {e}")
+                                else: log.warning(f"Recording file {temp_recording_full_path} invalid. Not uploading.")
+                            else: log.warning("Failed to save recording or recording was empty.")
+                            session_archive.discard_turn() # No-op if finish_turn() already stored it
                             current_app_state = STATE_IDLE
                             #video_manager.start_looping_video(config.VIDEO_IDLE)
-                            print(f"--- STATE: {current_app_state} ---")
-                            print(f"Controls: Press '{start_stop_key_name}' to Start/Stop. Press '{quit_key_name}' to Exit.")
+                            log.info(f"--- STATE: {current_app_state} ---")
+                            log.info(f"Controls: Press '{start_stop_key_name}' to Start/Stop. Press '{quit_key_name}' to Exit.")
+                            idle_governor.on_activity() # The idle period starts when the turn ends
             if should_quit_application: break
     except KeyboardInterrupt: 
-        print("\nExiting application due to KeyboardInterrupt.")
+        log.info("Exiting application due to KeyboardInterrupt.")
         if current_app_state == STATE_LISTENING and current_recording_thread and current_recording_thread.is_alive():
-            print("Stopping active recording..."); audio_recorder._stop_event.set(); current_recording_thread.join(timeout=2)
+            log.info("Stopping active recording..."); audio_recorder._stop_event.set(); current_recording_thread.join(timeout=2)
     except OSError as e: 
-        print(f"OSError in gamepad read_loop (gamepad disconnected?): {e}")
+        log.error(f"OSError in gamepad read_loop (gamepad disconnected?): {e}")
     except Exception as e: 
-        print(f"Unexpected error in application loop: {e}"); import traceback; traceback.print_exc()
+        log.exception(f"Unexpected error in application loop: {e}")
     finally:
         #video_manager.stop_current_video() 
-        print("Application main loop finished.")
+        log.info("Application main loop finished.")
+        if current_app_state == STATE_LISTENING and current_recording_thread and current_recording_thread.is_alive():
+            log.info("Stopping active recording..."); audio_recorder._stop_event.set(); current_recording_thread.join(timeout=2)
+        if config.SESSION_RECORDING_ENABLED:
+            session_archive.flush()
+        if config.GAMEPAD_BATCH_READ:
+            events_processed, events_acted_on = gamepad_input.get_input_stats()
+            log.info(f"Gamepad events processed: {events_processed}, acted on: {events_acted_on}.")
+        if config.CONVERSATION_SESSION_ENABLED:
+            log.info(f"Conversation sessions: {conversation_session.format_stats()}.")
+        if config.REPLY_CACHE_ENABLED:
+            log.info(f"Reply cache: {reply_cache.format_stats()}.")
+            reply_cache.flush()
         if os.path.exists(temp_recording_full_path) and os.path.isfile(temp_recording_full_path):
             try: os.remove(temp_recording_full_path)
             except OSError: pass
@@ -0,0 +1,216 @@
+# idle_governor.py
+"""
+Idle power mode. After IDLE_RELEASE_AFTER_S without a button press in
+STATE_IDLE, releases what keeps the Pi busy and warm while nobody is
+talking, and restores it on the next press:
+
+- the looping cvlc video is frozen on its frame (SIGSTOP) or stopped,
+- the capture process terminates its PyAudio instance,
+- pooled HTTP connections are closed (reopened in the background on resume).
+
+gamepad_manager drives it: wait_timeout() sets how long the input wait may
+block, tick() is called when the wait times out, and on_activity() on
+every press (before the press is handled) and after every turn.
+
+Each release is measured: system CPU use and SoC temperature before and
+during the release, how long resume() itself took, and when each resource
+was ready again: the capture process acknowledging its PyAudio init, and
+warm_connection() finishing the reconnect. Both happen in the background
+while the press is handled; their times (from the press) are logged when
+they are ready and available from get_stats().
+
+With the "thread" capture backend there is no audio device to release:
+each recording opens and closes its own PyAudio instance. The release log
+says so.
+"""
+import threading
+import time
+
+import config
+import app_logger
+import audio_capture_process
+import audio_uploader
+import video_manager
+
+log = app_logger.get_logger(__name__)
+
+_last_activity = time.monotonic()
+_released = False
+_released_at = None
+_stopped_video_path = None # IDLE_VIDEO_ACTION "stop": the video to start again on resume
+_cpu_at_activity = None    # (busy_jiffies, total_jiffies) at the last activity
+_cpu_at_release = None
+_temp_at_release = None
+_pre_release_cpu_percent = None
+_audio_released = False
+_warm_threads = [] # Background re-initializations started by the last resume()
+
+_stats = {'releases': 0, 'released_s': 0.0, 'last_resume_ms': None, 'max_resume_ms': 0.0,
+          'last_audio_ready_ms': None, 'last_http_ready_ms': None,
+          'last_cpu_percent_before': None, 'last_cpu_percent_released': None,
+          'last_temp_at_release_c': None, 'last_temp_at_resume_c': None}
+
+
+def read_system_cpu():
+    """Returns (busy_jiffies, total_jiffies) for all CPUs from /proc/stat, or None."""
+    try:
+        with open('/proc/stat') as stat:
+            fields = [int(value) for value in stat.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0) # idle + iowait
+    return sum(fields) - idle, sum(fields)
+
+
+def cpu_percent_between(start, end):
+    if not start or not end or end[1] <= start[1]:
+        return None
+    return (end[0] - start[0]) / (end[1] - start[1]) * 100
+
+
+def read_soc_temp_c():
+    """Returns the SoC temperature in degrees Celsius, or None where there is no thermal zone."""
+    try:
+        with open(config.SOC_TEMP_PATH) as temp_file:
+            return int(temp_file.read().strip()) / 1000
+    except (OSError, ValueError):
+        return None
+
+
+def _format_temp(temp_c):
+    return f"{temp_c:.1f}°C" if temp_c is not None else "n/a"
+
+
+def _format_percent(percent):
+    return f"{percent:.1f}%" if percent is not None else "n/a"
+
+
+def wait_timeout():
+    """How long the input wait may block before tick() is due (None: no tick needed)."""
+    if not config.IDLE_RELEASE_AFTER_S or _released:
+        return None
+    return max(0.0, _last_activity + config.IDLE_RELEASE_AFTER_S - time.monotonic())
+
+
+def tick(app_state, idle_state):
+    """Called when the input wait timed out. Releases resources once the idle period is over."""
+    global _last_activity
+    if _released or not config.IDLE_RELEASE_AFTER_S:
+        return
+    if app_state != idle_state: # A long recording is not idle time; check again a full period later
+        _last_activity = time.monotonic()
+        return
+    if time.monotonic() - _last_activity >= config.IDLE_RELEASE_AFTER_S:
+        release()
+
+
+def on_activity():
+    """Called on every press and after every turn. Resumes if released. Returns the resume time in ms, or None."""
+    global _last_activity, _cpu_at_activity
+    resume_ms = resume() if _released else None
+    _last_activity = time.monotonic()
+    _cpu_at_activity = read_system_cpu()
+    return resume_ms
+
+
+def release():
+    global _released, _released_at, _stopped_video_path, _cpu_at_release, _temp_at_release, _pre_release_cpu_percent
+    global _audio_released
+    _cpu_at_release = read_system_cpu()
+    _temp_at_release = read_soc_temp_c()
+    _pre_release_cpu_percent = cpu_percent_between(_cpu_at_activity, _cpu_at_release)
+    released = []
+    not_released = []
+    if video_manager.current_video_process:
+        if config.IDLE_VIDEO_ACTION == "stop":
+            _stopped_video_path = video_manager.current_video_path
+            video_manager.stop_current_video()
+            released.append("video stopped")
+        elif video_manager.pause_current_video():
+            released.append("video paused")
+    _audio_released = config.IDLE_RELEASE_AUDIO and config.AUDIO_CAPTURE_BACKEND == "process"
+    if _audio_released:
+        audio_capture_process.release_audio_device()
+        released.append("audio device")
+    elif config.IDLE_RELEASE_AUDIO:
+        not_released.append("audio device (the thread capture backend holds none between recordings)")
+    if config.IDLE_RELEASE_HTTP:
+        audio_uploader.close_connections()
+        released.append("HTTP connections")
+    _released = True
+    _released_at = time.monotonic()
+    kept = f"; not released: {', '.join(not_released)}" if not_released else ""
+    log.info(f"Idle for {config.IDLE_RELEASE_AFTER_S}s: released {', '.join(released) or 'nothing'}{kept} "
+             f"(CPU {_format_percent(_pre_release_cpu_percent)} since last activity, SoC {_format_temp(_temp_at_release)}).")
+
+
+def _wait_until_ready(resource, started, wait_fn):
+    """Background thread: runs wait_fn (which returns once the resource is usable) and records when it was."""
+    ok = wait_fn()
+    ready_ms = (time.perf_counter() - started) * 1000
+    _stats[f'last_{resource}_ready_ms'] = ready_ms
+    if ok:
+        log.info(f"Resume: {resource} ready {ready_ms:.0f} ms after the press.")
+    else:
+        log.warning(f"Resume: {resource} not ready after {ready_ms:.0f} ms; the turn will initialize it itself.")
+
+
+def _wait_for_audio():
+    warmed = audio_capture_process.wait_for_warm_audio_device(config.CAPTURE_PROCESS_STOP_TIMEOUT_S)
+    return warmed is not None and not warmed[1]
+
+
+def resume():
+    """
+    Restores what release() let go of. Returns how long resume() itself took in ms; the
+    audio and HTTP re-initializations continue in the background (see wait_until_ready()).
+    """
+    global _released, _stopped_video_path, _warm_threads
+    started = time.perf_counter()
+    cpu_now = read_system_cpu()
+    video_manager.resume_current_video()
+    if _stopped_video_path:
+        video_manager.start_looping_video(_stopped_video_path)
+        _stopped_video_path = None
+    _stats['last_audio_ready_ms'] = _stats['last_http_ready_ms'] = None
+    _warm_threads = []
+    # The warm command is sent here, before the press is handled, so it reaches the child ahead of the recording
+    if _audio_released and audio_capture_process.warm_audio_device():
+        _warm_threads.append(threading.Thread(target=_wait_until_ready, args=("audio", started, _wait_for_audio),
+                                              name="AudioWarmUp", daemon=True))
+    if config.IDLE_RELEASE_HTTP:
+        _warm_threads.append(threading.Thread(target=_wait_until_ready,
+                                              args=("http", started, audio_uploader.warm_connection),
+                                              name="HttpWarmUp", daemon=True))
+    for thread in _warm_threads:
+        thread.start()
+    resume_ms = (time.perf_counter() - started) * 1000
+    _released = False
+
+    released_s = time.monotonic() - _released_at
+    released_cpu_percent = cpu_percent_between(_cpu_at_release, cpu_now)
+    temp_now = read_soc_temp_c()
+    _stats['releases'] += 1
+    _stats['released_s'] += released_s
+    _stats['last_resume_ms'] = resume_ms
+    _stats['max_resume_ms'] = max(_stats['max_resume_ms'], resume_ms)
+    _stats['last_cpu_percent_before'] = _pre_release_cpu_percent
+    _stats['last_cpu_percent_released'] = released_cpu_percent
+    _stats['last_temp_at_release_c'] = _temp_at_release
+    _stats['last_temp_at_resume_c'] = temp_now
+    log.info(f"Resumed from idle power mode in {resume_ms:.1f} ms after {released_s:.0f}s released "
+             f"({len(_warm_threads)} re-initialization(s) continue in the background): "
+             f"CPU {_format_percent(released_cpu_percent)} (was {_format_percent(_pre_release_cpu_percent)}), "
+             f"SoC {_format_temp(temp_now)} (was {_format_temp(_temp_at_release)} at release).")
+    return resume_ms
+
+
+def wait_until_ready(timeout=None):
+    """Blocks until the re-initializations started by the last resume() have finished (used by bench.py)."""
+    for thread in _warm_threads:
+        thread.join(timeout)
+
+
+def get_stats():
+    """Returns a copy of the release/resume measurements."""
+    return dict(_stats)
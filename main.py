@@ -8,53 +8,65 @@ import sys
 import config         
 import gamepad_manager 
 import video_manager # Import for cleanup
+import audio_capture_process
+import app_logger
 from evdev import InputDevice 
 
-def run_application():
-    print("AI Audio Chatter with Video States - Initializing...")
-    print("----------------------------------------------------")
+log = app_logger.get_logger(__name__)
+
+def open_gamepad():
+    """Opens the configured gamepad, falling back to interactive detection. Returns the device or None."""
     active_gamepad_device = None 
 
     if config.GAMEPAD_DEVICE_PATH and os.path.exists(config.GAMEPAD_DEVICE_PATH):
-        print(f"Attempting user-configured GAMEPAD_DEVICE_PATH: {config.GAMEPAD_DEVICE_PATH}")
+        log.info(f"Attempting user-configured GAMEPAD_DEVICE_PATH: {config.GAMEPAD_DEVICE_PATH}")
         try:
             active_gamepad_device = InputDevice(config.GAMEPAD_DEVICE_PATH)
-            print(f"Successfully opened configured gamepad: {active_gamepad_device.name}")
+            log.info(f"Successfully opened configured gamepad: {active_gamepad_device.name}")
         except Exception as e:
-            print(f"Could not open '{config.GAMEPAD_DEVICE_PATH}': {e}")
+            log.error(f"Could not open '{config.GAMEPAD_DEVICE_PATH}': {e}")
             active_gamepad_device = None
     elif config.GAMEPAD_DEVICE_PATH: 
-        print(f"User-configured GAMEPAD_DEVICE_PATH '{config.GAMEPAD_DEVICE_PATH}' does not exist.")
+        log.warning(f"User-configured GAMEPAD_DEVICE_PATH '{config.GAMEPAD_DEVICE_PATH}' does not exist.")
 
     if not active_gamepad_device:
-        if config.GAMEPAD_DEVICE_PATH: print("Falling back to interactive gamepad detection...")
-        else: print("GAMEPAD_DEVICE_PATH not set in config.py. Starting interactive detection...")
+        if config.GAMEPAD_DEVICE_PATH: log.info("Falling back to interactive gamepad detection...")
+        else: log.info("GAMEPAD_DEVICE_PATH not set in config.py. Starting interactive detection...")
         active_gamepad_device = gamepad_manager.detect_gamepad_interactively()
+    return active_gamepad_device
+
+def run_application():
+    log.info("AI Audio Chatter with Video States - Initializing...")
+    log.info("----------------------------------------------------")
+    active_gamepad_device = open_gamepad()
 
     if not active_gamepad_device:
-        print("CRITICAL: NO GAMEPAD COULD BE IDENTIFIED. Please check connections and config.")
+        log.critical("NO GAMEPAD COULD BE IDENTIFIED. Please check connections and config.")
         sys.exit(1)
     
-    print(f"Using gamepad: {active_gamepad_device.name} ({active_gamepad_device.path})")
-    print("----------------------------------------------------")
+    log.info(f"Using gamepad: {active_gamepad_device.name} ({active_gamepad_device.path})")
+    log.info("----------------------------------------------------")
     if config.INPUT_DEVICE_INDEX is None:
-        print("Warning: INPUT_DEVICE_INDEX not set. Using default PyAudio input for microphone.")
+        log.warning("INPUT_DEVICE_INDEX not set. Using default PyAudio input for microphone.")
     else:
-        print(f"Using microphone input device index: {config.INPUT_DEVICE_INDEX}")
-    print("----------------------------------------------------")
+        log.info(f"Using microphone input device index: {config.INPUT_DEVICE_INDEX}")
+    if config.AUDIO_CAPTURE_BACKEND == "process":
+        audio_capture_process.ensure_capture_process() # Start early so the first recording doesn't pay for it
+    log.info("----------------------------------------------------")
 
     try:
         gamepad_manager.run_application_loop(active_gamepad_device) 
     except Exception as e: 
-        print(f"A critical error occurred: {e}")
-        import traceback; traceback.print_exc()
+        log.exception(f"A critical error occurred: {e}")
     finally:
-        print("Exiting application. Cleaning up video...")
+        log.info("Exiting application. Cleaning up video...")
         video_manager.stop_current_video() # Ensure video is stopped
+        audio_capture_process.shutdown_capture_process()
         if active_gamepad_device: 
             try: active_gamepad_device.close()
             except Exception: pass
-        print("Application has exited.")
+        log.info("Application has exited.")
+        app_logger.stop_logging() # Flush anything still queued (including rate-limit summaries)
 
 if __name__ == "__main__":
     run_application()
@@ -0,0 +1,205 @@
+# replay_session.py
+"""
+Replays a session archive (see session_archive.py) through the real
+application loop for deterministic performance comparisons.
+
+Each archived turn is fed back with its original timing: the idle gap
+before the turn, every raw gamepad batch read during the turn (presses,
+stick/gyro noise and the way events were batched; archives without them
+fall back to the start and stop presses), and the recorded PCM through a
+stand-in microphone. A turn that ended with Quit ends the replay the same
+way. The local stand-in server answers with the recorded response after
+the recorded server latency, so two client builds see identical input and
+identical server behaviour. Failed uploads are reproduced too: an HTTP
+error gets its recorded status, a timeout is held without an answer until
+the client gives up, and a connection error or an open circuit breaker
+gets its connection closed without an answer. The reply cache and conversation sessions are
+turned off, since either would change which requests reach the server.
+
+    python replay_session.py ~/talk_sessions.talkarc --report after.json --compare before.json
+"""
+import argparse
+import base64
+import io
+import json
+import statistics
+import tempfile
+import time
+import wave
+
+import stand_in_devices
+
+_replay_pcm = {'data': b'', 'offset': 0}
+
+
+def _next_pcm(nbytes):
+    """Stand-in microphone source: the current turn's recorded PCM, then silence."""
+    offset = _replay_pcm['offset']
+    _replay_pcm['offset'] = offset + nbytes
+    return _replay_pcm['data'][offset:offset + nbytes]
+
+
+stand_in_devices.install_stand_in_audio(_next_pcm) # Before audio_recorder is imported (it opens PyAudio at import)
+
+import config
+import app_logger
+import audio_player
+import audio_recorder
+import audio_uploader
+import circuit_breaker
+import session_archive
+import stand_in_driver
+import stand_in_server
+
+METRICS = ('save_s', 'response_s', 'playback_s', 'stop_to_idle_s')
+
+
+def _timed(module, function_name, metrics, key):
+    """Wraps module.function_name so each call's duration is stored in metrics[key] for the current turn."""
+    original = getattr(module, function_name)
+
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            if metrics:
+                metrics[-1][key] = time.perf_counter() - started
+    setattr(module, function_name, wrapper)
+
+
+def _send_input_batches(gamepad, batches):
+    """Writes each recorded batch at its recorded offset (relative to the first). Returns when the last was written."""
+    started = time.perf_counter()
+    first_offset = batches[0][0]
+    for offset, encoded in batches:
+        time.sleep(max(0.0, started + offset - first_offset - time.perf_counter()))
+        gamepad.send_raw(base64.b64decode(encoded))
+
+
+def recorded_reply(response, response_bytes, no_server_timing=False):
+    """The stand-in server's (status, body, content_type, delay_s) for an archived upload outcome."""
+    latency_s = 0 if no_server_timing else response.get('latency_s', 0)
+    error = response.get('error')
+    if error == 'timeout': # Hold the request until the client's own read timeout has fired
+        return None, b'', None, circuit_breaker.get_timeouts()[1] + 1
+    if error and error != 'http': # Connection error, breaker open, ...: no answer at all
+        return None, b'', None, 0
+    return (response.get('status', 200), response_bytes, response.get('content_type') or 'audio/mpeg', latency_s)
+
+
+def drive_replay(gamepad, archive_path, index, args, current, metrics):
+    """Driver: replays each archived turn with its recorded timing."""
+    turns = index[:args.turns or None]
+    for turn_number, entry in enumerate(turns, start=1):
+        meta, wav_bytes, response_bytes = session_archive.read_turn(archive_path, entry)
+        _replay_pcm['data'] = b''
+        if wav_bytes: # Quit turns have no recording
+            with wave.open(io.BytesIO(wav_bytes), 'rb') as wf:
+                config.SAMPLE_RATE = wf.getframerate()
+                config.CHANNELS = wf.getnchannels()
+                _replay_pcm['data'] = wf.readframes(wf.getnframes())
+        _replay_pcm['offset'] = 0
+        current['reply'] = recorded_reply(meta.get('response', {}), response_bytes, args.no_server_timing)
+
+        idle_gap = min(meta.get('idle_before_s') or 0, args.max_idle_s) / args.speed
+        time.sleep(idle_gap)
+        if meta.get('quit'): # The user quit during this turn; the recorded input ends the loop
+            print(f"turn {turn_number:>4}/{len(turns)}  quit", flush=True)
+            if meta.get('input_batches'):
+                _send_input_batches(gamepad, meta['input_batches'])
+            return
+        metrics.append({'turn': turn_number})
+        if meta.get('input_batches'):
+            _send_input_batches(gamepad, meta['input_batches']) # The last batch holds the stop press
+        else:
+            press_times = [t for t, _ in meta['events']]
+            stop_after = (press_times[-1] if len(press_times) > 1 else len(_replay_pcm['data']) / (2.0 * config.CHANNELS * config.SAMPLE_RATE))
+            stand_in_driver.press_turn(gamepad, stop_after)
+        stop_pressed = time.perf_counter()
+        stand_in_driver.wait_for_turn_end()
+        metrics[-1]['stop_to_idle_s'] = time.perf_counter() - stop_pressed
+        print(f"turn {turn_number:>4}/{len(turns)}  " +
+              "  ".join(f"{m} {metrics[-1].get(m, float('nan')):.3f}" for m in METRICS), flush=True)
+
+
+def summarize(metrics):
+    summary = {}
+    for metric in METRICS:
+        values = sorted(m[metric] for m in metrics if metric in m)
+        if values:
+            summary[metric] = {'median': statistics.median(values),
+                               'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+                               'count': len(values)}
+    return summary
+
+
+def print_comparison(summary, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['summary']
+    print(f"Comparison with {baseline_path}:")
+    print(f"  {'metric':<15} {'baseline':>9} {'current':>9} {'change':>8}   (medians, seconds)")
+    for metric in METRICS:
+        if metric in summary and metric in baseline:
+            before, after = baseline[metric]['median'], summary[metric]['median']
+            change = (after - before) / before * 100 if before else 0.0
+            print(f"  {metric:<15} {before:>9.3f} {after:>9.3f} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a session archive through the application loop.")
+    parser.add_argument('archive', nargs='?', default=config.SESSION_ARCHIVE_PATH)
+    parser.add_argument('--turns', type=int, default=0, help="Replay only the first N turns (0 = all)")
+    parser.add_argument('--speed', type=float, default=1.0, help="Divide idle gaps between turns by this factor")
+    parser.add_argument('--max-idle-s', type=float, default=5.0, help="Cap on the idle gap before each turn")
+    parser.add_argument('--no-server-timing', action='store_true', help="Reply immediately instead of with the recorded latency")
+    parser.add_argument('--player-cmd', default="true", help="Stand-in for ffplay (the file path is appended)")
+    parser.add_argument('--report', help="Write per-turn metrics and summary to this JSON file")
+    parser.add_argument('--compare', help="Baseline report JSON to compare against")
+    args = parser.parse_args()
+
+    index = session_archive.read_index(args.archive)
+    if not index:
+        print(f"No turns in {args.archive}.")
+        return
+    print(f"Replaying {min(len(index), args.turns or len(index))} of {len(index)} turns from {args.archive}")
+
+    app_logger.set_level("WARNING")
+    current = {'reply': (200, b'', 'audio/mpeg', 0)}
+    server = stand_in_server.start_server()
+    server.responder = lambda fields: current['reply']
+    config.UPLOAD_URL = server.url
+    config.TEMP_DIR = tempfile.mkdtemp(prefix="talk_replay_")
+    config.EXTERNAL_PLAYER_COMMAND = args.player_cmd.split()
+    config.AUDIO_CAPTURE_BACKEND = "thread" # The stand-in microphone lives in this process
+    config.SESSION_RECORDING_ENABLED = False
+    config.REPLY_CACHE_ENABLED = False # A cache hit would skip the upload the archive recorded
+    config.CONVERSATION_SESSION_ENABLED = False # No session fields or tokens: every replayed request is the same
+
+    metrics = []
+    _timed(audio_recorder, 'stop_and_save_recording', metrics, 'save_s')
+    _timed(audio_uploader, 'upload_audio', metrics, 'response_s')
+    _timed(audio_player, 'play_audio_external', metrics, 'playback_s')
+
+    gamepad = stand_in_devices.StandInGamepad()
+    try:
+        errors = stand_in_driver.run_driven(gamepad, drive_replay, (args.archive, index, args, current, metrics),
+                                            name="ReplayDriver")
+    finally:
+        stand_in_server.stop_server(server)
+
+    for error in errors:
+        print(f"Replay error: {error}")
+    summary = summarize(metrics)
+    for metric, stats in summary.items():
+        print(f"  {metric:<15} median {stats['median']:.3f}s  p95 {stats['p95']:.3f}s  (n={stats['count']})")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'archive': args.archive, 'turns': metrics, 'summary': summary}, f, indent=2)
+    if args.compare:
+        print_comparison(summary, args.compare)
+    app_logger.stop_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+# reply_cache.py
+"""
+Optional local cache of server replies for repeated spoken requests
+("what can you do", "help", ...), so they skip the round trip.
+
+Recordings are matched by an audio fingerprint instead of their bytes: the
+PCM is trimmed to the speech (energy-based VAD), split into log-spaced
+frequency bands and resampled to a fixed number of time steps. One bit per
+band and step says whether that band is louder than the average band of
+the step, so the bits describe the shape of the spectrum over time and not
+how loud it was. Two recordings of the same phrase differ in loudness,
+noise and pauses around it but keep almost all bits; a lookup is a hit when
+at most REPLY_CACHE_MATCH_THRESHOLD of the bits differ and the trimmed
+durations are similar. Recordings whose spectrum barely changes (a held
+sound, a hum) are not cached, since they can't be told apart reliably.
+
+Replies are kept in a size-bounded LRU with a TTL, optionally backed by a
+directory on disk that survives restarts. Only the server knows whether a
+reply depends on more than the words (the conversation so far, as for
+"repeat that"), so only replies it marks cacheable are stored: its
+Cache-Control must carry a max-age (capped at REPLY_CACHE_MAX_TTL_S), and
+"no-store" or "no-cache" always win. A reply without Cache-Control is
+never cached. audio_uploader does not use the cache while conversation
+sessions are enabled (see conversation_session.py): the server has to see
+every turn of a conversation.
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import config
+import app_logger
+import audio_segmenter
+
+log = app_logger.get_logger(__name__)
+
+# --- Fingerprint parameters ---
+_FRAME_S = 0.032            # Spectral frame length (hop is half of it)
+_N_BANDS = 16               # Log-spaced bands between _LOW_HZ and _HIGH_HZ
+_LOW_HZ = 100
+_HIGH_HZ = 4000
+_N_STEPS = 32               # Time steps after resampling (16 x 32 = 512 bits)
+_FLOOR = 1e-4               # Band energies are floored at this fraction of the loudest one (noise)
+_MIN_BIT_CHANGES = 0.03     # Fraction of bits that must flip between steps for a usable fingerprint
+_VAD_WINDOW_S = 0.02
+_VAD_REL_THRESHOLD = 0.1    # Speech windows are above this fraction of the loudest windows' energy
+_MIN_SPEECH_S = 0.25
+_MAX_DURATION_RATIO = 1.35  # Trimmed durations of a match must be within this factor
+
+_lock = threading.Lock()
+_entries = collections.OrderedDict() # key -> entry dict, least recently used first
+_memory_bytes = 0
+_disk_index = None # key -> metadata of entries stored in REPLY_CACHE_DISK_DIR (loaded on first use)
+_disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ReplyCacheDisk") # Keeps disk writes off the turn
+_stats = {'lookups': 0, 'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'stores': 0, 'not_stored': 0, 'skipped': 0}
+
+
+# --- Fingerprint ---
+
+def _read_mono(filepath, max_duration_s):
+    """Returns (float32 mono samples, samplerate); samples is None for non-16-bit or overlong files."""
+    with wave.open(filepath, 'rb') as wf:
+        params = wf.getparams()
+        if params.sampwidth != 2 or params.nframes > params.framerate * max_duration_s:
+            return None, params.framerate
+        pcm = wf.readframes(params.nframes)
+    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+    if params.nchannels > 1:
+        samples = samples.reshape(-1, params.nchannels).mean(axis=1)
+    return samples, params.framerate
+
+
+def _trim_to_speech(samples, samplerate):
+    """Cuts leading and trailing non-speech windows. Returns the trimmed samples (may be empty)."""
+    energy = audio_segmenter.window_rms(samples, samplerate, _VAD_WINDOW_S)
+    if len(energy) == 0:
+        return samples[:0]
+    loud = np.percentile(energy, 95)
+    speech = np.flatnonzero(energy > max(loud * _VAD_REL_THRESHOLD, np.percentile(energy, 10) * 2, 1.0))
+    if len(speech) == 0:
+        return samples[:0]
+    window = max(1, int(samplerate * _VAD_WINDOW_S))
+    return samples[speech[0] * window:(speech[-1] + 1) * window]
+
+
+def compute_fingerprint(filepath):
+    """
+    Returns (fingerprint, speech_duration_s) for a 16-bit WAV, where fingerprint is a packed
+    uint8 array, or None if there is no speech, it is longer than REPLY_CACHE_MAX_UTTERANCE_S
+    or its spectrum barely changes over time.
+    """
+    # Silence around the phrase is trimmed below, so allow some before reading the file
+    samples, samplerate = _read_mono(filepath, config.REPLY_CACHE_MAX_UTTERANCE_S * 2)
+    if samples is None:
+        return None
+    speech = _trim_to_speech(samples, samplerate)
+    duration_s = len(speech) / samplerate
+    if duration_s < _MIN_SPEECH_S or duration_s > config.REPLY_CACHE_MAX_UTTERANCE_S:
+        return None
+
+    frame = int(samplerate * _FRAME_S)
+    hop = frame // 2
+    n_frames = 1 + (len(speech) - frame) // hop
+    if n_frames < _N_STEPS:
+        return None
+    frames = np.lib.stride_tricks.as_strided(speech, shape=(n_frames, frame),
+                                             strides=(speech.strides[0] * hop, speech.strides[0]))
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(frame), axis=1)) ** 2
+    frequencies = np.fft.rfftfreq(frame, 1.0 / samplerate)
+    edges = np.geomspace(_LOW_HZ, _HIGH_HZ, _N_BANDS + 1)
+    band_of_bin = np.digitize(frequencies, edges) - 1
+    band_matrix = (band_of_bin[:, None] == np.arange(_N_BANDS)[None, :]).astype(np.float32) # bins -> bands
+    bands = spectrum @ band_matrix
+    bands = np.log(bands + bands.max() * _FLOOR + 1e-9)
+    # Fixed number of time steps, so speaking slightly faster or slower keeps the same layout
+    steps = np.array([chunk.mean(axis=0) for chunk in np.array_split(bands, _N_STEPS)])
+    steps -= steps.mean(axis=1, keepdims=True) # Removes the loudness of each step (gain, distance to the mic)
+    bits = steps > 0
+    if np.mean(bits[1:] != bits[:-1]) < _MIN_BIT_CHANGES:
+        return None # A held sound or hum: too little structure to tell phrases apart
+    return np.packbits(bits.ravel()), duration_s
+
+
+def fingerprint_distance(a, b):
+    """Fraction of differing bits between two packed fingerprints."""
+    return np.unpackbits(np.bitwise_xor(a, b)).sum() / (len(a) * 8)
+
+
+def _matches(fingerprint, duration_s, entry):
+    ratio = max(duration_s, entry['duration_s']) / max(min(duration_s, entry['duration_s']), 1e-6)
+    return (ratio <= _MAX_DURATION_RATIO and len(fingerprint) == len(entry['fingerprint'])
+            and fingerprint_distance(fingerprint, entry['fingerprint']) <= config.REPLY_CACHE_MATCH_THRESHOLD)
+
+
+# --- Cache-Control ---
+
+def ttl_from_cache_control(header_value):
+    """Returns the TTL in seconds to cache a reply for, or None if the server did not mark it cacheable."""
+    ttl = None
+    for directive in (header_value or "").lower().split(','):
+        name, _, value = directive.strip().partition('=')
+        if name in ("no-store", "no-cache"):
+            return None
+        if name in ("max-age", "s-maxage"):
+            try:
+                ttl = int(value.strip().strip('"'))
+            except ValueError:
+                continue
+    if ttl is None or ttl <= 0:
+        return None
+    return min(ttl, config.REPLY_CACHE_MAX_TTL_S)
+
+
+# --- Memory and disk tiers ---
+
+def _evict_memory():
+    global _memory_bytes
+    while _entries and (len(_entries) > config.REPLY_CACHE_MAX_ENTRIES or _memory_bytes > config.REPLY_CACHE_MAX_BYTES):
+        _, evicted = _entries.popitem(last=False)
+        _memory_bytes -= len(evicted['audio'])
+
+
+def _disk_paths(key):
+    return (os.path.join(config.REPLY_CACHE_DISK_DIR, f"{key}.json"),
+            os.path.join(config.REPLY_CACHE_DISK_DIR, f"{key}.reply"))
+
+
+def _load_disk_index():
+    """Reads the metadata (not the audio) of every entry on disk, once."""
+    global _disk_index
+    if _disk_index is not None or not config.REPLY_CACHE_DISK_DIR:
+        return
+    _disk_index = {}
+    try:
+        names = os.listdir(config.REPLY_CACHE_DISK_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(config.REPLY_CACHE_DISK_DIR, name)) as f:
+                meta = json.load(f)
+            meta['fingerprint'] = np.frombuffer(bytes.fromhex(meta['fingerprint']), dtype=np.uint8)
+            _disk_index[name[:-len(".json")]] = meta
+        except (OSError, ValueError, KeyError) as e:
+            log.warning(f"Ignoring unreadable reply cache entry {name}: {e}")
+
+
+def _write_to_disk(key, entry):
+    try:
+        os.makedirs(config.REPLY_CACHE_DISK_DIR, exist_ok=True)
+        meta_path, audio_path = _disk_paths(key)
+        with open(audio_path, 'wb') as f:
+            f.write(entry['audio'])
+        meta = {'fingerprint': entry['fingerprint'].tobytes().hex(), 'duration_s': entry['duration_s'],
+                'content_type': entry['content_type'], 'expires_at': entry['expires_at'], 'size': len(entry['audio'])}
+        with open(f"{meta_path}.tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(f"{meta_path}.tmp", meta_path) # The metadata appears last: readers never see half an entry
+        meta['fingerprint'] = entry['fingerprint']
+        with _lock:
+            if _disk_index is None:
+                return # clear() ran meanwhile; the entry is picked up on the next index load
+            _disk_index[key] = meta
+        _evict_disk()
+    except OSError as e:
+        log.warning(f"Could not write reply cache entry to {config.REPLY_CACHE_DISK_DIR}: {e}")
+
+
+def _remove_from_disk(key):
+    for path in _disk_paths(key):
+        try: os.remove(path)
+        except OSError: pass
+    _disk_index.pop(key, None)
+
+
+def _evict_disk():
+    """Drops expired entries, then the least recently used ones, until the disk tier fits its budget."""
+    now = time.time()
+    with _lock:
+        _load_disk_index() # clear() may have dropped the index since the entry was written
+        if _disk_index is None:
+            return
+        for key in [k for k, meta in _disk_index.items() if meta['expires_at'] <= now]:
+            _remove_from_disk(key)
+        total = sum(meta['size'] for meta in _disk_index.values())
+        if total <= config.REPLY_CACHE_DISK_MAX_BYTES:
+            return
+        by_last_use = sorted(_disk_index, key=lambda k: _last_used_on_disk(k))
+        for key in by_last_use:
+            if total <= config.REPLY_CACHE_DISK_MAX_BYTES:
+                break
+            total -= _disk_index[key]['size']
+            _remove_from_disk(key)
+
+
+def _last_used_on_disk(key):
+    try:
+        return os.path.getmtime(_disk_paths(key)[1])
+    except OSError:
+        return 0
+
+
+def _lookup_disk(fingerprint, duration_s, now):
+    """Returns (key, entry) of a matching disk entry, loading its audio, or None."""
+    for key, meta in list(_disk_index.items()):
+        if meta['expires_at'] > now and _matches(fingerprint, duration_s, meta):
+            try:
+                with open(_disk_paths(key)[1], 'rb') as f:
+                    audio = f.read()
+                os.utime(_disk_paths(key)[1]) # LRU order for _evict_disk()
+            except OSError:
+                _remove_from_disk(key)
+                continue
+            return key, dict(meta, audio=audio)
+    return None
+
+
+# --- Public API ---
+
+def lookup(fingerprint, duration_s):
+    """Returns (audio_bytes, content_type) of a cached reply for a matching recording, or None."""
+    now = time.time()
+    with _lock:
+        _stats['lookups'] += 1
+        for key, entry in list(_entries.items()):
+            if entry['expires_at'] <= now:
+                _evict_key(key)
+            elif _matches(fingerprint, duration_s, entry):
+                _entries.move_to_end(key)
+                _stats['hits'] += 1
+                _stats['memory_hits'] += 1
+                return entry['audio'], entry['content_type']
+        _load_disk_index()
+        if _disk_index:
+            found = _lookup_disk(fingerprint, duration_s, now)
+            if found:
+                key, entry = found
+                _insert(key, entry)
+                _stats['hits'] += 1
+                _stats['disk_hits'] += 1
+                return entry['audio'], entry['content_type']
+    return None
+
+
+def _evict_key(key):
+    global _memory_bytes
+    entry = _entries.pop(key)
+    _memory_bytes -= len(entry['audio'])
+
+
+def _insert(key, entry):
+    global _memory_bytes
+    if key in _entries:
+        _evict_key(key)
+    _entries[key] = entry
+    _memory_bytes += len(entry['audio'])
+    _evict_memory()
+
+
+def store(fingerprint, duration_s, audio_bytes, content_type, cache_control=None):
+    """Caches a reply if Cache-Control has a max-age (and no no-store/no-cache) and it fits. Returns True if stored."""
+    ttl = ttl_from_cache_control(cache_control)
+    if ttl is None or not audio_bytes or len(audio_bytes) > config.REPLY_CACHE_MAX_BYTES:
+        with _lock:
+            _stats['not_stored'] += 1
+        return False
+    key = hashlib.sha256(fingerprint.tobytes()).hexdigest()
+    entry = {'fingerprint': fingerprint, 'duration_s': duration_s, 'audio': audio_bytes,
+             'content_type': content_type, 'expires_at': time.time() + ttl}
+    with _lock:
+        _insert(key, entry)
+        _stats['stores'] += 1
+        _load_disk_index()
+    if config.REPLY_CACHE_DISK_DIR:
+        _disk_executor.submit(_write_to_disk, key, entry)
+    return True
+
+
+def note_skipped():
+    """Counts a recording that could not be fingerprinted (no speech, too long to be a stock phrase, too uniform)."""
+    with _lock:
+        _stats['skipped'] += 1
+
+
+def get_stats():
+    """Returns the counters plus 'hit_rate' (hits / lookups) and the memory tier's size."""
+    with _lock:
+        stats = dict(_stats, entries=len(_entries), memory_bytes=_memory_bytes)
+    stats['hit_rate'] = stats['hits'] / stats['lookups'] if stats['lookups'] else 0.0
+    return stats
+
+
+def format_stats():
+    stats = get_stats()
+    return (f"{stats['hits']}/{stats['lookups']} hits ({stats['hit_rate'] * 100:.0f}%, "
+            f"{stats['disk_hits']} from disk), {stats['skipped']} not cacheable, {stats['entries']} entries, "
+            f"{stats['memory_bytes'] // 1024} KiB")
+
+
+def clear():
+    """Empties the memory tier and the counters (the disk tier is kept)."""
+    global _memory_bytes, _disk_index
+    with _lock:
+        _entries.clear()
+        _memory_bytes = 0
+        _disk_index = None
+        for name in _stats:
+            _stats[name] = 0
+
+
+def flush():
+    """Waits for pending disk writes."""
+    _disk_executor.submit(lambda: None).result(timeout=30)
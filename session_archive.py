@@ -0,0 +1,250 @@
+# session_archive.py
+"""
+Opt-in capture of real turns into a compact indexed archive, for replay
+with replay_session.py.
+
+Each turn stores the timestamped button presses, every raw gamepad event
+read while the turn was open (stick and gyro noise included, grouped in
+the batches they were read in, with the time of each read), the recorded
+WAV and the outcome of the upload: body, content type, status and latency,
+or for a failed upload the error kind ("http", "timeout",
+"connection_error", "breaker_open", ...) and how long it took to fail.
+A turn ended by Quit is stored too, without a recording or response. Turns are
+appended to a single file:
+
+    b"TALKARC1"
+    record*      u32 length, u32 meta_length, meta JSON, WAV bytes, response bytes
+    index        JSON list of [offset, length] for every record
+    footer       u64 index_offset, u32 index_length, b"TALKIDX1"
+
+Appending overwrites the old index and footer, so the file never needs a
+separate index. If a write was interrupted, readers rebuild the index by
+scanning the records.
+"""
+import base64
+import json
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import config
+import app_logger
+
+log = app_logger.get_logger(__name__)
+
+ARCHIVE_MAGIC = b"TALKARC1"
+FOOTER_MAGIC = b"TALKIDX1"
+_RECORD_HEADER = struct.Struct("<II")  # record length, meta length
+_FOOTER = struct.Struct("<QI8s")       # index offset, index length, magic
+
+# --- Recorder state (one turn at a time, driven by gamepad_manager) ---
+_current_turn = None
+_last_turn_end = None
+_last_batch = None # (read_time, raw bytes) of the latest batch read while no turn was open
+_archive_lock = threading.Lock()
+_append_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SessionArchive") # Keeps disk writes off the loop
+
+
+def _read_footer(f):
+    """Returns (index_offset, index) from a valid footer, or None."""
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    if size < len(ARCHIVE_MAGIC) + _FOOTER.size:
+        return None
+    f.seek(size - _FOOTER.size)
+    index_offset, index_length, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+    if magic != FOOTER_MAGIC or index_offset + index_length + _FOOTER.size != size:
+        return None
+    f.seek(index_offset)
+    return index_offset, json.loads(f.read(index_length))
+
+
+def _scan_records(f):
+    """Rebuilds the index by walking the records. Returns (end_of_last_complete_record, index)."""
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    offset = len(ARCHIVE_MAGIC)
+    index = []
+    while offset + _RECORD_HEADER.size <= size:
+        f.seek(offset)
+        record_length, meta_length = _RECORD_HEADER.unpack(f.read(_RECORD_HEADER.size))
+        if record_length < meta_length or offset + _RECORD_HEADER.size + record_length > size:
+            break
+        try:
+            meta = json.loads(f.read(meta_length))
+        except ValueError:
+            break # Not a record: probably the start of an old index
+        if not isinstance(meta, dict) or 'wav_length' not in meta:
+            break
+        index.append([offset, _RECORD_HEADER.size + record_length])
+        offset += _RECORD_HEADER.size + record_length
+    return offset, index
+
+
+def read_index(path):
+    """Returns the list of [offset, length] for every turn in the archive."""
+    with open(path, 'rb') as f:
+        if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+            raise ValueError(f"{path} is not a session archive.")
+        footer = _read_footer(f)
+        if footer:
+            return footer[1]
+        log.warning(f"Session archive {path} has no valid index; rebuilding it by scanning.")
+        return _scan_records(f)[1]
+
+
+def read_turn(path, entry):
+    """Reads one turn given its index entry. Returns (meta, wav_bytes, response_bytes)."""
+    offset, length = entry
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        record = f.read(length)
+    _, meta_length = _RECORD_HEADER.unpack_from(record)
+    body = memoryview(record)[_RECORD_HEADER.size:]
+    meta = json.loads(bytes(body[:meta_length]))
+    wav_end = meta_length + meta['wav_length']
+    return meta, bytes(body[meta_length:wav_end]), bytes(body[wav_end:wav_end + meta['response_length']])
+
+
+def append_turn(path, meta, wav_bytes, response_bytes):
+    """Appends one turn and rewrites the index/footer. Creates the archive if needed."""
+    meta = dict(meta, wav_length=len(wav_bytes), response_length=len(response_bytes))
+    meta_json = json.dumps(meta, separators=(',', ':')).encode()
+    record_length = len(meta_json) + len(wav_bytes) + len(response_bytes)
+    with _archive_lock:
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, 'wb' if new_file else 'r+b') as f:
+            if new_file:
+                f.write(ARCHIVE_MAGIC)
+                data_end, index = len(ARCHIVE_MAGIC), []
+            else:
+                if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                    raise ValueError(f"{path} is not a session archive.")
+                footer = _read_footer(f)
+                data_end, index = footer if footer else _scan_records(f)
+            f.seek(data_end)
+            f.truncate()
+            f.write(_RECORD_HEADER.pack(record_length, len(meta_json)))
+            f.write(meta_json)
+            f.write(wav_bytes)
+            f.write(response_bytes)
+            index.append([data_end, _RECORD_HEADER.size + record_length])
+            index_offset = f.tell()
+            index_json = json.dumps(index, separators=(',', ':')).encode()
+            f.write(index_json)
+            f.write(_FOOTER.pack(index_offset, len(index_json), FOOTER_MAGIC))
+    return len(index)
+
+
+# --- Recording hooks used by gamepad_manager ---
+
+def _event_time(event):
+    return event.sec + event.usec / 1e6 # Kernel timestamp of the press
+
+
+def note_input_batch(data):
+    """
+    batch_fn for gamepad_input.iter_key_presses(): keeps every raw batch read while a turn is open.
+    It runs before the batch's presses are handled, so the batch holding the start press is held
+    back until begin_turn() and the one holding the stop press is already in the turn.
+    """
+    global _last_batch
+    read_time = time.time() # Same clock as the kernel's event timestamps
+    if _current_turn is None:
+        _last_batch = (read_time, data)
+    else:
+        _add_batch(_current_turn, read_time, data)
+
+
+def _add_batch(turn, read_time, data):
+    turn['input_batches'].append([round(read_time - turn['_started'], 4), base64.b64encode(data).decode('ascii')])
+
+
+def begin_turn(event):
+    """Called with the press that starts a recording."""
+    global _current_turn, _last_batch
+    if not config.SESSION_RECORDING_ENABLED:
+        return
+    _current_turn = {
+        'recorded_at': time.time(),
+        'idle_before_s': round(time.monotonic() - _last_turn_end, 3) if _last_turn_end else None,
+        'events': [[0.0, event.code]],
+        'input_batches': [],
+        '_started': _event_time(event),
+    }
+    if _last_batch:
+        _add_batch(_current_turn, *_last_batch)
+        _last_batch = None
+
+
+def note_event(event):
+    """Called with every later press that belongs to the current turn."""
+    if _current_turn is not None:
+        _current_turn['events'].append([round(_event_time(event) - _current_turn['_started'], 4), event.code])
+
+
+def discard_turn():
+    """Drops a turn that ended without an upload (recording failed or was empty)."""
+    global _current_turn, _last_turn_end
+    if _current_turn is not None:
+        _current_turn = None
+        _last_turn_end = time.monotonic()
+
+
+def finish_quit_turn(event):
+    """Called with a Quit press during a turn: stores the turn's input without recording or response."""
+    global _current_turn, _last_turn_end
+    if _current_turn is None:
+        return
+    note_event(event)
+    turn, _current_turn = _current_turn, None
+    _last_turn_end = time.monotonic()
+    turn.pop('_started')
+    turn['quit'] = True
+    turn['response'] = {}
+    _append_executor.submit(_append_in_background, config.SESSION_ARCHIVE_PATH, turn, b'', b'')
+
+
+def finish_turn(recording_path, response_path, response_info):
+    """
+    Called after the server answered (before the temp files are removed). Reads the files
+    now and appends them to the archive on a background thread.
+    """
+    global _current_turn, _last_turn_end
+    turn, _current_turn = _current_turn, None
+    _last_turn_end = time.monotonic()
+    if turn is None:
+        return
+    try:
+        with open(recording_path, 'rb') as f:
+            wav_bytes = f.read()
+        response_bytes = b''
+        if response_path and os.path.exists(response_path):
+            with open(response_path, 'rb') as f:
+                response_bytes = f.read()
+    except OSError as e:
+        log.warning(f"Session recording skipped for this turn: {e}")
+        return
+    turn.pop('_started')
+    turn['response'] = dict(response_info or {})
+    _append_executor.submit(_append_in_background, config.SESSION_ARCHIVE_PATH, turn, wav_bytes, response_bytes)
+
+
+def _append_in_background(path, meta, wav_bytes, response_bytes):
+    try:
+        count = append_turn(path, meta, wav_bytes, response_bytes)
+        log.info(f"Session turn {count} saved to {path}.")
+    except Exception as e:
+        log.error(f"Could not append turn to session archive {path}: {e}")
+
+
+def flush(timeout=30):
+    """Waits for pending archive writes (called when the loop ends). Never raises."""
+    try:
+        _append_executor.submit(lambda: None).result(timeout=timeout)
+    except FutureTimeoutError:
+        log.warning(f"Session archive writes still pending after {timeout}s; they finish in the background.")
+    except RuntimeError as e: # Executor shut down at interpreter exit
+        log.warning(f"Could not wait for session archive writes: {e}")
@@ -0,0 +1,172 @@
+# soak_test.py
+"""
+Soak mode: drives thousands of simulated turns through
+gamepad_manager.run_application_loop() with a stand-in gamepad, a stand-in
+microphone, a cheap stand-in player and the local stand-in server, while
+sampling RSS, open file descriptors, live threads and child processes.
+
+Exits with status 1 if any of them grew past its threshold (compared with
+the baseline taken after the warm-up turns), so slow leaks show up here
+instead of on units that have been running for days. The stand-in server's
+threads are not counted: they belong to the test, not the client.
+
+The microphone is an in-process stand-in for PyAudio (thread capture
+backend), so leaks in PortAudio/ALSA or in the capture process are not
+covered; the report says so.
+
+    python soak_test.py --turns 2000 --record-s 0.2 --csv /tmp/soak.csv
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import stand_in_devices
+stand_in_devices.install_stand_in_audio() # Before audio_recorder is imported (it opens PyAudio at import)
+
+import config
+import app_logger
+import stand_in_driver
+import stand_in_server
+
+log = app_logger.get_logger(__name__)
+
+
+def read_rss_kib():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def count_open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def count_child_processes():
+    """Counts direct children, including zombies that were never reaped."""
+    my_pid = os.getpid()
+    children = 0
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                # Field 4 is the parent PID; the command name (field 2) may contain spaces
+                fields = stat.read().rsplit(')', 1)[1].split()
+            if int(fields[1]) == my_pid:
+                children += 1
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+
+def take_sample(turn):
+    return {
+        'turn': turn,
+        'time_s': time.monotonic(),
+        'rss_kib': read_rss_kib(),
+        'fds': count_open_fds(),
+        'threads': sum(1 for t in threading.enumerate() if not stand_in_server.is_server_thread(t)),
+        'children': count_child_processes(),
+    }
+
+
+def drive_turns(gamepad, args, samples):
+    """Driver: presses buttons like a user and samples resources every few turns."""
+    for turn in range(1, args.turns + 1):
+        if args.noise:
+            gamepad.send_stick_noise(args.noise)
+        stand_in_driver.press_turn(gamepad, args.record_s)
+        stand_in_driver.wait_for_turn_end()
+        if turn % args.sample_every == 0 or turn == args.turns:
+            sample = take_sample(turn)
+            samples.append(sample)
+            print(f"turn {turn:>6}  rss {sample['rss_kib'] / 1024:7.1f} MiB  fds {sample['fds']:>4}  "
+                  f"threads {sample['threads']:>3}  children {sample['children']:>3}", flush=True)
+
+
+def evaluate(samples, args):
+    """Compares the end of the run with the post-warm-up baseline. Returns a list of failures."""
+    warm = [s for s in samples if s['turn'] > args.warmup]
+    if len(warm) < 2:
+        return ["Not enough samples after warm-up to evaluate (increase --turns or lower --sample-every)."]
+    baseline_samples = warm[:3]
+    final_samples = warm[-3:]
+    limits = {'rss_kib': args.max_rss_growth_mb * 1024, 'fds': args.max_fd_growth,
+              'threads': args.max_thread_growth, 'children': args.max_child_growth}
+    failures = []
+    for metric, limit in limits.items():
+        baseline = statistics.median(s[metric] for s in baseline_samples)
+        final = min(s[metric] for s in final_samples) # Sustained growth, not a momentary peak
+        growth = final - baseline
+        status = "FAIL" if growth > limit else "ok"
+        print(f"  {metric:<9} baseline {baseline:>10.0f}  final {final:>10.0f}  growth {growth:>+9.0f}  limit {limit:>8.0f}  {status}")
+        if growth > limit:
+            failures.append(f"{metric} grew by {growth:.0f} (limit {limit:.0f}).")
+    return failures
+
+
+def write_csv(samples, path):
+    with open(path, 'w') as out:
+        out.write("turn,time_s,rss_kib,fds,threads,children\n")
+        for s in samples:
+            out.write(f"{s['turn']},{s['time_s']:.3f},{s['rss_kib']},{s['fds']},{s['threads']},{s['children']}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test: many simulated turns with leak detection.")
+    parser.add_argument('--turns', type=int, default=2000)
+    parser.add_argument('--record-s', type=float, default=0.2, help="Recording length per turn")
+    parser.add_argument('--warmup', type=int, default=50, help="Turns excluded from the baseline")
+    parser.add_argument('--sample-every', type=int, default=25, help="Sample resources every N turns")
+    parser.add_argument('--noise', type=int, default=100, help="Analog-stick events sent before each turn")
+    parser.add_argument('--latency', type=float, default=0.05, help="Stand-in server latency per request")
+    parser.add_argument('--player-cmd', default="true", help="Stand-in for ffplay (the file path is appended)")
+    parser.add_argument('--max-rss-growth-mb', type=float, default=8.0)
+    parser.add_argument('--max-fd-growth', type=int, default=4)
+    parser.add_argument('--max-thread-growth', type=int, default=2)
+    parser.add_argument('--max-child-growth', type=int, default=1)
+    parser.add_argument('--csv', help="Write all samples to this CSV file")
+    args = parser.parse_args()
+
+    app_logger.set_level("WARNING")
+    server = stand_in_server.start_server(latency_s=args.latency)
+    config.UPLOAD_URL = server.url
+    config.TEMP_DIR = tempfile.mkdtemp(prefix="talk_soak_")
+    config.EXTERNAL_PLAYER_COMMAND = args.player_cmd.split()
+    config.AUDIO_CAPTURE_BACKEND = "thread" # The stand-in microphone lives in this process
+    config.GAMEPAD_BATCH_READ = True
+
+    gamepad = stand_in_devices.StandInGamepad()
+    samples = [take_sample(0)]
+    started = time.monotonic()
+    try:
+        errors = stand_in_driver.run_driven(gamepad, drive_turns, (args, samples), name="SoakDriver")
+    finally:
+        stand_in_server.stop_server(server)
+
+    elapsed = time.monotonic() - started
+    print("Note: audio came from the in-process stand-in for PyAudio (thread capture backend); "
+          "PortAudio/ALSA and the capture process were not exercised.")
+    completed = samples[-1]['turn']
+    print(f"Completed {completed} turns in {elapsed:.0f}s ({completed / elapsed if elapsed else 0:.1f} turns/s).")
+    if args.csv:
+        write_csv(samples, args.csv)
+    failures = [f"Driver error: {e}" for e in errors] + evaluate(samples, args)
+    if failures:
+        print("SOAK FAILED:")
+        for failure in failures:
+            print(f"  - {failure}")
+        app_logger.stop_logging()
+        sys.exit(1)
+    print("SOAK PASSED.")
+    app_logger.stop_logging()
+
+
+if __name__ == "__main__":
+    main()
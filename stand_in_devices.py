@@ -0,0 +1,142 @@
+# stand_in_devices.py
+"""
+Stand-in gamepad and microphone for running the real application loop
+without hardware (e.g. soak_test.py).
+
+- StandInGamepad is backed by a pipe carrying raw input_event structs, so
+  gamepad_input's epoll/batched read path is exercised unchanged.
+- install_stand_in_audio() replaces pyaudio.PyAudio with a stand-in whose
+  input stream delivers PCM in real time (silence, or a supplied source).
+  It only affects the "thread" capture backend: the capture process is a
+  fresh interpreter and would open the real device.
+"""
+import os
+import select
+import struct
+import time
+
+import pyaudio
+from evdev import InputEvent, ecodes
+
+_EVENT_FORMAT = 'llHHi' # Same layout as the kernel's struct input_event
+_EVENT_SIZE = struct.calcsize(_EVENT_FORMAT)
+
+
+def pack_event(ev_type, code, value, timestamp=None):
+    timestamp = time.time() if timestamp is None else timestamp
+    return struct.pack(_EVENT_FORMAT, int(timestamp), int((timestamp % 1) * 1e6), ev_type, code, value)
+
+
+class StandInGamepad:
+    """Pipe-backed stand-in for an evdev InputDevice."""
+
+    def __init__(self, name="Stand-in Gamepad"):
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        self.fd = self._read_fd
+        self.name = name
+        self.path = f"stand-in://{name}"
+
+    def send_events(self, events):
+        """Writes (type, code, value) tuples to the pipe in a single write."""
+        os.write(self._write_fd, b''.join(pack_event(*event) for event in events))
+
+    def send_raw(self, data):
+        """Writes already packed input_event structs (e.g. a recorded batch) in a single write."""
+        os.write(self._write_fd, data)
+
+    def press(self, code):
+        """A full button press: key down, SYN, key up, SYN."""
+        self.send_events([(ecodes.EV_KEY, code, 1), (ecodes.EV_SYN, ecodes.SYN_REPORT, 0),
+                          (ecodes.EV_KEY, code, 0), (ecodes.EV_SYN, ecodes.SYN_REPORT, 0)])
+
+    def send_stick_noise(self, count):
+        """Analog-stick jitter: alternating EV_ABS and SYN events."""
+        events = []
+        for i in range(count):
+            events.append((ecodes.EV_ABS, ecodes.ABS_X, 128 + (i % 3) - 1))
+            events.append((ecodes.EV_SYN, ecodes.SYN_REPORT, 0))
+        self.send_events(events)
+
+    def read(self):
+        data = os.read(self._read_fd, _EVENT_SIZE * 64)
+        return [InputEvent(*struct.unpack_from(_EVENT_FORMAT, data, offset))
+                for offset in range(0, len(data) - _EVENT_SIZE + 1, _EVENT_SIZE)]
+
+    def read_loop(self):
+        while True:
+            select.select([self._read_fd], [], [])
+            try:
+                events = self.read()
+            except BlockingIOError:
+                continue
+            if not events:
+                raise OSError("Stand-in gamepad closed.")
+            yield from events
+
+    def close(self):
+        for fd in (self._read_fd, self._write_fd):
+            try: os.close(fd)
+            except OSError: pass
+        self._read_fd = self._write_fd = -1
+
+
+class _StandInStream:
+    def __init__(self, rate, channels, pcm_source):
+        self._rate = rate
+        self._bytes_per_frame = 2 * channels
+        self._pcm_source = pcm_source
+        self._next_read_at = time.monotonic()
+        self._active = True
+
+    def read(self, num_frames, exception_on_overflow=True):
+        # Pace reads like a real device: one buffer per buffer-duration
+        self._next_read_at += num_frames / float(self._rate)
+        delay = self._next_read_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self._next_read_at = time.monotonic()
+        nbytes = num_frames * self._bytes_per_frame
+        if self._pcm_source:
+            chunk = self._pcm_source(nbytes)
+            return chunk + b'\x00' * (nbytes - len(chunk))
+        return b'\x00' * nbytes
+
+    def is_active(self):
+        return self._active
+
+    def stop_stream(self):
+        self._active = False
+
+    def close(self):
+        self._active = False
+
+
+class StandInPyAudio:
+    """Minimal stand-in for pyaudio.PyAudio (input streams only)."""
+    pcm_source = None # Callable(nbytes) -> bytes, or None for silence
+
+    def get_sample_size(self, audio_format):
+        return 2
+
+    def open(self, format, channels, rate, input=True, input_device_index=None, frames_per_buffer=1024, **kwargs):
+        return _StandInStream(rate, channels, StandInPyAudio.pcm_source)
+
+    def terminate(self):
+        pass
+
+
+def wait_for(predicate, what, timeout_s=60):
+    """Polls predicate() until it is true; raises TimeoutError naming `what` otherwise."""
+    deadline = time.monotonic() + timeout_s
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for {what}.")
+        time.sleep(0.005)
+
+
+def install_stand_in_audio(pcm_source=None):
+    """Replaces pyaudio.PyAudio process-wide. pcm_source(nbytes) -> bytes feeds the microphone."""
+    StandInPyAudio.pcm_source = pcm_source
+    pyaudio.PyAudio = StandInPyAudio
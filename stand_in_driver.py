@@ -0,0 +1,65 @@
+# stand_in_driver.py
+"""
+Drives the real application loop from a second thread, pressing the
+stand-in gamepad's buttons like a user (used by soak_test.py and
+replay_session.py).
+
+Import it after stand_in_devices.install_stand_in_audio(): it imports
+gamepad_manager, which opens PyAudio at import.
+"""
+import threading
+import time
+
+import config
+import gamepad_manager
+import stand_in_devices
+
+
+def wait_for_state(state, what=None, timeout_s=60):
+    """Waits until the application loop is in state (e.g. gamepad_manager.STATE_IDLE)."""
+    stand_in_devices.wait_for(lambda: getattr(gamepad_manager, 'current_app_state', None) == state,
+                              what or state, timeout_s)
+
+
+def wait_for_turn_end():
+    """After the stop press: waits until recording has ended and the turn is back in IDLE."""
+    stand_in_devices.wait_for(lambda: gamepad_manager.current_app_state != gamepad_manager.STATE_LISTENING,
+                              "end of LISTENING")
+    wait_for_state(gamepad_manager.STATE_IDLE, "IDLE after turn")
+
+
+def press_turn(gamepad, record_s):
+    """One turn by button presses: start, wait for LISTENING, record for record_s, stop."""
+    gamepad.press(config.BTN_ACTION_START_STOP)
+    pressed_at = time.perf_counter()
+    wait_for_state(gamepad_manager.STATE_LISTENING, "LISTENING")
+    time.sleep(max(0.0, record_s - (time.perf_counter() - pressed_at)))
+    gamepad.press(config.BTN_ACTION_START_STOP)
+
+
+def run_driven(gamepad, drive, args=(), name="StandInDriver"):
+    """
+    Runs gamepad_manager.run_application_loop(gamepad) on this thread while drive(gamepad, *args)
+    runs on a driver thread, started once the loop is IDLE. Quit is pressed when drive returns or
+    raises, which ends the loop. Returns the list of exceptions raised by drive (empty on success).
+    """
+    errors = []
+
+    def driver():
+        try:
+            wait_for_state(gamepad_manager.STATE_IDLE, "IDLE at startup")
+            drive(gamepad, *args)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            gamepad.press(config.BTN_ACTION_QUIT)
+
+    driver_thread = threading.Thread(target=driver, name=name)
+    driver_thread.daemon = True
+    driver_thread.start()
+    try:
+        gamepad_manager.run_application_loop(gamepad)
+    finally:
+        driver_thread.join(timeout=5)
+        gamepad.close()
+    return errors
@@ -0,0 +1,279 @@
+# stand_in_server.py
+"""
+Local stand-in for the n8n webhook, used by bench.py and other local runs.
+
+Accepts the same multipart POST as the real endpoint (field 'audio') and
+replies with audio. It can simulate a slow link: a fixed per-request
+latency and a per-connection upload throughput cap (on high-latency links
+a single TCP connection is limited by its window, not by the link).
+Segmented uploads (upload_id / segment_index / segment_count form fields)
+are reassembled; the request that completes the set gets the reply, the
+others get an empty 202.
+
+server.mode can be switched at runtime to simulate outages: "ok",
+"hang" (hold the request without answering), "reject" (503) or
+"hang-post" (POSTs hang while HEAD answers 404, like an n8n webhook whose
+workflow is stuck).
+server.responder, if set, replaces the default reply: it is called with
+the parsed form fields and returns (status, body, content_type, delay_s).
+A status of None sends no answer: the connection is closed after delay_s.
+server.reply_headers are added to every answered utterance (e.g. a
+Cache-Control max-age for the reply cache).
+
+Conversation context (session_id / turn_seq / continuation_token fields,
+see conversation_session.py) is simulated with a cost per answered turn:
+a turn without a valid continuation token rebuilds the context, which
+takes context_base_s plus context_per_turn_s for every earlier turn of the
+conversation; a turn with a valid token only pays context_incremental_s.
+Every answer to a session carries a fresh X-Continuation-Token (valid for
+token_ttl_s). stats counts 'context_rebuilds' and 'context_reuses'.
+
+Run standalone:  python stand_in_server.py --port 8099 --latency 0.2
+"""
+import argparse
+import io
+import threading
+import time
+import uuid
+import wave
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_READ_CHUNK_BYTES = 16 * 1024
+
+
+def make_silence_wav(duration_s=0.5, samplerate=16000):
+    """Returns a small silent WAV, used as the default reply audio."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(samplerate)
+        wf.writeframes(b'\x00\x00' * int(duration_s * samplerate))
+    return buffer.getvalue()
+
+
+def parse_multipart(content_type, body):
+    """Parses a multipart/form-data body. Returns {field_name: bytes}."""
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        if name:
+            fields[name] = part.get_payload(decode=True) or b''
+    return fields
+
+
+def join_wav_segments(segments):
+    """Concatenates the PCM of a list of WAV blobs into one WAV blob."""
+    output = io.BytesIO()
+    with wave.open(output, 'wb') as out_wf:
+        for index, segment in enumerate(segments):
+            with wave.open(io.BytesIO(segment), 'rb') as in_wf:
+                if index == 0:
+                    out_wf.setparams(in_wf.getparams())
+                out_wf.writeframes(in_wf.readframes(in_wf.getnframes()))
+    return output.getvalue()
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, so the client's connection pool is exercised
+
+    def log_message(self, format, *args):
+        pass # Quiet: benchmarks print their own results
+
+    def _read_body(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        throughput = self.server.upload_bytes_per_s
+        chunks = []
+        while remaining > 0:
+            started = time.monotonic()
+            chunk = self.rfile.read(min(_READ_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            if throughput: # Simulate a per-connection throughput cap
+                delay = len(chunk) / throughput - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        return b''.join(chunks)
+
+    def _send(self, status, body=b'', content_type=None, headers=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _simulate_outage(self):
+        """Applies server.mode. Returns True if the request was already answered (or abandoned)."""
+        if self.server.mode in ("hang", "hang-post"):
+            if self.server.mode == "hang-post" and self.command == "HEAD":
+                self._send(404)
+                return True
+            mode = self.server.mode
+            deadline = time.monotonic() + self.server.hang_s
+            while self.server.mode == mode and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.close_connection = True
+            return True
+        if self.server.mode == "reject":
+            self._send(503, b'stand-in rejecting requests', 'text/plain')
+            return True
+        return False
+
+    def _apply_context_cost(self, fields):
+        """Simulates building the conversation context for an answered turn. Returns the reply headers."""
+        server = self.server
+        session_id = fields.get('session_id', b'').decode()
+        token = fields.get('continuation_token', b'').decode()
+        now = time.monotonic()
+        headers = {}
+        with server.lock:
+            if session_id:
+                conversation = server.conversations.setdefault(session_id, {'turns': 0, 'token': None, 'expires': 0.0})
+            else:
+                conversation = {'turns': 0, 'token': None, 'expires': 0.0} # Stateless request: nothing to reuse
+            reuse = bool(token) and token == conversation['token'] and now < conversation['expires']
+            if reuse:
+                cost_s = server.context_incremental_s
+                server.stats['context_reuses'] += 1
+            else:
+                cost_s = server.context_base_s + server.context_per_turn_s * conversation['turns']
+                server.stats['context_rebuilds'] += 1
+            conversation['turns'] += 1
+            if session_id:
+                conversation['token'] = uuid.uuid4().hex
+                conversation['expires'] = now + server.token_ttl_s
+                headers = {'X-Continuation-Token': conversation['token'], 'X-Continuation-TTL': f"{server.token_ttl_s:g}"}
+        if cost_s:
+            time.sleep(cost_s)
+        return headers
+
+    def do_HEAD(self):
+        with self.server.lock:
+            self.server.stats['probes'] += 1
+        if not self._simulate_outage():
+            self._send(200)
+
+    def do_POST(self):
+        body = self._read_body()
+        if self._simulate_outage():
+            return
+        if self.server.latency_s:
+            time.sleep(self.server.latency_s)
+        try:
+            fields = parse_multipart(self.headers.get('Content-Type', ''), body)
+        except Exception:
+            fields = {}
+        audio = fields.get('audio')
+        if not audio:
+            self._send(400, b'missing audio field', 'text/plain')
+            return
+
+        with self.server.lock:
+            self.server.stats['requests'] += 1
+            self.server.stats['bytes_received'] += len(body)
+
+        upload_id = fields.get('upload_id', b'').decode()
+        if upload_id:
+            segment_index = int(fields.get('segment_index', b'0'))
+            segment_count = int(fields.get('segment_count', b'1'))
+            with self.server.lock:
+                segments = self.server.pending_segments.setdefault(upload_id, {})
+                segments[segment_index] = audio
+                complete = len(segments) == segment_count
+                if complete:
+                    del self.server.pending_segments[upload_id]
+            if not complete:
+                self._send(202)
+                return
+            audio = join_wav_segments([segments[i] for i in range(segment_count)])
+
+        with self.server.lock:
+            self.server.stats['utterances'] += 1
+            self.server.last_utterance = audio
+        headers = dict(self.server.reply_headers, **self._apply_context_cost(fields))
+        if self.server.responder:
+            status, reply_body, content_type, delay_s = self.server.responder(fields)
+            if delay_s:
+                time.sleep(delay_s)
+            if status is None:
+                self.close_connection = True
+                return
+            self._send(status, reply_body, content_type, headers)
+            return
+        self._send(200, self.server.reply_audio, self.server.reply_content_type, headers)
+
+
+def start_server(host="127.0.0.1", port=0, latency_s=0.0, upload_bytes_per_s=None,
+                 reply_audio=None, reply_content_type='audio/wav',
+                 context_base_s=0.0, context_per_turn_s=0.0, context_incremental_s=0.0, token_ttl_s=300.0):
+    """Starts the stand-in server in a background thread. Returns the server; its URL is server.url."""
+    server = ThreadingHTTPServer((host, port), _StandInHandler)
+    server.daemon_threads = True
+    server.latency_s = latency_s
+    server.upload_bytes_per_s = upload_bytes_per_s
+    server.reply_audio = reply_audio if reply_audio is not None else make_silence_wav()
+    server.reply_content_type = reply_content_type
+    server.lock = threading.Lock()
+    server.pending_segments = {}
+    server.last_utterance = None
+    server.stats = {'requests': 0, 'bytes_received': 0, 'utterances': 0, 'probes': 0,
+                    'context_rebuilds': 0, 'context_reuses': 0}
+    server.conversations = {}
+    server.context_base_s = context_base_s
+    server.context_per_turn_s = context_per_turn_s
+    server.context_incremental_s = context_incremental_s
+    server.token_ttl_s = token_ttl_s
+    server.mode = "ok"
+    server.hang_s = 120
+    server.responder = None
+    server.reply_headers = {}
+    server.url = f"http://{host}:{server.server_address[1]}/webhook/talk"
+    thread = threading.Thread(target=server.serve_forever, name="StandInServer")
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def is_server_thread(thread):
+    """True for the stand-in server's own threads (the serve_forever thread and per-request handlers)."""
+    return thread.name == "StandInServer" or thread.name.endswith("(process_request_thread)")
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the talk webhook.")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds to wait before replying to each request")
+    parser.add_argument('--kbps', type=float, default=None, help="Per-connection upload throughput cap in kbit/s")
+    parser.add_argument('--mode', choices=["ok", "hang", "reject", "hang-post"], default="ok")
+    parser.add_argument('--context-base', type=float, default=0.0, help="Seconds to rebuild a conversation's context")
+    parser.add_argument('--context-per-turn', type=float, default=0.0, help="Extra rebuild seconds per earlier turn")
+    parser.add_argument('--context-incremental', type=float, default=0.0, help="Seconds per turn with a valid token")
+    parser.add_argument('--token-ttl', type=float, default=300.0, help="Continuation token lifetime in seconds")
+    args = parser.parse_args()
+    srv = start_server(args.host, args.port, args.latency,
+                       args.kbps * 1000 / 8 if args.kbps else None,
+                       context_base_s=args.context_base, context_per_turn_s=args.context_per_turn,
+                       context_incremental_s=args.context_incremental, token_ttl_s=args.token_ttl)
+    srv.mode = args.mode
+    print(f"Stand-in server listening on {srv.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_server(srv)
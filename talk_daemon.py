@@ -0,0 +1,341 @@
+# talk_daemon.py
+"""
+Warm daemon mode: keeps the initialized engine resident between launches.
+
+Starting main.py from scratch pays for the interpreter, the imports,
+PortAudio initialization, the capture process, gamepad detection and the
+TLS handshake every time the port is chosen in RetroPie. The daemon does
+all of that once and then waits on a Unix socket (config.DAEMON_SOCKET_PATH).
+talk_launch.py connects, the daemon runs gamepad_manager.run_application_loop()
+with the already-opened gamepad, streams its log lines to the launcher and
+ends the session when Quit is pressed (or when the launcher goes away).
+
+Protocol: one command line per connection, "ATTACH", "STATUS" or "STOP".
+Replies are lines of "<kind> <text>": "A <pid>" when a session starts,
+"L <log line>" while it runs, and a final "E <exit code> <message>".
+
+Idle cost: between sessions the daemon is blocked in select() with no
+periodic wake-ups. It keeps its RSS, the capture process (PyAudio
+initialized, no stream open), the opened gamepad and one pooled HTTP
+connection. It exits after DAEMON_MAX_IDLE_S without a launcher, or after
+a session that left its RSS above DAEMON_MAX_RSS_MB; "python talk_launch.py
+--status" shows the current figures.
+
+    python talk_daemon.py [--background]
+"""
+import argparse
+import os
+import queue
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+import config
+import app_logger
+import audio_capture_process
+import audio_uploader
+import gamepad_input
+import gamepad_manager
+import main
+import video_manager
+
+log = app_logger.get_logger(__name__)
+
+_COMMAND_TIMEOUT_S = 2 # A client that doesn't send its command within this is dropped
+_CLIENT_QUEUE_LINES = 1000 # Log lines buffered for a launcher that reads slowly; further lines are dropped
+_CLIENT_DRAIN_TIMEOUT_S = 2 # At the end of a session, how long a stalled launcher may hold up the final lines
+
+_started_at = time.monotonic()
+_idle_since = time.monotonic()
+_sessions_served = 0
+_session_thread = None
+_gamepad = None
+_shutdown_requested = threading.Event()
+_shutdown_signal = None # Set by the signal handler; the accept loop logs it and shuts down
+_wake_read_fd, _wake_write_fd = os.pipe() # Wakes the accept loop (session ended, shutdown requested)
+
+
+def read_rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _wake_accept_loop():
+    try: os.write(_wake_write_fd, b'w')
+    except OSError: pass
+
+
+def _on_signal(signum, frame):
+    """Signal handler: only records the signal and wakes the accept loop (no logging or locks here)."""
+    global _shutdown_signal
+    _shutdown_signal = signum
+    _wake_accept_loop()
+
+
+def _request_shutdown(reason):
+    if not _shutdown_requested.is_set():
+        log.info(f"Daemon shutting down: {reason}")
+    _shutdown_requested.set()
+    gamepad_manager.request_quit()
+    _wake_accept_loop()
+
+
+def _gamepad_is_usable(device):
+    """False if the gamepad was unplugged (its node is gone or the fd is no longer valid)."""
+    try:
+        os.fstat(device.fd)
+        return os.path.exists(device.path)
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+def _ensure_gamepad():
+    """Returns the resident gamepad, reopening it if it was unplugged since the last session."""
+    global _gamepad
+    if _gamepad is not None and _gamepad_is_usable(_gamepad):
+        return _gamepad
+    if _gamepad is not None:
+        log.info("Resident gamepad is gone; opening it again...")
+        try: _gamepad.close()
+        except Exception: pass
+    _gamepad = main.open_gamepad()
+    return _gamepad
+
+
+def _send_line(conn, kind, text):
+    conn.sendall(f"{kind} {text}\n".encode('utf-8', 'replace'))
+
+
+def _client_sender(conn, lines, forward_line):
+    """Sender thread: writes queued lines to the launcher, so a stalled launcher never blocks the log writer."""
+    while True:
+        item = lines.get()
+        if item is None:
+            return
+        try:
+            _send_line(conn, *item)
+        except OSError:
+            app_logger.remove_sink(forward_line) # Launcher gone; stop queueing for it
+            return
+
+
+def _watch_client(conn, session_finished):
+    """Ends the session if the launcher disconnects (killed, Ctrl+C) before Quit was pressed."""
+    try:
+        while conn.recv(64):
+            pass
+    except OSError:
+        pass
+    if not session_finished.is_set():
+        log.info("Launcher disconnected; ending the session.")
+        gamepad_manager.request_quit()
+
+
+def _run_session(conn):
+    """Session thread: one run of the application loop for one attached launcher."""
+    global _sessions_served, _idle_since
+    session_finished = threading.Event()
+    lines = queue.Queue(maxsize=_CLIENT_QUEUE_LINES)
+    dropped_lines = 0
+
+    def forward_line(line): # Runs in the log writer thread: must never block
+        nonlocal dropped_lines
+        try:
+            lines.put_nowait(("L", line))
+        except queue.Full:
+            dropped_lines += 1
+
+    sender = threading.Thread(target=_client_sender, args=(conn, lines, forward_line), name="DaemonClientSender",
+                              daemon=True)
+    sender.start()
+    exit_code, message = 0, "session finished"
+    lines.put(("A", os.getpid()))
+    app_logger.add_sink(forward_line)
+    try:
+        gamepad = _ensure_gamepad()
+        if not gamepad:
+            log.critical("NO GAMEPAD COULD BE IDENTIFIED. Please check connections and config.")
+            exit_code, message = 1, "no gamepad"
+            return
+        discarded = gamepad_input.drain_pending_events(gamepad) # Presses made in EmulationStation meanwhile
+        if discarded:
+            log.debug(f"Discarded {discarded} gamepad events queued while detached.")
+        # Refresh the pooled connection while the user starts talking, in case the server closed it
+        threading.Thread(target=audio_uploader.warm_connection, name="HttpWarmUp", daemon=True).start()
+        threading.Thread(target=_watch_client, args=(conn, session_finished), name="DaemonClientWatch",
+                         daemon=True).start()
+        gamepad_manager.run_application_loop(gamepad)
+    except Exception as e:
+        log.exception(f"A critical error occurred in the daemon session: {e}")
+        exit_code, message = 1, str(e)
+    finally:
+        session_finished.set()
+        video_manager.stop_current_video()
+        _sessions_served += 1
+        rss_mb = read_rss_mb()
+        log.info(f"Session {_sessions_served} finished. Daemon RSS {rss_mb:.1f} MB.")
+        app_logger.wait_until_written()
+        app_logger.remove_sink(forward_line)
+        if dropped_lines:
+            message += f" ({dropped_lines} log lines dropped: launcher did not keep up)"
+        try:
+            lines.put(("E", f"{exit_code} {message}"), timeout=_CLIENT_DRAIN_TIMEOUT_S)
+            lines.put(None, timeout=_CLIENT_DRAIN_TIMEOUT_S)
+        except queue.Full:
+            pass
+        sender.join(timeout=_CLIENT_DRAIN_TIMEOUT_S)
+        try:
+            conn.shutdown(socket.SHUT_RDWR) # Also unblocks a sender stuck on a stalled launcher
+        except OSError:
+            pass
+        sender.join(timeout=1)
+        conn.close()
+        _idle_since = time.monotonic()
+        if config.DAEMON_MAX_RSS_MB and rss_mb > config.DAEMON_MAX_RSS_MB:
+            _request_shutdown(f"RSS {rss_mb:.1f} MB is above DAEMON_MAX_RSS_MB ({config.DAEMON_MAX_RSS_MB} MB)")
+        _wake_accept_loop()
+
+
+def _status_text():
+    busy = _session_thread is not None and _session_thread.is_alive()
+    return (f"pid={os.getpid()} uptime_s={time.monotonic() - _started_at:.0f} sessions={_sessions_served} "
+            f"busy={'yes' if busy else 'no'} idle_s={0 if busy else time.monotonic() - _idle_since:.0f} "
+            f"rss_mb={read_rss_mb():.1f}")
+
+
+def _handle_connection(conn):
+    global _session_thread
+    conn.settimeout(_COMMAND_TIMEOUT_S)
+    try:
+        command = conn.makefile('rb').readline(64).decode('ascii', 'replace').strip().upper()
+    except OSError:
+        conn.close()
+        return
+    try: # Replies below keep the command timeout, so a stalled client can't block the accept loop
+        if command == "ATTACH":
+            if _session_thread is not None and _session_thread.is_alive():
+                _send_line(conn, "E", "1 another launcher is attached")
+            elif _shutdown_requested.is_set():
+                _send_line(conn, "E", "1 daemon is shutting down")
+            else:
+                conn.settimeout(None) # Session lines go through _client_sender, which may block on it
+                _session_thread = threading.Thread(target=_run_session, args=(conn,), name="DaemonSession")
+                _session_thread.daemon = True
+                _session_thread.start()
+                return # The session thread owns the connection now
+        elif command == "STATUS":
+            _send_line(conn, "E", f"0 {_status_text()}")
+        elif command == "STOP":
+            _send_line(conn, "E", "0 stopping")
+            _request_shutdown("stop requested by launcher")
+        else:
+            _send_line(conn, "E", f"1 unknown command {command!r}")
+    except OSError:
+        pass
+    conn.close()
+
+
+def _bind_socket(path):
+    """Binds the daemon socket. Returns None if another daemon is already listening on it."""
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            return None
+        except OSError:
+            os.unlink(path) # Stale socket left by a daemon that died
+        finally:
+            probe.close()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    os.chmod(path, 0o600)
+    listener.listen(4)
+    return listener
+
+
+def warm_up():
+    """Pays the one-time startup costs so that the first session starts instantly."""
+    if audio_capture_process.ensure_capture_process() and audio_capture_process.warm_audio_device():
+        warmed = audio_capture_process.wait_for_warm_audio_device(config.CAPTURE_PROCESS_STOP_TIMEOUT_S)
+        if warmed and not warmed[1]:
+            log.info(f"Capture process has PyAudio initialized ({warmed[0]:.0f} ms).")
+        else:
+            log.warning("Capture process did not initialize PyAudio; the first recording will.")
+    audio_uploader.warm_connection()
+    if config.GAMEPAD_DEVICE_PATH and os.path.exists(config.GAMEPAD_DEVICE_PATH):
+        _ensure_gamepad() # Interactive detection is left to the first session, where its prompts are visible
+
+
+def serve():
+    listener = _bind_socket(config.DAEMON_SOCKET_PATH)
+    if listener is None:
+        log.error(f"Another daemon is already listening on {config.DAEMON_SOCKET_PATH}.")
+        return 1
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, _on_signal)
+    warm_up() # After binding: a launcher that connects meanwhile waits in the backlog instead of failing
+    log.info(f"Daemon ready on {config.DAEMON_SOCKET_PATH} (pid {os.getpid()}, RSS {read_rss_mb():.1f} MB).")
+    try:
+        while not _shutdown_requested.is_set():
+            if _shutdown_signal is not None:
+                _request_shutdown(f"signal {_shutdown_signal}")
+                break
+            busy = _session_thread is not None and _session_thread.is_alive()
+            timeout = None
+            if not busy and config.DAEMON_MAX_IDLE_S:
+                timeout = config.DAEMON_MAX_IDLE_S - (time.monotonic() - _idle_since)
+                if timeout <= 0:
+                    _request_shutdown(f"idle for more than DAEMON_MAX_IDLE_S ({config.DAEMON_MAX_IDLE_S}s)")
+                    break
+            readable, _, _ = select.select([listener, _wake_read_fd], [], [], timeout)
+            if _wake_read_fd in readable:
+                os.read(_wake_read_fd, 64)
+            if listener in readable:
+                conn, _ = listener.accept()
+                _handle_connection(conn)
+    finally:
+        listener.close()
+        try: os.unlink(config.DAEMON_SOCKET_PATH)
+        except OSError: pass
+        if _session_thread is not None:
+            _session_thread.join(timeout=5)
+        video_manager.stop_current_video()
+        audio_capture_process.shutdown_capture_process()
+        if _gamepad is not None:
+            try: _gamepad.close()
+            except Exception: pass
+        log.info("Daemon has exited.")
+    return 0
+
+
+def run_daemon():
+    parser = argparse.ArgumentParser(description="Keep the talk engine resident for talk_launch.py.")
+    parser.add_argument('--background', action='store_true',
+                        help=f"Write output to DAEMON_LOG_PATH ({config.DAEMON_LOG_PATH}) instead of the terminal")
+    args = parser.parse_args()
+    if args.background:
+        log_fd = os.open(config.DAEMON_LOG_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.dup2(log_fd, sys.stdout.fileno())
+        os.dup2(log_fd, sys.stderr.fileno())
+        os.close(log_fd)
+    if not config.GAMEPAD_BATCH_READ:
+        log.info("Enabling GAMEPAD_BATCH_READ so sessions can end when the launcher goes away.")
+        config.GAMEPAD_BATCH_READ = True
+    if config.AUDIO_CAPTURE_BACKEND != "process":
+        # The resident capture process is what keeps PortAudio initialized between turns and sessions
+        log.info("Using the capture process backend so PyAudio stays initialized between sessions.")
+        config.AUDIO_CAPTURE_BACKEND = "process"
+    log.info("AI Audio Chatter daemon - Initializing...")
+    exit_code = serve()
+    app_logger.stop_logging()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    run_daemon()
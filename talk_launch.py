@@ -0,0 +1,119 @@
+# talk_launch.py
+"""
+Thin launcher used by AI.sh: attaches to the warm talk_daemon.py over its
+Unix socket, shows the session's output and returns when Quit is pressed.
+
+If no daemon is running it starts one in the background and attaches once
+the socket is up; if that fails too it falls back to running main.py
+directly. This module deliberately imports nothing from the application
+(config pulls in PyAudio and evdev), so attaching to a running daemon
+costs little more than the interpreter start.
+
+    python talk_launch.py            # attach (starting the daemon if needed)
+    python talk_launch.py --status   # show the daemon's uptime, sessions and RSS
+    python talk_launch.py --stop     # stop the daemon
+"""
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Same rule as config.DAEMON_SOCKET_PATH: gettempdir() also honours TEMP/TMP and skips unwritable directories
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), "talk_daemon.sock")
+DAEMON_START_TIMEOUT_S = 30 # First start: imports, PortAudio, capture process, TLS handshake
+_CONNECT_RETRY_S = 0.05
+
+
+def connect(socket_path):
+    """Returns a connected socket, or None if no daemon is listening."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return sock
+    except OSError:
+        sock.close()
+        return None
+
+
+def start_daemon(socket_path):
+    """Starts talk_daemon.py in its own session and waits for its socket. Returns a connected socket or None."""
+    import subprocess # Only needed on this slow path
+    print("Starting the talk daemon (first launch takes a few seconds)...", flush=True)
+    daemon = subprocess.Popen([sys.executable, os.path.join(APP_DIR, "talk_daemon.py"), "--background"],
+                              cwd=APP_DIR, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT_S
+    while time.monotonic() < deadline:
+        sock = connect(socket_path)
+        if sock:
+            return sock
+        if daemon.poll() is not None:
+            sock = connect(socket_path) # Lost a start race to another launcher's daemon?
+            if not sock:
+                print(f"The talk daemon exited during startup (status {daemon.returncode}).", flush=True)
+            return sock
+        time.sleep(_CONNECT_RETRY_S)
+    print(f"The talk daemon did not come up within {DAEMON_START_TIMEOUT_S}s.", flush=True)
+    return None
+
+
+def run_command(sock, command, started=None):
+    """Sends one command and prints the daemon's replies. Returns the exit code it reports."""
+    sock.sendall(f"{command}\n".encode('ascii'))
+    with sock.makefile('r', encoding='utf-8', errors='replace') as replies:
+        for line in replies:
+            kind, _, text = line.rstrip('\n').partition(' ')
+            if kind == "L":
+                print(text, flush=True)
+            elif kind == "A" and started is not None:
+                print(f"Attached to the talk daemon (pid {text}) in {(time.perf_counter() - started) * 1000:.0f} ms.", flush=True)
+            elif kind == "E":
+                code, _, message = text.partition(' ')
+                if command != "ATTACH" or code != "0":
+                    print(f"talk daemon: {message}", flush=True)
+                return int(code)
+    print("The talk daemon closed the connection unexpectedly.", flush=True)
+    return 1
+
+
+def run_main_directly():
+    print("Falling back to running main.py directly.", flush=True)
+    os.chdir(APP_DIR)
+    os.execv(sys.executable, [sys.executable, os.path.join(APP_DIR, "main.py")])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attach to the warm talk daemon.")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH)
+    parser.add_argument('--status', action='store_true', help="Show the daemon's status")
+    parser.add_argument('--stop', action='store_true', help="Stop the daemon")
+    parser.add_argument('--no-fallback', action='store_true', help="Don't run main.py if the daemon can't be used")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    sock = connect(args.socket)
+    if args.status or args.stop:
+        if not sock:
+            print("The talk daemon is not running.")
+            return 1
+        return run_command(sock, "STOP" if args.stop else "STATUS")
+
+    if not sock:
+        sock = start_daemon(args.socket)
+    if not sock:
+        if args.no_fallback:
+            return 1
+        run_main_directly()
+    try:
+        return run_command(sock, "ATTACH", started)
+    except KeyboardInterrupt:
+        return 130 # Closing the socket makes the daemon end the session
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
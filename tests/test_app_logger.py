@@ -0,0 +1,80 @@
+# test_app_logger.py
+"""Rate limiting in app_logger's writer: bursts of warnings collapse, INFO lines never do."""
+import io
+import logging
+import threading
+import time
+
+import pytest
+
+import app_logger
+
+
+@pytest.fixture
+def run_writer():
+    """Runs a private _writer_worker on app_logger's queue; returns a function that writes records and the output."""
+    app_logger.stop_logging()
+    yield _run_writer
+    app_logger.start_logging()
+
+
+def _run_writer(steps, window_s=0.3, burst=1):
+    """steps: records to log, or float seconds to sleep. Returns the written lines after the writer stopped."""
+    stream = io.StringIO()
+    writer = threading.Thread(target=app_logger._writer_worker, args=(stream, window_s, burst, 0.05, logging.WARNING))
+    writer.start()
+    for step in steps:
+        if isinstance(step, float):
+            time.sleep(step)
+        else:
+            app_logger._log_queue.put(step)
+    app_logger._log_queue.put(app_logger._STOP_SENTINEL)
+    writer.join(timeout=5)
+    return stream.getvalue().splitlines()
+
+
+def _record(level, msg, name="talk.test"):
+    record = logging.makeLogRecord({'name': name, 'levelno': level, 'levelname': logging.getLevelName(level), 'msg': msg})
+    return app_logger._NonBlockingQueueHandler().prepare(record)
+
+
+def test_repeated_warning_is_written_once_then_summarised(run_writer):
+    lines = run_writer([_record(logging.WARNING, "Input overflowed") for _ in range(5)])
+    assert len(lines) == 2
+    assert lines[0].endswith("talk.test: Input overflowed")
+    assert "(repeated 4 more times in" in lines[1]
+
+
+def test_burst_allows_that_many_lines_per_window(run_writer):
+    lines = run_writer([_record(logging.ERROR, "Upload failed") for _ in range(5)], burst=3)
+    assert len(lines) == 4
+    assert "(repeated 2 more times in" in lines[3]
+
+
+def test_info_lines_are_never_rate_limited(run_writer):
+    lines = run_writer([_record(logging.INFO, "State: IDLE") for _ in range(5)])
+    assert len(lines) == 5
+    assert not any("repeated" in line for line in lines)
+
+
+def test_new_window_summarises_the_old_one_first(run_writer):
+    lines = run_writer([_record(logging.WARNING, "Input overflowed"), _record(logging.WARNING, "Input overflowed"),
+                        0.4, _record(logging.WARNING, "Input overflowed")], window_s=0.3)
+    assert len(lines) == 3
+    assert lines[0].endswith("Input overflowed")
+    assert "(repeated 1 more times in" in lines[1]
+    assert lines[2].endswith("Input overflowed")
+
+
+def test_different_messages_and_loggers_are_limited_separately(run_writer):
+    lines = run_writer([_record(logging.WARNING, "A"), _record(logging.WARNING, "B"),
+                        _record(logging.WARNING, "A", name="talk.other")])
+    assert len(lines) == 3
+
+
+def test_message_is_rendered_when_logged():
+    args = ['before']
+    record = app_logger._NonBlockingQueueHandler().prepare(
+        logging.makeLogRecord({'name': 'talk.test', 'levelno': logging.INFO, 'msg': "value %s", 'args': (args,)}))
+    args[0] = 'after'
+    assert record.getMessage() == "value ['before']"
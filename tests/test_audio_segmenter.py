@@ -0,0 +1,67 @@
+# test_audio_segmenter.py
+"""Cut points for segmented uploads: at pauses, within the min/max segment length."""
+import io
+import wave
+
+import numpy as np
+
+import audio_segmenter
+
+RATE = 8000
+
+
+def _speech_with_pauses(total_s, pauses_at_s, pause_s=0.2):
+    """Loud noise with silent gaps starting at pauses_at_s."""
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-8000, 8000, int(total_s * RATE)).astype(np.int16)
+    for at in pauses_at_s:
+        samples[int(at * RATE):int((at + pause_s) * RATE)] = 0
+    return samples
+
+
+def test_short_recording_is_not_cut():
+    assert audio_segmenter.find_cut_points(_speech_with_pauses(9.5, [3.0]), RATE, 10.0, 4.0) == []
+
+
+def test_cuts_fall_inside_the_pauses():
+    samples = _speech_with_pauses(23.0, [6.0, 14.0])
+    cuts = audio_segmenter.find_cut_points(samples, RATE, 10.0, 4.0)
+    assert len(cuts) == 2
+    for cut in cuts:
+        assert samples[cut] == 0 # Silent: the cut is between words
+    assert 6.0 * RATE <= cuts[0] <= 6.2 * RATE
+    assert 14.0 * RATE <= cuts[1] <= 14.2 * RATE
+
+
+def test_without_pauses_segments_respect_min_and_max():
+    samples = _speech_with_pauses(35.0, [])
+    cuts = audio_segmenter.find_cut_points(samples, RATE, 10.0, 4.0)
+    boundaries = [0] + cuts + [len(samples)]
+    lengths_s = [(end - start) / RATE for start, end in zip(boundaries, boundaries[1:])]
+    assert all(length <= 10.0 for length in lengths_s)
+    assert all(length >= 4.0 for length in lengths_s[:-1])
+
+
+def test_pause_before_the_minimum_is_ignored():
+    samples = _speech_with_pauses(15.0, [1.0, 8.0])
+    cuts = audio_segmenter.find_cut_points(samples, RATE, 10.0, 4.0)
+    assert len(cuts) == 1
+    assert 8.0 * RATE <= cuts[0] <= 8.2 * RATE
+
+
+def test_split_wav_segments_rejoin_to_the_original(tmp_path):
+    samples = _speech_with_pauses(23.0, [6.0, 14.0])
+    path = str(tmp_path / "long.wav")
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(samples.tobytes())
+    segments = audio_segmenter.split_wav_into_segments(path, 10.0, 4.0)
+    assert len(segments) == 3
+    pcm = b''
+    for segment in segments:
+        with wave.open(io.BytesIO(segment), 'rb') as wf:
+            assert wf.getframerate() == RATE
+            pcm += wf.readframes(wf.getnframes())
+    assert pcm == samples.tobytes()
@@ -0,0 +1,103 @@
+# test_circuit_breaker.py
+"""Circuit breaker state machine and adaptive timeout clamping."""
+import pytest
+
+import config
+import circuit_breaker
+
+
+@pytest.fixture(autouse=True)
+def fresh_breaker(monkeypatch):
+    monkeypatch.setattr(config, 'BREAKER_FAILURE_THRESHOLD', 3)
+    monkeypatch.setattr(config, 'UPLOAD_CONNECT_TIMEOUT_S', 5.0)
+    monkeypatch.setattr(config, 'UPLOAD_LATENCY_MIN_SAMPLES', 3)
+    monkeypatch.setattr(config, 'UPLOAD_READ_TIMEOUT_MULTIPLIER', 2.0)
+    monkeypatch.setattr(config, 'UPLOAD_READ_TIMEOUT_MIN_S', 30.0)
+    monkeypatch.setattr(config, 'UPLOAD_READ_TIMEOUT_MAX_S', 90.0)
+    monkeypatch.setattr(circuit_breaker, '_probe_function', None) # No background probe thread
+    circuit_breaker.reset()
+    yield
+    circuit_breaker.reset()
+
+
+def test_opens_after_threshold_consecutive_failures():
+    circuit_breaker.record_failure("timeout")
+    circuit_breaker.record_failure("timeout")
+    assert circuit_breaker.get_state() == circuit_breaker.STATE_CLOSED
+    assert circuit_breaker.allow_request()
+    circuit_breaker.record_failure("timeout")
+    assert circuit_breaker.get_state() == circuit_breaker.STATE_OPEN
+    assert not circuit_breaker.allow_request()
+
+
+def test_success_resets_the_failure_count():
+    circuit_breaker.record_failure("timeout")
+    circuit_breaker.record_failure("timeout")
+    circuit_breaker.record_success(0.5)
+    circuit_breaker.record_failure("timeout")
+    circuit_breaker.record_failure("timeout")
+    assert circuit_breaker.get_state() == circuit_breaker.STATE_CLOSED
+
+
+def _open_then_probe_answered():
+    for _ in range(3):
+        circuit_breaker.record_failure("connection refused")
+    circuit_breaker._half_open()
+    assert circuit_breaker.get_state() == circuit_breaker.STATE_HALF_OPEN
+
+
+def test_half_open_lets_a_single_trial_through():
+    _open_then_probe_answered()
+    assert circuit_breaker.allow_request()
+    assert not circuit_breaker.allow_request() # Others still fail fast while the trial runs
+
+
+def test_successful_trial_closes():
+    _open_then_probe_answered()
+    assert circuit_breaker.allow_request()
+    circuit_breaker.record_success(1.0)
+    assert circuit_breaker.get_state() == circuit_breaker.STATE_CLOSED
+    assert circuit_breaker.allow_request()
+
+
+def test_failed_trial_opens_again():
+    _open_then_probe_answered()
+    assert circuit_breaker.allow_request()
+    circuit_breaker.record_failure("timeout")
+    assert circuit_breaker.get_state() == circuit_breaker.STATE_OPEN
+    assert not circuit_breaker.allow_request()
+
+
+def test_half_open_only_from_open():
+    circuit_breaker._half_open()
+    assert circuit_breaker.get_state() == circuit_breaker.STATE_CLOSED
+
+
+def test_timeouts_use_the_minimum_until_enough_samples():
+    circuit_breaker.record_success(40.0)
+    circuit_breaker.record_success(40.0)
+    assert circuit_breaker.get_timeouts() == (5.0, 30.0)
+
+
+def test_fast_replies_never_pull_the_read_timeout_below_the_minimum():
+    for _ in range(5):
+        circuit_breaker.record_success(0.2)
+    assert circuit_breaker.get_timeouts() == (5.0, 30.0)
+
+
+def test_read_timeout_follows_the_slowest_reply():
+    for latency in (1.0, 20.0, 2.0):
+        circuit_breaker.record_success(latency)
+    assert circuit_breaker.get_timeouts() == (5.0, 40.0)
+
+
+def test_read_timeout_is_capped_at_the_maximum():
+    for latency in (1.0, 80.0, 2.0):
+        circuit_breaker.record_success(latency)
+    assert circuit_breaker.get_timeouts() == (5.0, 90.0)
+
+
+def test_connect_timeout_is_not_derived_from_latency():
+    for latency in (25.0, 25.0, 25.0):
+        circuit_breaker.record_success(latency)
+    assert circuit_breaker.get_timeouts()[0] == 5.0
@@ -0,0 +1,114 @@
+# test_gamepad_input.py
+"""Parsing of packed input_event structs by gamepad_input.iter_key_presses (through a pipe, like a device fd)."""
+import ctypes
+import os
+import struct
+
+import pytest
+from evdev import ecodes
+
+import config
+import gamepad_input
+
+START = ecodes.BTN_SOUTH
+QUIT = ecodes.BTN_START
+
+
+class _PipeDevice:
+    def __init__(self):
+        self.fd, self.write_fd = os.pipe()
+        os.set_blocking(self.fd, False)
+
+    def send(self, events):
+        os.write(self.write_fd, b''.join(struct.pack('llHHi', *event) for event in events))
+
+    def close(self):
+        for fd in (self.fd, self.write_fd):
+            try: os.close(fd)
+            except OSError: pass
+
+
+@pytest.fixture
+def device():
+    device = _PipeDevice()
+    yield device
+    device.close()
+
+
+def _key(code, value, sec=100, usec=0):
+    return (sec, usec, ecodes.EV_KEY, code, value)
+
+
+def _syn(sec=100, usec=0):
+    return (sec, usec, ecodes.EV_SYN, ecodes.SYN_REPORT, 0)
+
+
+def _stick(value, sec=100, usec=0):
+    return (sec, usec, ecodes.EV_ABS, ecodes.ABS_X, value)
+
+
+def test_event_size_is_two_native_longs_plus_type_code_value():
+    assert gamepad_input._EVENT_SIZE == 2 * ctypes.sizeof(ctypes.c_long) + 8
+
+
+def test_only_key_downs_of_the_wanted_buttons_are_yielded(device):
+    device.send([_stick(120), _syn(), _key(START, 1, 1700000000, 250000), _syn(),
+                 _key(START, 0), _syn(), _key(ecodes.BTN_EAST, 1), _syn(), _key(START, 2), _stick(-5), _syn()])
+    presses = gamepad_input.iter_key_presses(device, {START, QUIT}, timeout_fn=lambda: 0)
+    event = next(presses)
+    assert (event.sec, event.usec, event.type, event.code, event.value) == (1700000000, 250000, ecodes.EV_KEY, START, 1)
+    assert next(presses) is None # Nothing else qualifies: the next wait times out
+    presses.close()
+
+
+def test_negative_values_and_codes_are_read_at_the_right_offsets(device):
+    device.send([_stick(-32768), (100, 999999, ecodes.EV_KEY, QUIT, 1)])
+    presses = gamepad_input.iter_key_presses(device, {QUIT}, timeout_fn=lambda: 0)
+    event = next(presses)
+    assert (event.usec, event.code, event.value) == (999999, QUIT, 1)
+    presses.close()
+
+
+def test_pending_events_are_drained_across_batches(device, monkeypatch):
+    monkeypatch.setattr(config, 'GAMEPAD_READ_BATCH_EVENTS', 4)
+    events = []
+    for i in range(10):
+        events += [_stick(i), _syn(), _key(START, 1, usec=i), _syn(), _key(START, 0), _syn()]
+    device.send(events)
+    batches = []
+    presses = gamepad_input.iter_key_presses(device, {START}, timeout_fn=lambda: 0, batch_fn=batches.append)
+    assert [next(presses).usec for _ in range(10)] == list(range(10))
+    assert next(presses) is None
+    assert sum(len(batch) for batch in batches) == 60 * gamepad_input._EVENT_SIZE
+    assert max(len(batch) for batch in batches) == 4 * gamepad_input._EVENT_SIZE
+    presses.close()
+
+
+def test_wake_fd_ends_the_generator(device):
+    wake_read, wake_write = os.pipe()
+    try:
+        os.write(wake_write, b'x')
+        assert list(gamepad_input.iter_key_presses(device, {START}, wake_fd=wake_read)) == []
+    finally:
+        os.close(wake_read)
+        os.close(wake_write)
+
+
+def test_end_of_file_raises_oserror(device):
+    os.close(device.write_fd)
+    with pytest.raises(OSError):
+        next(gamepad_input.iter_key_presses(device, {START}))
+
+
+@pytest.mark.skipif(ctypes.sizeof(ctypes.c_long) == 4, reason="the 32-bit layout is the native one here")
+def test_mismatched_layout_raises_instead_of_misparsing(device):
+    # Two events in a 32-bit layout (int time fields) make one 64-bit sized read with garbage in it
+    os.write(device.write_fd, struct.pack('iiHHi', 100, 5, ecodes.EV_KEY, START, 1) * (gamepad_input._EVENT_SIZE // 4))
+    with pytest.raises(RuntimeError, match="GAMEPAD_BATCH_READ"):
+        next(gamepad_input.iter_key_presses(device, {START}))
+
+
+def test_drain_pending_events_discards_everything(device):
+    device.send([_key(START, 1), _syn()] * 50)
+    assert gamepad_input.drain_pending_events(device) == 100
+    assert next(gamepad_input.iter_key_presses(device, {START}, timeout_fn=lambda: 0)) is None
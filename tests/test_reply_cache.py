@@ -0,0 +1,105 @@
+# test_reply_cache.py
+"""Reply cache: fingerprints match the same phrase spoken differently, and entries honour the TTL."""
+import wave
+
+import numpy as np
+import pytest
+
+import config
+import reply_cache
+
+RATE = 16000
+
+
+def _phrase_wav(path, seed, gain=1.0, noise=0.0, lead_s=0.0):
+    """Tone bursts with pauses; the same seed is the same "phrase"."""
+    rng = np.random.default_rng(seed)
+    pieces = [np.zeros(int(lead_s * RATE))]
+    for _ in range(5):
+        t = np.arange(int(rng.uniform(0.2, 0.4) * RATE)) / RATE
+        pitch = rng.uniform(150, 400)
+        pieces.append(8000 * np.sin(2 * np.pi * pitch * t) + 3000 * np.sin(2 * np.pi * pitch * rng.uniform(3, 8) * t))
+        pieces.append(np.zeros(int(rng.uniform(0.1, 0.2) * RATE)))
+    samples = np.concatenate(pieces) * gain
+    if noise:
+        samples = samples + np.random.default_rng(99).normal(0, noise, len(samples))
+    with wave.open(str(path), 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(np.clip(samples, -32768, 32767).astype(np.int16).tobytes())
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(config, 'REPLY_CACHE_DISK_DIR', None)
+    reply_cache.clear()
+    yield
+    reply_cache.clear()
+
+
+def test_same_phrase_spoken_differently_matches(tmp_path):
+    original, original_s = reply_cache.compute_fingerprint(_phrase_wav(tmp_path / "a.wav", seed=1))
+    again, again_s = reply_cache.compute_fingerprint(_phrase_wav(tmp_path / "b.wav", seed=1, gain=0.5, noise=50, lead_s=0.6))
+    assert abs(original_s - again_s) < 0.1 # Leading silence is trimmed
+    assert reply_cache.fingerprint_distance(original, again) <= config.REPLY_CACHE_MATCH_THRESHOLD
+
+    assert reply_cache.store(original, original_s, b"reply", "audio/mpeg", "max-age=600")
+    assert reply_cache.lookup(again, again_s) == (b"reply", "audio/mpeg")
+
+
+def test_different_phrase_does_not_match(tmp_path):
+    first, first_s = reply_cache.compute_fingerprint(_phrase_wav(tmp_path / "a.wav", seed=1))
+    other, other_s = reply_cache.compute_fingerprint(_phrase_wav(tmp_path / "b.wav", seed=2))
+    assert reply_cache.fingerprint_distance(first, other) > config.REPLY_CACHE_MATCH_THRESHOLD
+    reply_cache.store(first, first_s, b"reply", "audio/mpeg", "max-age=600")
+    assert reply_cache.lookup(other, other_s) is None
+
+
+def test_silence_and_hum_are_not_fingerprinted(tmp_path):
+    silence = tmp_path / "silence.wav"
+    hum = tmp_path / "hum.wav"
+    for path, samples in ((silence, np.zeros(RATE * 2)),
+                          (hum, 8000 * np.sin(2 * np.pi * 220 * np.arange(RATE * 2) / RATE))):
+        with wave.open(str(path), 'wb') as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(RATE)
+            wf.writeframes(samples.astype(np.int16).tobytes())
+    assert reply_cache.compute_fingerprint(str(silence)) is None
+    assert reply_cache.compute_fingerprint(str(hum)) is None
+
+
+def test_entry_expires_after_max_age(tmp_path, monkeypatch):
+    fingerprint, duration_s = reply_cache.compute_fingerprint(_phrase_wav(tmp_path / "a.wav", seed=1))
+    now = [1000.0]
+    monkeypatch.setattr(reply_cache.time, 'time', lambda: now[0])
+    reply_cache.store(fingerprint, duration_s, b"reply", "audio/mpeg", "public, max-age=60")
+    now[0] += 59
+    assert reply_cache.lookup(fingerprint, duration_s) is not None
+    now[0] += 2
+    assert reply_cache.lookup(fingerprint, duration_s) is None
+    assert reply_cache.get_stats()['entries'] == 0
+
+
+@pytest.mark.parametrize("header, ttl", [
+    (None, None),
+    ("", None),
+    ("public", None), # No max-age: not marked cacheable
+    ("max-age=300", 300),
+    ("public, s-maxage=120", 120),
+    ("max-age=600, no-store", None),
+    ("no-cache, max-age=600", None),
+    ("max-age=0", None),
+    ("max-age=abc", None),
+    (f"max-age={10 ** 9}", config.REPLY_CACHE_MAX_TTL_S),
+])
+def test_ttl_from_cache_control(header, ttl):
+    assert reply_cache.ttl_from_cache_control(header) == ttl
+
+
+def test_reply_without_max_age_is_not_stored(tmp_path):
+    fingerprint, duration_s = reply_cache.compute_fingerprint(_phrase_wav(tmp_path / "a.wav", seed=1))
+    assert not reply_cache.store(fingerprint, duration_s, b"reply", "audio/mpeg", None)
+    assert reply_cache.lookup(fingerprint, duration_s) is None
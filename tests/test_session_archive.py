@@ -0,0 +1,67 @@
+# test_session_archive.py
+"""Session archive: footer index, and recovery by scanning when a write was interrupted."""
+import os
+
+import pytest
+
+import session_archive
+
+
+def _append_turns(path, count):
+    for i in range(count):
+        session_archive.append_turn(path, {'turn': i, 'response': {'status': 200}},
+                                    f"wav-{i}".encode() * 10, f"reply-{i}".encode())
+
+
+def test_turns_round_trip_through_the_footer_index(tmp_path):
+    path = str(tmp_path / "s.talkarc")
+    _append_turns(path, 3)
+    index = session_archive.read_index(path)
+    assert len(index) == 3
+    meta, wav, reply = session_archive.read_turn(path, index[1])
+    assert meta['turn'] == 1 and meta['response'] == {'status': 200}
+    assert wav == b"wav-1" * 10
+    assert reply == b"reply-1"
+
+
+def test_missing_footer_is_rebuilt_by_scanning(tmp_path):
+    path = str(tmp_path / "s.talkarc")
+    _append_turns(path, 3)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3) # Footer cut short
+    index = session_archive.read_index(path)
+    assert [session_archive.read_turn(path, entry)[0]['turn'] for entry in index] == [0, 1, 2]
+
+
+def test_partial_record_is_dropped_and_overwritten_by_the_next_append(tmp_path):
+    path = str(tmp_path / "s.talkarc")
+    _append_turns(path, 2)
+    good_end = session_archive.read_index(path)[-1]
+    good_end = good_end[0] + good_end[1]
+    with open(path, 'r+b') as f: # A third record whose write was interrupted, and no index
+        f.truncate(good_end)
+        f.seek(good_end)
+        f.write(session_archive._RECORD_HEADER.pack(1000, 20))
+        f.write(b'{"turn": 2, "wav_le')
+    assert len(session_archive.read_index(path)) == 2
+
+    session_archive.append_turn(path, {'turn': 9}, b"wav", b"reply")
+    index = session_archive.read_index(path)
+    assert [session_archive.read_turn(path, entry)[0]['turn'] for entry in index] == [0, 1, 9]
+    with open(path, 'rb') as f:
+        assert session_archive._read_footer(f) is not None
+
+
+def test_stale_index_after_the_records_is_not_taken_for_a_record(tmp_path):
+    path = str(tmp_path / "s.talkarc")
+    _append_turns(path, 2)
+    with open(path, 'r+b') as f: # Only the footer is lost; the old index JSON is still there
+        f.truncate(os.path.getsize(path) - session_archive._FOOTER.size)
+    assert len(session_archive.read_index(path)) == 2
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"RIFF....WAVE")
+    with pytest.raises(ValueError):
+        session_archive.read_index(str(path))
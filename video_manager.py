@@ -6,8 +6,13 @@ import subprocess
 import os
 import signal 
 import config
+import app_logger
+
+log = app_logger.get_logger(__name__)
 
 current_video_process = None
+current_video_path = None # Path of the video current_video_process is playing
+current_video_paused = False # Stopped with SIGSTOP by pause_current_video()
 
 def start_looping_video(video_path_from_config): # Argument is the full relative path from config
     """
@@ -16,7 +21,7 @@ def start_looping_video(video_path_from_config): # Argument is the full relative
         video_path_from_config (str): The full relative path to the video file
                                       (e.g., "videos/idle.mp4") as defined in config.py.
     """
-    global current_video_process
+    global current_video_process, current_video_path
     stop_current_video() 
 
     # --- FIX 2: Use the passed video_path_from_config directly ---
@@ -30,39 +35,65 @@ def start_looping_video(video_path_from_config): # Argument is the full relative
     # For now, assume AI.sh cds into the correct app directory.
 
     if not os.path.exists(video_path):
-        print(f"Video file not found: {video_path}")
-        print(f"Current working directory: {os.getcwd()}")
-        print(f"Ensure '{config.VIDEO_BASE_PATH}' directory exists in your app root and contains the video.")
+        log.error(f"Video file not found: {video_path}")
+        log.error(f"Current working directory: {os.getcwd()}")
+        log.error(f"Ensure '{config.VIDEO_BASE_PATH}' directory exists in your app root and contains the video.")
         return
 
     command = config.VIDEO_PLAYER_COMMAND_TEMPLATE + [video_path]
     
-    print(f"Starting video: {' '.join(command)}")
+    log.info(f"Starting video: {' '.join(command)}")
     try:
         current_video_process = subprocess.Popen(
             command,
             stdout=subprocess.DEVNULL, 
             stderr=subprocess.PIPE    
         )
-        # print(f"Looping video '{video_path}' started (PID: {current_video_process.pid}).") # Less verbose
+        current_video_path = video_path
+        # log.debug(f"Looping video '{video_path}' started (PID: {current_video_process.pid}).") # Less verbose
     except FileNotFoundError:
         player_name = config.VIDEO_PLAYER_COMMAND_TEMPLATE[0]
-        print(f"ERROR: Video player '{player_name}' not found. Please install it.")
+        log.error(f"Video player '{player_name}' not found. Please install it.")
         current_video_process = None
     except Exception as e:
-        print(f"Error starting video {video_path}: {e}")
+        log.error(f"Error starting video {video_path}: {e}")
         current_video_process = None
 
 def stop_current_video():
     # ... (This function remains the same as the last version you have - no changes needed here) ...
-    global current_video_process
+    global current_video_process, current_video_path, current_video_paused
+    current_video_path = None
     if current_video_process:
-        # print(f"Stopping current video (PID: {current_video_process.pid})...") # Less verbose
+        # log.debug(f"Stopping current video (PID: {current_video_process.pid})...") # Less verbose
         try:
+            if current_video_paused: # A stopped process can't handle SIGTERM until it is continued
+                current_video_process.send_signal(signal.SIGCONT)
             current_video_process.terminate()
             try: current_video_process.wait(timeout=0.5) 
             except subprocess.TimeoutExpired:
                 current_video_process.kill()
                 current_video_process.wait(timeout=0.5)
         except Exception: pass # Ignore errors during stop
-        finally: current_video_process = None
+        finally:
+            current_video_process = None
+            current_video_paused = False
+
+def pause_current_video():
+    """Freezes the player on its current frame (SIGSTOP): no CPU use until resume_current_video()."""
+    global current_video_paused
+    if current_video_process and current_video_process.poll() is None:
+        try:
+            current_video_process.send_signal(signal.SIGSTOP)
+            current_video_paused = True
+            return True
+        except Exception as e:
+            log.warning(f"Could not pause video player: {e}")
+    return False
+
+def resume_current_video():
+    global current_video_paused
+    if current_video_process and current_video_process.poll() is None:
+        try:
+            current_video_process.send_signal(signal.SIGCONT)
+            current_video_paused = False
+        except Exception as e: log.warning(f"Could not resume video player: {e}")